@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the stat collectors: the psutil path against the fast
+procfs readers (FAST_COLLECTOR=true), which keep /proc/stat, /proc/meminfo
+and the temperature sensor open and re-read them with pread, and psutil's
+per-core percentages and I/O counters against the vectorized core sampler
+and the throughput rates.
+Reports the p50/p99 time per call and checks both paths agree.
+
+    python benchmark_collectors.py --calls 5000
+"""
+import argparse
+import sys
+import time
+
+import psutil
+
+# Add src to path for imports
+sys.path.insert(0, './src')
+
+from procfs import (CoreSampler, CpuSampler, FastStats,  # noqa: E402
+                    disk_io_rates, network_rates)
+from system_stats import SystemStats  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+def time_calls(collect, calls):
+    """p50 and p99 microseconds per call"""
+    collect()  # Opens the files and resolves the sensor
+    times = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        collect()
+        times.append((time.perf_counter() - start) * 1e6)
+    times.sort()
+    return percentile(times, 0.50), percentile(times, 0.99)
+
+
+def check(fast, procfs_path):
+    """Differences between what the two paths report, empty when they agree"""
+    problems = []
+    memory, fast_memory = psutil.virtual_memory(), fast.memory()
+    if memory.total != fast_memory.total:
+        problems.append(f"memory total {memory.total} != {fast_memory.total}")
+    # Taken a moment apart, allow for a little churn
+    if abs(memory.percent - fast_memory.percent) > 1:
+        problems.append(f"memory percent {memory.percent} != "
+                        f"{fast_memory.percent}")
+    temperature = SystemStats.get_temperature_stats()
+    fast_temperature = fast.temperature()
+    if abs(temperature - fast_temperature) > 2:
+        problems.append(f"temperature {temperature} != {fast_temperature}")
+    slow_cpu = CpuSampler(procfs_path).read_times()
+    fast_cpu = CpuSampler(procfs_path, keep_open=True).read_times()
+    if fast_cpu[1] < slow_cpu[1]:
+        problems.append(f"cpu jiffies went back {slow_cpu} -> {fast_cpu}")
+    cores = len(CoreSampler(procfs_path).sample().cores)
+    if cores != psutil.cpu_count():
+        problems.append(f"{cores} cores != {psutil.cpu_count()}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stat collector micro-benchmark")
+    parser.add_argument("--calls", type=int, default=2000,
+                        help="calls timed per collector")
+    args = parser.parse_args()
+
+    procfs_path = psutil.PROCFS_PATH
+    fast = FastStats(procfs_path)
+    cases = [
+        ("cpu", lambda: psutil.cpu_percent(None),
+         CpuSampler(procfs_path, keep_open=True).sample),
+        ("cpu cores", lambda: psutil.cpu_percent(percpu=True),
+         CoreSampler(procfs_path, keep_open=True).sample),
+        ("memory", psutil.virtual_memory, fast.memory),
+        ("network", lambda: psutil.net_io_counters(pernic=True),
+         network_rates(procfs_path, keep_open=True).sample),
+        ("disk io", lambda: psutil.disk_io_counters(perdisk=True),
+         disk_io_rates(procfs_path, keep_open=True).sample),
+        ("temperature", SystemStats.get_temperature_stats, fast.temperature),
+    ]
+
+    print(f"{args.calls} calls per collector, procfs at {procfs_path}")
+    print(f"  {'':<12} {'psutil p50':>11} {'p99':>9}  {'fast p50':>9} "
+          f"{'p99':>9}  speedup")
+    for name, slow, quick in cases:
+        slow_p50, slow_p99 = time_calls(slow, args.calls)
+        fast_p50, fast_p99 = time_calls(quick, args.calls)
+        print(f"  {name:<12} {slow_p50:8.1f} us {slow_p99:6.1f} us  "
+              f"{fast_p50:6.1f} us {fast_p99:6.1f} us  "
+              f"{slow_p50 / fast_p50:6.1f}x")
+
+    problems = check(fast, procfs_path)
+    for problem in problems:
+        print(f"MISMATCH {problem}")
+    if problems:
+        sys.exit(1)
+    print("Both paths agree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Headless rendering benchmark for text, visual, grid and history modes across
+every panel geometry we ship compose files for and each font size.
+Reports p50/p99 frame time, allocations and peak RSS, can save the
+results as a JSON baseline and fail when a later run regresses against it.
+
+    python benchmark_rendering.py --save bench_baseline.json
+    python benchmark_rendering.py --compare bench_baseline.json --threshold 25
+
+Each case is timed --repeats times and reports the median of the runs, and
+a case only counts as a regression when its p50 grew by both the threshold
+and --min-delta milliseconds, so --compare can gate a change.
+
+Pass --cold to rebuild the cached base layers and row tiles on every
+frame, which is how every frame was rendered before they were cached.
+"""
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# Add src to path for imports
+sys.path.insert(0, './src')
+
+import rendering  # noqa: E402
+
+# name, native width, height and rotation, as in the docker-compose files
+PANELS = [
+    ("240x240", 240, 240, 180),
+    ("135x240", 135, 240, 90),
+    ("172x320", 172, 320, 90),
+    ("170x320", 170, 320, 270),
+]
+
+# (title, stats) font sizes used by the docker-compose files
+FONT_SIZES = [(16, 14), (20, 18), (22, 20), (24, 22)]
+
+TITLE = "═ SYSTEM MONITOR ═"
+
+# Fewer frames per case leave the p50 of a run too noisy to compare
+MIN_COMPARE_FRAMES = 50
+
+
+def visual_mode_data(frame):
+    """Mock visual mode data with values changing every frame"""
+    cpu = (frame * 7) % 100
+    return [
+        {
+            'icon': '\uf109',
+            'icon_color': 'lightblue',
+            'label': '192.168.88.46',
+            'percentage': 0,
+            'bar_color': 'lightblue',
+            'has_bar': False
+        },
+        {
+            'icon': '\uf4bc',
+            'icon_color': 'yellow',
+            'label': f'{cpu:.1f}%',
+            'percentage': cpu,
+            'bar_color': 'red' if cpu >= 90 else 'orange' if cpu >= 70 else 'yellow',
+            'has_bar': True
+        },
+        {
+            'icon': '\uefc5',
+            'icon_color': 'lightgreen',
+            'label': f'7.6G ({32 + frame % 3}%)',
+            'percentage': 32 + frame % 3,
+            'bar_color': 'lightgreen',
+            'has_bar': True
+        },
+        {
+            'icon': '\uf472',
+            'icon_color': 'lightcyan',
+            'label': '6.6G (83%)',
+            'percentage': 83.3,
+            'bar_color': 'orange',
+            'has_bar': True
+        },
+        {
+            'icon': '\uf2c9',
+            'icon_color': 'cyan',
+            'label': f'{55 + frame % 5:.1f}°C',
+            'percentage': 55 + frame % 5,
+            'bar_color': 'cyan',
+            'has_bar': True
+        },
+    ]
+
+
+def text_mode_data(frame):
+    """Mock text mode data derived from the visual mode data"""
+    return [{
+        'icon': stat_data['icon'],
+        'icon_color': stat_data['icon_color'],
+        'value': stat_data['label'],
+        'value_color': stat_data['bar_color']
+    } for stat_data in visual_mode_data(frame)]
+
+
+def history_mode_data(frame):
+    """Mock history mode data with two minutes of 1 s points per stat"""
+    stats_data = visual_mode_data(frame)
+    points = np.arange(frame, frame + 120)
+    for index, stat_data in enumerate(stats_data):
+        if stat_data['has_bar']:
+            mean = 50 + 40 * np.sin(points / (5 + index))
+            stat_data['history'] = np.stack((mean - 5, mean, mean + 5))
+    return stats_data
+
+
+MODES = [
+    ("text", rendering.render_stats_direct, text_mode_data),
+    ("visual", rendering.render_stats_visual, visual_mode_data),
+    ("grid", rendering.render_stats_grid, visual_mode_data),
+    ("history", rendering.render_stats_history, history_mode_data),
+]
+
+
+def reset_caches():
+    rendering._base_layers.clear()
+    rendering.tile_cache.clear()
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+def peak_rss_kb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(render, get_data, width, height, font_sizes, frames, cold,
+             repeats=1):
+    """Time one mode/panel/font combination, the median of the repeats"""
+    title_font_size, stats_font_size = font_sizes
+    fonts = rendering.load_fonts(title_font_size, stats_font_size)
+    data = [get_data(frame) for frame in range(frames)]
+    reset_caches()
+
+    def render_frame(frame):
+        if cold:
+            reset_caches()
+        render(width, height, TITLE, data[frame], *fonts, stats_font_size,
+               title_font_size)
+
+    runs = []
+    for _ in range(repeats):
+        reset_caches()
+        times = []
+        for frame in range(frames):
+            start = time.perf_counter()
+            render_frame(frame)
+            times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+        runs.append((percentile(times, 0.50), percentile(times, 0.99),
+                     sum(times) / len(times)))
+
+    # Separate pass for allocations, tracing would skew the timings
+    reset_caches()
+    tracemalloc.start()
+    for frame in range(frames):
+        render_frame(frame)
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocations = sum(stat.count for stat in snapshot.statistics("filename"))
+
+    p50, p99, mean = np.median(runs, axis=0)
+    return {
+        'p50_ms': round(float(p50), 4),
+        'p99_ms': round(float(p99), 4),
+        'mean_ms': round(float(mean), 4),
+        'live_allocations': allocations,
+        'traced_peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run_suite(frames, cold, repeats=1):
+    results = {}
+    for panel, native_width, native_height, rotation in PANELS:
+        # Frames are rendered in the rotated orientation
+        if rotation % 180 == 90:
+            width, height = native_height, native_width
+        else:
+            width, height = native_width, native_height
+        for font_sizes in FONT_SIZES:
+            for mode, render, get_data in MODES:
+                name = f"{mode}/{panel}/{font_sizes[0]}-{font_sizes[1]}"
+                result = run_case(render, get_data, width, height,
+                                  font_sizes, frames, cold, repeats)
+                results[name] = result
+                print(f"  {name:<24} p50 {result['p50_ms']:7.3f} ms  "
+                      f"p99 {result['p99_ms']:7.3f} ms  "
+                      f"allocs {result['live_allocations']:6d}  "
+                      f"traced peak {result['traced_peak_kb']:8.1f} KB")
+    return results
+
+
+def compare(results, baseline, threshold, min_delta):
+    """Print regressions against a baseline, returns True if any"""
+    regressed = False
+    for name, result in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        delta = result['p50_ms'] - previous['p50_ms']
+        change = delta / previous['p50_ms']
+        # Sub-millisecond cases swing by large percentages on scheduling alone
+        if change * 100 > threshold and delta > min_delta:
+            regressed = True
+            print(f"REGRESSION {name}: p50 {previous['p50_ms']:.3f} -> "
+                  f"{result['p50_ms']:.3f} ms ({change * 100:+.1f}%)")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Headless rendering benchmark")
+    parser.add_argument("--frames", type=int, default=100,
+                        help="frames rendered per case")
+    parser.add_argument("--cold", action="store_true",
+                        help="rebuild base layers and tiles every frame")
+    parser.add_argument("--save", metavar="JSON",
+                        help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="fail if p50 regresses against this baseline")
+    parser.add_argument("--threshold", type=float, default=25.0,
+                        help="allowed p50 regression in percent")
+    parser.add_argument("--min-delta", type=float, default=0.25,
+                        metavar="MS",
+                        help="p50 growth in ms below which a case never "
+                             "counts as a regression")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="timed runs per case, the median is reported")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        frames = min(args.frames, baseline.get('frames', 0))
+        if frames < MIN_COMPARE_FRAMES:
+            parser.error(f"--compare needs at least {MIN_COMPARE_FRAMES} "
+                         f"frames per case in both runs, got {frames}")
+        if baseline.get('cold', False) != args.cold:
+            parser.error("--cold must match the baseline's")
+
+    print(f"Base layers and tiles: "
+          f"{'rebuilt every frame' if args.cold else 'cached'}, "
+          f"{args.frames} frames per case, median of {args.repeats} runs")
+    results = run_suite(args.frames, args.cold, args.repeats)
+    print(f"Peak RSS: {peak_rss_kb() / 1024:.1f} MB")
+    print(f"Tile cache: {rendering.tile_cache.stats()}")
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'frames': args.frames,
+        'repeats': args.repeats,
+        'cold': args.cold,
+        'peak_rss_kb': peak_rss_kb(),
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved: {args.save}")
+
+    if baseline is not None:
+        if compare(results, baseline, args.threshold, args.min_delta):
+            sys.exit(1)
+        print(f"No p50 regressions beyond {args.threshold:.0f}% and "
+              f"{args.min_delta} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Animated bar transitions.
+When a tick brings new values the bars, and the numbers in their labels, move
+from what is displayed to the new values over a short transition. It is drawn
+as sub-frames which only repaint and send the moving bars, within a CPU
+budget: sub-frames are dropped to stay inside it, and when even the lowest
+rate doesn't fit the bars jump once per tick again for a while.
+"""
+import re
+import time
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+# Seconds the bars jump once per tick after the budget was exceeded
+FALLBACK_SECONDS = 60.0
+# Weight of the previous sub-frame cost in its running average
+COST_SMOOTHING = 0.8
+
+
+def ease(progress):
+    """Smoothstep, starts and ends the movement gently"""
+    return progress * progress * (3 - 2 * progress)
+
+
+def interpolate_label(start, end, progress):
+    """The end label with its numbers part way from the start label's, or
+    the end label when they differ by more than their numbers"""
+    parts = _NUMBER.split(end)
+    if _NUMBER.split(start) != parts:
+        return end
+    pieces = [parts[0]]
+    for begin, target, part in zip(_NUMBER.findall(start),
+                                   _NUMBER.findall(end), parts[1:]):
+        value = float(begin) + (float(target) - float(begin)) * progress
+        # Shown with the end value's decimals
+        pieces.append(f"{value:.{len(target.partition('.')[2])}f}")
+        pieces.append(part)
+    return "".join(pieces)
+
+
+def moving_rows(start, end):
+    """Indexes of the bars which move between two visual snapshots, heatmaps
+    and rows which aren't the same stat don't animate"""
+    if len(start) != len(end):
+        return ()
+    return tuple(index for index, (before, after) in enumerate(zip(start, end))
+                 if after['has_bar'] and before['has_bar'] and
+                 not after.get('cores') and before['icon'] == after['icon']
+                 and (before['percentage'] != after['percentage'] or
+                      before['label'] != after['label']))
+
+
+def interpolate_stats(start, end, rows, progress):
+    """Visual data part way through a transition, the moving rows are
+    flagged 'animating' so their tiles aren't cached"""
+    frame = list(end)
+    eased = ease(progress)
+    for index in rows:
+        before, after = start[index], end[index]
+        row = dict(after)
+        row['percentage'] = (before['percentage'] +
+                             (after['percentage'] - before['percentage']) *
+                             eased)
+        row['label'] = interpolate_label(before['label'], after['label'],
+                                         eased)
+        row['animating'] = True
+        frame[index] = row
+    return frame
+
+
+class Animator:
+    """Runs the transitions of the animated panels within a CPU budget"""
+
+    def __init__(self, fps=30.0, duration=0.5, budget=0.25, min_fps=5.0,
+                 metrics=None):
+        self.period = 1.0 / fps
+        self.duration = duration
+        self.budget = budget  # Share of a CPU core the sub-frames may use
+        self.max_period = 1.0 / min_fps
+        self.metrics = metrics
+        self.cost = 0.0  # Running average CPU seconds of a sub-frame
+        self.suspended_until = 0.0
+        self.held = False  # Held off while the CPU budget stretches the ticks
+        self.displayed = None  # Visual data on the animated panels
+        self.start = None
+        self.end = None
+        self.rows = ()
+        self.started = 0.0
+
+    @property
+    def pending(self):
+        """True while a transition waits to be drawn"""
+        return self.end is not None
+
+    def frame_period(self):
+        """Seconds between sub-frames the budget allows, None when even the
+        lowest rate doesn't fit"""
+        period = max(self.period, self.cost / self.budget)
+        return period if period <= self.max_period else None
+
+    def fps(self):
+        """Sub-frame rate currently allowed, 0 while suspended or held"""
+        if self.held or time.monotonic() < self.suspended_until:
+            return 0.0
+        period = self.frame_period()
+        return 1.0 / period if period else 0.0
+
+    def suspend(self, seconds):
+        """Jump once per tick for at least seconds"""
+        self.suspended_until = max(self.suspended_until,
+                                   time.monotonic() + seconds)
+
+    def begin(self, target):
+        """Start a transition to target, returns the data to draw on the
+        tick: the moving bars still where they are"""
+        displayed, self.displayed = self.displayed, target
+        self.end = None
+        now = time.monotonic()
+        if displayed is None or self.held or now < self.suspended_until:
+            return target
+        if self.suspended_until:
+            # Measured afresh after a fallback
+            self.suspended_until = 0.0
+            self.cost = 0.0
+        rows = moving_rows(displayed, target)
+        if not rows:
+            return target
+        self.start, self.end, self.rows = displayed, target, rows
+        self.started = now
+        return [displayed[index] if index in rows else row
+                for index, row in enumerate(target)]
+
+    def run(self, deadline, render_subframe, render_final):
+        """Draw the pending transition as sub-frames then its final frame,
+        finishing well before deadline (time.monotonic())"""
+        metrics = self.metrics
+        duration = min(self.duration, (deadline - self.started) * 0.8)
+        finish = self.started + duration
+        next_frame = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now >= finish:
+                break
+            period = self.frame_period()
+            if period is None:
+                print(f"Animation over budget ({self.cost * 1000:.1f} ms per "
+                      f"sub-frame), bars jump once per tick for "
+                      f"{FALLBACK_SECONDS:.0f}s")
+                self.suspended_until = now + FALLBACK_SECONDS
+                if metrics is not None:
+                    metrics.inc("animation_fallbacks")
+                break
+
+            cpu = time.thread_time()
+            render_subframe(interpolate_stats(
+                self.start, self.end, self.rows,
+                (now - self.started) / duration))
+            cost = time.thread_time() - cpu
+            self.cost = (COST_SMOOTHING * self.cost +
+                         (1 - COST_SMOOTHING) * cost if self.cost else cost)
+            if metrics is not None:
+                metrics.inc("animation_frames")
+
+            next_frame += period
+            now = time.monotonic()
+            if now > next_frame:
+                # Sub-frames whose slot has passed are dropped
+                dropped = int((now - next_frame) / period) + 1
+                next_frame += dropped * period
+                if metrics is not None:
+                    metrics.inc("animation_frames_dropped", dropped)
+            time.sleep(max(0.0, min(next_frame, finish) - now))
+
+        self.end = None
+        render_final()
@@ -0,0 +1,456 @@
+"""
+Cluster dashboard.
+Agents publish a compact binary snapshot of their stats over UDP or TCP,
+and an aggregator keeps the latest snapshot of every node for the cluster
+display mode. Run a headless agent on nodes without a panel with
+
+    CLUSTER_PUBLISH=aggregator:9200 python src/cluster.py
+
+Settings are read here rather than from display_config, so a headless
+agent never touches the display pins.
+"""
+import os
+import random
+import selectors
+import socket
+import struct
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+# Aggregator address a node publishes its stats to, empty disables
+CLUSTER_PUBLISH = os.getenv('CLUSTER_PUBLISH', '')
+# Address the aggregator (DISPLAY_MODE=cluster) listens on
+CLUSTER_LISTEN = os.getenv('CLUSTER_LISTEN', '0.0.0.0:9200')
+# 'udp' (default) or 'tcp'
+CLUSTER_PROTOCOL = os.getenv('CLUSTER_PROTOCOL', 'udp').lower()
+CLUSTER_NODE_NAME = os.getenv('CLUSTER_NODE_NAME', '') or socket.gethostname()
+# Seconds between snapshots a node publishes, headless or from the monitor
+CLUSTER_INTERVAL = float(os.getenv('CLUSTER_INTERVAL', '1'))
+# Nodes are marked stale after CLUSTER_STALE_AFTER seconds without a
+# snapshot and dropped from the grid after CLUSTER_EXPIRE_AFTER
+CLUSTER_STALE_AFTER = float(os.getenv('CLUSTER_STALE_AFTER', '5'))
+CLUSTER_EXPIRE_AFTER = float(os.getenv('CLUSTER_EXPIRE_AFTER', '300'))
+
+MAGIC = b"SP"
+VERSION = 1
+# magic, version, session, sequence, cpu, memory and disk percent * 100,
+# temperature * 10, followed by the length prefixed name and address
+HEADER = struct.Struct("!2sBHIHHHh")
+UNKNOWN_PERCENT = 0xFFFF
+UNKNOWN_TEMPERATURE = -0x8000
+# TCP frames are prefixed with their length
+FRAME_LENGTH = struct.Struct("!H")
+MAX_PACKET = 512
+
+NodeSnapshot = namedtuple(
+    'NodeSnapshot',
+    ['name', 'session', 'sequence', 'cpu', 'memory', 'disk', 'temperature',
+     'ip'])
+
+# Warning and critical levels, the same as the local stat rows
+THRESHOLDS = {
+    'cpu': (70, 90),
+    'memory': (70, 85),
+    'disk': (80, 90),
+    'temperature': (60, 70),
+}
+COLORS = {
+    'cpu': 'yellow',
+    'memory': 'lightgreen',
+    'disk': 'lightcyan',
+    'temperature': 'cyan',
+}
+
+
+def parse_address(address):
+    """'host:port' -> (host, port)"""
+    host, _, port = address.rpartition(":")
+    return host.strip("[]") or "0.0.0.0", int(port)
+
+
+def _percent(value):
+    if value is None:
+        return UNKNOWN_PERCENT
+    return int(round(min(max(value, 0.0), 100.0) * 100))
+
+
+def _from_percent(value):
+    return None if value == UNKNOWN_PERCENT else value / 100
+
+
+def encode_snapshot(name, session, sequence, values):
+    """Pack a node's values into one packet, about 30 bytes"""
+    temperature = values.get('temperature')
+    temperature = (UNKNOWN_TEMPERATURE if temperature is None else
+                   int(round(min(max(temperature, -3000.0), 3000.0) * 10)))
+    name_bytes = name.encode("utf-8")[:64]
+    ip_bytes = (values.get('ip') or "").encode("utf-8")[:64]
+    return b"".join((
+        HEADER.pack(MAGIC, VERSION, session, sequence,
+                    _percent(values.get('cpu')),
+                    _percent(values.get('memory')),
+                    _percent(values.get('disk')), temperature),
+        bytes((len(name_bytes),)), name_bytes,
+        bytes((len(ip_bytes),)), ip_bytes,
+    ))
+
+
+def decode_snapshot(packet):
+    """Unpack a packet into a NodeSnapshot, ValueError if it isn't one"""
+    if len(packet) < HEADER.size + 2:
+        raise ValueError("short packet")
+    (magic, version, session, sequence, cpu, memory, disk,
+     temperature) = HEADER.unpack_from(packet)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a snapshot")
+    offset = HEADER.size
+    name_length = packet[offset]
+    name = packet[offset + 1:offset + 1 + name_length]
+    offset += 1 + name_length
+    if offset >= len(packet):
+        raise ValueError("truncated packet")
+    ip_length = packet[offset]
+    ip = packet[offset + 1:offset + 1 + ip_length]
+    if not name or len(name) != name_length or len(ip) != ip_length:
+        raise ValueError("truncated packet")
+    return NodeSnapshot(
+        name.decode("utf-8", "replace"), session, sequence,
+        _from_percent(cpu), _from_percent(memory), _from_percent(disk),
+        None if temperature == UNKNOWN_TEMPERATURE else temperature / 10,
+        ip.decode("utf-8", "replace"))
+
+
+def node_values(get):
+    """Values a node publishes, from its stat getters by name"""
+    memory, disk = get("memory"), get("disk")
+    cpu, cores = get("cpu"), get("cpu_cores")
+    if cpu is None and cores is not None:
+        # Only the per-core source is collected
+        cpu = cores.percent
+    return {
+        'cpu': cpu,
+        'memory': memory.percent if memory else None,
+        'disk': (disk.used / disk.total) * 100 if disk and disk.total else None,
+        'temperature': get("temperature"),
+        'ip': get("ip"),
+    }
+
+
+class Agent:
+    """Publishes this node's snapshots to an aggregator"""
+
+    def __init__(self, address, protocol="udp", name=CLUSTER_NODE_NAME):
+        self.address = parse_address(address)
+        self.protocol = protocol
+        self.name = name
+        self.sequence = 0
+        self.sent = 0
+        self._sock = None
+        self._pid = None
+        self._session = 0
+        self._retry_at = 0.0
+        self._failing = False
+        self._thread = None
+        self._stop = threading.Event()
+
+    def publish(self, values):
+        """Send one snapshot, never raises on network errors"""
+        if self._pid != os.getpid():
+            # First snapshot, or the socket belongs to the parent process.
+            # A new session lets the aggregator accept the restarted sequence.
+            self.close()
+            self._pid = os.getpid()
+            self._session = random.getrandbits(16)
+            self.sequence = 0
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        packet = encode_snapshot(self.name, self._session, self.sequence,
+                                 values)
+        try:
+            self._send(packet)
+        except OSError as e:
+            if self.protocol == 'tcp' or not isinstance(
+                    e, ConnectionRefusedError):
+                # Don't hammer a missing aggregator with reconnects, a
+                # refused datagram is just lost and the next one is sent
+                self.close()
+                self._retry_at = time.monotonic() + 5
+            # Log once until publishing works again
+            if not self._failing:
+                print(f"Error publishing to {self.address[0]}:"
+                      f"{self.address[1]}: {e}")
+            self._failing = True
+            return False
+        if self._failing:
+            print(f"Publishing to {self.address[0]}:{self.address[1]}")
+        self._failing = False
+        self.sent += 1
+        return True
+
+    def start(self, values, interval=CLUSTER_INTERVAL, metrics=None):
+        """Publish values() every interval seconds from a background thread,
+        however often the frames tick"""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(values, interval, metrics),
+            name="cluster-agent", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.close()
+
+    def _run(self, values, interval, metrics):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                if metrics is not None:
+                    with metrics.time("cluster", "stage", "publish"):
+                        self.publish(values())
+                else:
+                    self.publish(values())
+            except Exception as e:
+                print(f"Error publishing snapshot: {e}")
+                traceback.print_exc()
+            self._stop.wait(max(0.0, interval -
+                                (time.monotonic() - started)))
+
+    def _send(self, packet):
+        if self._sock is None:
+            if time.monotonic() < self._retry_at:
+                raise OSError("waiting to reconnect")
+            if self.protocol == 'tcp':
+                self._sock = socket.create_connection(self.address, timeout=1)
+            else:
+                # Resolved once, connecting also reports a closed port
+                family, kind, _, _, address = socket.getaddrinfo(
+                    *self.address, type=socket.SOCK_DGRAM)[0]
+                self._sock = socket.socket(family, kind)
+                self._sock.connect(address)
+        if self.protocol == 'tcp':
+            self._sock.sendall(FRAME_LENGTH.pack(len(packet)) + packet)
+        else:
+            self._sock.send(packet)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class Aggregator:
+    """Receives snapshots from agents and keeps the latest per node"""
+
+    def __init__(self, address, protocol="udp",
+                 stale_after=CLUSTER_STALE_AFTER,
+                 expire_after=CLUSTER_EXPIRE_AFTER):
+        self.address = parse_address(address)
+        self.protocol = protocol
+        self.stale_after = stale_after
+        self.expire_after = expire_after
+        self.received = 0
+        self.rejected = 0
+        self._nodes = {}  # name -> (NodeSnapshot, received monotonic)
+        self._lock = threading.Lock()
+        self._selector = None
+        self._listener = None
+        self._buffers = {}  # TCP connection -> unparsed bytes
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Bind and receive in a background thread"""
+        family = socket.AF_INET6 if ":" in self.address[0] else socket.AF_INET
+        kind = socket.SOCK_STREAM if self.protocol == 'tcp' else socket.SOCK_DGRAM
+        self._listener = socket.socket(family, kind)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self._listener.bind(self.address)
+            if self.protocol == 'tcp':
+                self._listener.listen(64)
+        except OSError as e:
+            print(f"Error listening for cluster nodes on "
+                  f"{self.address[0]}:{self.address[1]}: {e}")
+            self._listener.close()
+            return
+        self._listener.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="cluster-aggregator",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._selector is not None:
+            for key in list(self._selector.get_map().values()):
+                key.fileobj.close()
+            self._selector.close()
+            self._selector = None
+        self._buffers.clear()
+
+    def _run(self):
+        while not self._stop.is_set():
+            for key, _ in self._selector.select(timeout=0.5):
+                sock = key.fileobj
+                if sock is not self._listener:
+                    self._read_stream(sock)
+                elif self.protocol == 'tcp':
+                    self._accept()
+                else:
+                    self._read_datagrams()
+
+    def _read_datagrams(self):
+        # Drain everything queued, one wakeup can cover many nodes
+        while True:
+            try:
+                packet = self._listener.recv(MAX_PACKET)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            self._receive(packet)
+
+    def _accept(self):
+        try:
+            connection, _ = self._listener.accept()
+        except OSError:
+            return
+        connection.setblocking(False)
+        self._buffers[connection] = b""
+        self._selector.register(connection, selectors.EVENT_READ)
+
+    def _read_stream(self, connection):
+        try:
+            data = connection.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._close(connection)
+            return
+        buffer = self._buffers[connection] + data
+        while len(buffer) >= FRAME_LENGTH.size:
+            (length,) = FRAME_LENGTH.unpack_from(buffer)
+            if length > MAX_PACKET:
+                # Not an agent, drop the connection
+                self.rejected += 1
+                self._close(connection)
+                return
+            if len(buffer) < FRAME_LENGTH.size + length:
+                break
+            self._receive(buffer[FRAME_LENGTH.size:FRAME_LENGTH.size + length])
+            buffer = buffer[FRAME_LENGTH.size + length:]
+        self._buffers[connection] = buffer
+
+    def _close(self, connection):
+        self._selector.unregister(connection)
+        self._buffers.pop(connection, None)
+        connection.close()
+
+    def _receive(self, packet):
+        try:
+            snapshot = decode_snapshot(packet)
+        except ValueError:
+            self.rejected += 1
+            return
+        with self._lock:
+            previous = self._nodes.get(snapshot.name)
+            # Drop reordered datagrams, a new session is a restarted agent
+            if (previous and previous[0].session == snapshot.session and
+                    previous[0].sequence >= snapshot.sequence):
+                return
+            self._nodes[snapshot.name] = (snapshot, time.monotonic())
+        self.received += 1
+
+    def nodes(self):
+        """(snapshot, age) of every node, by name, expired nodes dropped"""
+        now = time.monotonic()
+        with self._lock:
+            for name in [name for name, (_, received) in self._nodes.items()
+                         if now - received > self.expire_after]:
+                del self._nodes[name]
+            nodes = sorted(self._nodes.values(), key=lambda node: node[0].name)
+        return [(snapshot, now - received) for snapshot, received in nodes]
+
+    def render_data(self):
+        """Cells for render_stats_cluster"""
+        return [_node_cell(snapshot, age, age > self.stale_after)
+                for snapshot, age in self.nodes()]
+
+
+def _level_color(metric, value):
+    warning, critical = THRESHOLDS[metric]
+    return ("red" if value >= critical else
+            "orange" if value >= warning else COLORS[metric])
+
+
+def _node_cell(snapshot, age, stale):
+    bars = []
+    for metric in ('cpu', 'memory', 'disk'):
+        value = getattr(snapshot, metric)
+        bars.append((0, 'white') if value is None else
+                    (value, _level_color(metric, value)))
+    if stale:
+        # Stale nodes show how long they have been silent
+        label, label_color = f"{age:.0f}s", 'red'
+    elif snapshot.temperature is not None:
+        label = f"{snapshot.temperature:.0f}°"
+        label_color = _level_color('temperature', snapshot.temperature)
+    else:
+        label, label_color = "", 'white'
+    return {
+        'name': snapshot.name,
+        'bars': bars,
+        'label': label,
+        'label_color': label_color,
+        'stale': stale,
+    }
+
+
+def run_agent():
+    """Headless agent publishing this node's stats every CLUSTER_INTERVAL"""
+    from system_stats import SystemStats
+
+    if not CLUSTER_PUBLISH:
+        raise SystemExit("Set CLUSTER_PUBLISH to the aggregator's host:port")
+    agent = Agent(CLUSTER_PUBLISH, CLUSTER_PROTOCOL)
+    SystemStats.watch_ip_address()
+    sources = {
+        'ip': SystemStats.get_ip_address,
+        'cpu': SystemStats.get_cpu_stats,
+        'memory': SystemStats.get_memory_stats,
+        'disk': SystemStats.get_disk_stats,
+        'temperature': SystemStats.get_temperature_stats,
+    }
+    print(f"Publishing {agent.name} to {CLUSTER_PUBLISH} over "
+          f"{CLUSTER_PROTOCOL}")
+    while True:
+        started = time.monotonic()
+        values = {}
+        for name, source in sources.items():
+            try:
+                values[name] = source()
+            except Exception as e:
+                print(f"Error collecting {name}: {e}")
+                values[name] = None
+        agent.publish(node_values(values.get))
+        time.sleep(max(0.0, CLUSTER_INTERVAL -
+                       (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    try:
+        run_agent()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,142 @@
+"""
+Background collection of system stats.
+Each stat source runs on its own refresh interval on a small thread pool
+and publishes into a snapshot store that the renderer reads without waiting.
+"""
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SnapshotStore:
+    """Latest value of every metric along with when it was collected"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def publish(self, name, value):
+        with self._lock:
+            self._values[name] = (value, time.monotonic())
+
+    def get(self, name, default=None):
+        # A single dict lookup is atomic, readers never take the lock
+        entry = self._values.get(name)
+        return entry[0] if entry else default
+
+    def age(self, name):
+        """Seconds since the metric was last collected, None if never"""
+        entry = self._values.get(name)
+        return time.monotonic() - entry[1] if entry else None
+
+    def snapshot(self):
+        """Consistent copy of all current values"""
+        with self._lock:
+            return {name: entry[0] for name, entry in self._values.items()}
+
+
+class Collector:
+    """Runs stat sources on per-metric intervals in background threads"""
+
+    def __init__(self, max_workers=2, metrics=None):
+        self.store = SnapshotStore()
+        self.max_workers = max_workers
+        self.metrics = metrics
+        self.interval_scale = 1.0  # Multiplies every source's interval
+        self._sources = {}  # name -> [source, interval, next_due, in_flight]
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def register(self, name, source, interval):
+        """Add a source and return a getter that reads its latest value"""
+        self._sources[name] = [source, interval, 0.0, False]
+        return lambda: self.store.get(name)
+
+    def age(self, name):
+        return self.store.age(name)
+
+    def ages(self):
+        """Age in seconds of every registered metric"""
+        return {name: self.store.age(name) for name in self._sources}
+
+    def set_interval_scale(self, scale):
+        """Collect faster (< 1) or slower (> 1) than the configured intervals"""
+        if scale == self.interval_scale:
+            return
+        self.interval_scale = scale
+        now = time.monotonic()
+        for entry in self._sources.values():
+            entry[2] = min(entry[2], now + entry[1] * scale)
+        self._wake.set()
+
+    def collect_all(self):
+        """Collect every source synchronously"""
+        for name in self._sources:
+            self._collect(name)
+
+    def start(self):
+        """Collect what is missing or stale so the first frame has data, then
+        run in background"""
+        for name, entry in self._sources.items():
+            age = self.store.age(name)
+            # Values collected before a worker was forked are reused
+            if age is None or age >= entry[1]:
+                self._collect(name)
+        now = time.monotonic()
+        for entry in self._sources.values():
+            entry[2] = now + entry[1]
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix="collector")
+        self._thread = threading.Thread(target=self._run,
+                                        name="collector-scheduler",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _collect(self, name):
+        entry = self._sources[name]
+        try:
+            if self.metrics is not None:
+                with self.metrics.time("collect", "metric", name):
+                    value = entry[0]()
+            else:
+                value = entry[0]()
+            self.store.publish(name, value)
+        except Exception as e:
+            # Keep serving the previous value
+            print(f"Error collecting {name}: {e}")
+            traceback.print_exc()
+        finally:
+            entry[3] = False
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            next_due = now + 60
+            for name, entry in self._sources.items():
+                if entry[2] <= now:
+                    # Skip a slow source rather than queueing it twice
+                    if not entry[3]:
+                        entry[3] = True
+                        self._executor.submit(self._collect, name)
+                    interval = entry[1] * self.interval_scale
+                    entry[2] += interval
+                    if entry[2] <= now:
+                        # Fell behind, don't try to catch up missed runs
+                        entry[2] = now + interval
+                next_due = min(next_due, entry[2])
+            self._wake.wait(max(0.0, next_due - time.monotonic()))
+            self._wake.clear()
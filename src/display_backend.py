@@ -0,0 +1,208 @@
+"""
+Display backends.
+'st7789' drives the panel over SPI. 'virtual' emulates an ST7789 in memory,
+accepting the same command and pixel stream, so the collect, render and
+transfer loop can run and be profiled on a normal Linux box.
+"""
+import os
+import struct
+
+import numpy as np
+from PIL import Image
+
+# ST7789 commands the virtual display interprets
+_CASET = 0x2A
+_RASET = 0x2B
+_RAMWR = 0x2C
+
+
+class VirtualST7789:
+    """In-memory ST7789 recording bytes, address windows and transfer time"""
+
+    def __init__(self, width=240, height=320, baudrate=16000000, *,
+                 x_offset=0, y_offset=0, rotation=0, dump_dir=""):
+        self.width = width
+        self.height = height
+        self.rotation = rotation
+        self.baudrate = baudrate
+        self.dump_dir = dump_dir
+        self._X_START = x_offset
+        self._Y_START = y_offset
+        self.ram = np.zeros((height, width), dtype=np.uint16)
+        self._command = None
+        self._window = (0, 0, width - 1, height - 1)
+        self._cursor = 0
+        self.frames = 0
+        self.total_bytes = 0
+        self.total_transfer_time = 0.0
+        self.frame_bytes = 0
+        self.frame_windows = []
+        self.last_frame = {'bytes': 0, 'windows': [], 'transfer_time': 0.0}
+
+    def write(self, command=None, data=None):
+        """Accept a command byte and/or data bytes like DisplaySPI.write"""
+        if command is not None:
+            self._command = command
+            self.frame_bytes += 1
+            if command == _RAMWR:
+                self._cursor = 0
+                self.frame_windows.append(self._window)
+        if data is None:
+            return
+        self.frame_bytes += len(data)
+        if self._command == _CASET:
+            x0, x1 = struct.unpack(">HH", bytes(data))
+            self._window = (x0 - self._X_START, self._window[1],
+                            x1 - self._X_START, self._window[3])
+        elif self._command == _RASET:
+            y0, y1 = struct.unpack(">HH", bytes(data))
+            self._window = (self._window[0], y0 - self._Y_START,
+                            self._window[2], y1 - self._Y_START)
+        elif self._command == _RAMWR:
+            self._write_pixels(np.frombuffer(data, dtype=">u2"))
+
+    def _write_pixels(self, pixels):
+        """Store pixels row by row in the window, continuing from the cursor"""
+        x0, y0, x1, _ = self._window
+        window_width = x1 - x0 + 1
+        offset = 0
+        while offset < len(pixels):
+            row, col = divmod(self._cursor, window_width)
+            count = min(window_width - col, len(pixels) - offset)
+            y, x = y0 + row, x0 + col
+            # Clip to the panel like the controller ignores out of range RAM
+            start, end = max(0, -x), min(count, self.width - x)
+            if 0 <= y < self.height and end > start:
+                self.ram[y, x + start:x + end] = pixels[offset + start:
+                                                        offset + end]
+            offset += count
+            self._cursor += count
+
+    def _block(self, x0, y0, x1, y1, data=None):
+        """Write a block of data, as Display._block does"""
+        self.write(_CASET,
+                   struct.pack(">HH", x0 + self._X_START, x1 + self._X_START))
+        self.write(_RASET,
+                   struct.pack(">HH", y0 + self._Y_START, y1 + self._Y_START))
+        self.write(_RAMWR, data)
+
+    def image(self, img, rotation=None, x=0, y=0):
+        """Set the display to a PIL image, as Display.image does"""
+        if rotation is None:
+            rotation = self.rotation
+        if rotation:
+            img = img.rotate(rotation, expand=True)
+        rgb = np.asarray(img.convert("RGB")).astype(np.uint16)
+        color = (((rgb[..., 0] & 0xF8) << 8) | ((rgb[..., 1] & 0xFC) << 3) |
+                 (rgb[..., 2] >> 3))
+        imwidth, imheight = img.size
+        self._block(x, y, x + imwidth - 1, y + imheight - 1,
+                    color.astype(">u2").tobytes())
+
+    def fill(self, color=0):
+        """Fill the whole display with an RGB565 color"""
+        self._block(0, 0, self.width - 1, self.height - 1,
+                    struct.pack(">H", color) * (self.width * self.height))
+
+    def end_frame(self):
+        """Close the current frame's statistics and dump it if requested"""
+        transfer_time = self.frame_bytes * 8 / self.baudrate
+        self.last_frame = {
+            'bytes': self.frame_bytes,
+            'windows': self.frame_windows,
+            'transfer_time': transfer_time,
+        }
+        self.frames += 1
+        self.total_bytes += self.frame_bytes
+        self.total_transfer_time += transfer_time
+        self.frame_bytes = 0
+        self.frame_windows = []
+        if self.dump_dir:
+            self.save_png(
+                os.path.join(self.dump_dir,
+                             f"frame_{os.getpid()}_{self.frames:06d}.png"))
+
+    def to_image(self):
+        """Panel contents as an RGB image in native orientation"""
+        ram = self.ram
+        rgb = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        rgb[..., 0] = (ram >> 8) & 0xF8
+        rgb[..., 1] = (ram >> 3) & 0xFC
+        rgb[..., 2] = (ram << 3) & 0xF8
+        return Image.fromarray(rgb, "RGB")
+
+    def save_png(self, path):
+        """Dump what the panel would show, in the rendered orientation"""
+        image = self.to_image()
+        if self.rotation:
+            # Undo the rotation the sender applied before the transfer
+            image = image.rotate(-self.rotation, expand=True)
+        image.save(path)
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'total_bytes': self.total_bytes,
+            'total_transfer_time': self.total_transfer_time,
+            'last_frame': self.last_frame,
+        }
+
+
+# Claimed pins by board pin name, panels can share the reset line
+_pins = {}
+
+
+def board_pin(name):
+    """DigitalInOut for a board pin name, None for no pin"""
+    if name is None:
+        return None
+    if name not in _pins:
+        import board
+        import digitalio
+        _pins[name] = digitalio.DigitalInOut(getattr(board, name))
+    return _pins[name]
+
+
+def create_spi(backend):
+    """The hardware SPI bus every panel is driven through, None for the
+    virtual backend"""
+    if backend == 'virtual':
+        return None
+
+    import board
+
+    return board.SPI()
+
+
+def create_display(backend, spi, cs, dc, rst, baudrate, config, dump_dir=""):
+    """Create the display for the configured backend on the bus from
+    create_spi(), pins are board pin names"""
+    if backend == 'virtual':
+        if dump_dir:
+            os.makedirs(dump_dir, exist_ok=True)
+        return VirtualST7789(baudrate=baudrate, dump_dir=dump_dir, **config)
+
+    from adafruit_rgb_display import st7789
+
+    # The panels share the bus, each is selected by its own CS pin
+    return st7789.ST7789(spi,
+                         cs=board_pin(cs),
+                         dc=board_pin(dc),
+                         rst=board_pin(rst),
+                         baudrate=baudrate,
+                         **config)
+
+
+def create_backlight(backend):
+    """Switch the backlight on, None for the virtual backend"""
+    if backend == 'virtual':
+        return None
+
+    import board
+    import digitalio
+
+    # in one instance the display backlight just turned off and won't turn on even with reboot
+    backlight = digitalio.DigitalInOut(board.D22)
+    backlight.switch_to_output()
+    backlight.value = True
+    return backlight
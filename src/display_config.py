@@ -4,19 +4,28 @@ Configuration can be overridden with environment variables.
 """
 
 import os
-import board
-import digitalio
 
 # Screen dimensions - configurable via environment variables
 SCREEN_WIDTH = int(os.getenv('SCREEN_WIDTH', '240'))
 SCREEN_HEIGHT = int(os.getenv('SCREEN_HEIGHT', '240'))
 
+# Display backend - configurable via environment variables
+# Options: 'st7789' (default, SPI hardware) or 'virtual' (in-memory ST7789
+# for running and profiling without a Pi)
+DISPLAY_BACKEND = os.getenv('DISPLAY_BACKEND', 'st7789').lower()
+# Virtual backend only: directory every frame is dumped to as PNG (empty disables)
+VIRTUAL_DUMP_DIR = os.getenv('VIRTUAL_DUMP_DIR', '')
+
 # SPI Configuration
-CS_PIN = digitalio.DigitalInOut(board.CE0)
-DC_PIN = digitalio.DigitalInOut(board.D25)
-RESET_PIN = digitalio.DigitalInOut(board.D24)
+# Board pin names, the pins are only claimed when the display is created
+CS_PIN = 'CE0'
+DC_PIN = 'D25'
+RESET_PIN = 'D24'
 BAUDRATE = 24000000
 
+# Only send the changed regions of each frame - configurable via environment variables
+PARTIAL_UPDATES = os.getenv('PARTIAL_UPDATES', 'true').lower() in ('1', 'true', 'yes')
+
 # Display Configuration - configurable via environment variables
 DISPLAY_CONFIG = {
     "rotation": int(os.getenv('DISPLAY_ROTATION', '180')),
@@ -31,13 +40,154 @@ TITLE_FONT_SIZE = int(os.getenv('TITLE_FONT_SIZE', '20'))
 STATS_FONT_SIZE = int(os.getenv('STATS_FONT_SIZE', '18'))
 
 # Display mode - configurable via environment variables
-# Options: 'text' (default) or 'visual' (progress bars)
+# Options: 'text' (default), 'visual' (progress bars) or 'history' (sparklines)
 DISPLAY_MODE = os.getenv('DISPLAY_MODE', 'text').lower()
 
 # Display layout - configurable via environment variables
 # Options: 'rows' (default) or 'grid' (2-column grid layout)
 DISPLAY_LAYOUT = os.getenv('DISPLAY_LAYOUT', 'rows').lower()
 
+# Multiple panels - configurable via environment variables
+# Panels are separated by ';', each is a comma separated list of key=value
+# settings (name, cs, dc, rst, width, height, rotation, x_offset, y_offset,
+# mode, layout, title_font_size, stats_font_size). Unset keys fall back to
+# the single panel settings above, empty drives one panel on CE0, e.g.
+# DISPLAY_PANELS="cs=CE0,mode=visual,layout=grid;cs=CE1,dc=D23,mode=history"
+DISPLAY_PANELS = os.getenv('DISPLAY_PANELS', '')
+
+
+def _panel_config(spec, reset_pins):
+    """Settings of one DISPLAY_PANELS entry"""
+    values = dict(item.strip().split("=", 1) for item in spec.split(",")
+                  if item.strip())
+    cs = values.get('cs', CS_PIN)
+    rst = values.get('rst', RESET_PIN)
+    # Panels sharing a reset line are reset once, before the first is
+    # initialised, a later reset would undo the earlier panel's init
+    reset_pin = None if rst in reset_pins or rst == 'none' else rst
+    reset_pins.add(rst)
+    return {
+        'name': values.get('name', cs.lower()),
+        'cs': cs,
+        'dc': values.get('dc', DC_PIN),
+        'rst': reset_pin,
+        'display': {
+            "rotation": int(values.get('rotation', DISPLAY_CONFIG['rotation'])),
+            "width": int(values.get('width', DISPLAY_CONFIG['width'])),
+            "height": int(values.get('height', DISPLAY_CONFIG['height'])),
+            "x_offset": int(values.get('x_offset', DISPLAY_CONFIG['x_offset'])),
+            "y_offset": int(values.get('y_offset', DISPLAY_CONFIG['y_offset'])),
+        },
+        'mode': values.get('mode', DISPLAY_MODE).lower(),
+        'layout': values.get('layout', DISPLAY_LAYOUT).lower(),
+        'title_font_size': int(values.get('title_font_size', TITLE_FONT_SIZE)),
+        'stats_font_size': int(values.get('stats_font_size', STATS_FONT_SIZE)),
+    }
+
+
+def _panel_configs():
+    reset_pins = set()
+    specs = [spec for spec in DISPLAY_PANELS.split(";") if spec.strip()]
+    # Without DISPLAY_PANELS this is the single panel set up above
+    return [_panel_config(spec, reset_pins) for spec in specs or [""]]
+
+
+PANELS = _panel_configs()
+
+# Metric history for the sparklines of history mode - configurable via environment variables
+# HISTORY_LEVELS lists seconds per point:points kept for every resolution,
+# HISTORY_RESOLUTION picks the one drawn (seconds per point)
+HISTORY_LEVELS = os.getenv('HISTORY_LEVELS', '1:120,10:120,60:120')
+HISTORY_RESOLUTION = float(os.getenv('HISTORY_RESOLUTION', '1'))
+
+# Screenshot of the rendered frame - configurable via environment variables
+# Modes: 'off' (default), 'change' (when the frame changed),
+# 'interval' (every SCREENSHOT_INTERVAL seconds) or 'always' (every frame).
+# Point SCREENSHOT_PATH at tmpfs (e.g. /dev/shm) to avoid SD card writes.
+SCREENSHOT_MODE = os.getenv('SCREENSHOT_MODE', 'off').lower()
+SCREENSHOT_PATH = os.getenv('SCREENSHOT_PATH', 'screenshot.png')
+SCREENSHOT_INTERVAL = float(os.getenv('SCREENSHOT_INTERVAL', '10'))
+SCREENSHOT_FORMAT = os.getenv('SCREENSHOT_FORMAT', 'png').lower()
+# PNG compression level (0-9) or JPEG/WebP quality (1-100)
+SCREENSHOT_COMPRESSION = int(os.getenv('SCREENSHOT_COMPRESSION', '1'))
+
+# Stat refresh intervals in seconds - configurable via environment variables
+# Stats are collected in the background and the renderer uses the latest values
+IP_REFRESH = float(os.getenv('IP_REFRESH', '1'))
+CPU_REFRESH = float(os.getenv('CPU_REFRESH', '1'))
+MEM_REFRESH = float(os.getenv('MEM_REFRESH', '2'))
+DISK_REFRESH = float(os.getenv('DISK_REFRESH', '10'))
+TEMP_REFRESH = float(os.getenv('TEMP_REFRESH', '5'))
+NET_REFRESH = float(os.getenv('NET_REFRESH', '1'))
+IO_REFRESH = float(os.getenv('IO_REFRESH', '1'))
+COLLECTOR_THREADS = int(os.getenv('COLLECTOR_THREADS', '2'))
+
+# Stat row definitions - configurable via environment variables
+# TOML file with the rows to show, empty uses src/stats.toml
+STATS_CONFIG = os.getenv('STATS_CONFIG', '')
+
+# Frame scheduling - configurable via environment variables
+# Frames tick on wall-clock boundaries of FRAME_INTERVAL seconds and are only
+# rendered and sent when the formatted stats changed. After FRAME_IDLE_AFTER
+# unchanged ticks the interval backs off to FRAME_IDLE_INTERVAL, while any
+# stat is in its warning or critical state it is FRAME_ALERT_INTERVAL and the
+# stats are collected that much faster. An unchanged frame is still redrawn
+# every FRAME_FORCE_INTERVAL seconds.
+FRAME_INTERVAL = float(os.getenv('FRAME_INTERVAL', '1'))
+FRAME_IDLE_INTERVAL = float(os.getenv('FRAME_IDLE_INTERVAL', '5'))
+FRAME_IDLE_AFTER = int(os.getenv('FRAME_IDLE_AFTER', '10'))
+FRAME_ALERT_INTERVAL = float(os.getenv('FRAME_ALERT_INTERVAL', '0.5'))
+FRAME_FORCE_INTERVAL = float(os.getenv('FRAME_FORCE_INTERVAL', '60'))
+
+# Animated bars - configurable via environment variables
+# In visual mode the bars and the numbers of their labels move to each new
+# sample over ANIMATION_DURATION seconds, drawn at up to ANIMATION_FPS
+# sub-frames a second which only repaint and send the moving bars. The
+# sub-frames may use ANIMATION_BUDGET of a CPU core: frames are dropped to stay
+# within it, and when even ANIMATION_MIN_FPS doesn't fit the bars jump once per
+# tick again for a minute.
+ANIMATION = os.getenv('ANIMATION', 'false').lower() in ('1', 'true', 'yes')
+ANIMATION_FPS = float(os.getenv('ANIMATION_FPS', '30'))
+ANIMATION_DURATION = float(os.getenv('ANIMATION_DURATION', '0.5'))
+ANIMATION_BUDGET = float(os.getenv('ANIMATION_BUDGET', '0.25'))
+ANIMATION_MIN_FPS = float(os.getenv('ANIMATION_MIN_FPS', '5'))
+
+# Frame export - configurable via environment variables
+# Every frame shown is published to FRAME_SHM_DIR/<panel>.frame (empty
+# disables), a memory-mapped file other processes can read without copies,
+# and to the live preview served on PREVIEW_ADDRESS:PREVIEW_PORT (0 disables)
+# as MJPEG streams of PREVIEW_QUALITY or PNG on change
+FRAME_SHM_DIR = os.getenv('FRAME_SHM_DIR', '')
+PREVIEW_PORT = int(os.getenv('PREVIEW_PORT', '0'))
+PREVIEW_ADDRESS = os.getenv('PREVIEW_ADDRESS', '127.0.0.1')
+PREVIEW_QUALITY = int(os.getenv('PREVIEW_QUALITY', '80'))
+
+# CPU budget - configurable via environment variables
+# The render worker measures the CPU time it uses, its threads included, and
+# keeps it under CPU_BUDGET of one core (0 disables), e.g. 0.02 for 2%. Over
+# budget the bar animation is switched off first, then the ticks and stat
+# collections are stretched up to CPU_MAX_SLOWDOWN times their intervals.
+# While a temperature row is at or above its warning threshold the budget is
+# multiplied by CPU_THERMAL_FACTOR.
+CPU_BUDGET = float(os.getenv('CPU_BUDGET', '0'))
+CPU_MAX_SLOWDOWN = float(os.getenv('CPU_MAX_SLOWDOWN', '8'))
+CPU_THERMAL_FACTOR = float(os.getenv('CPU_THERMAL_FACTOR', '0.5'))
+
+# Render worker recycling - configurable via environment variables
+# The render loop runs in a long-lived worker process which is replaced after
+# WORKER_MAX_FRAMES frames or once its RSS exceeds WORKER_MAX_RSS_MB (0 disables a limit)
+WORKER_MAX_FRAMES = int(os.getenv('WORKER_MAX_FRAMES', '3600'))
+WORKER_MAX_RSS_MB = int(os.getenv('WORKER_MAX_RSS_MB', '80'))
+
+# Metrics - configurable via environment variables
+# Frame stage, stat row and collector timings plus the monitor's own CPU/RSS in
+# Prometheus format, served on METRICS_ADDRESS:METRICS_PORT (0 disables) and/or
+# written every METRICS_INTERVAL seconds to METRICS_TEXTFILE (empty disables)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_ADDRESS = os.getenv('METRICS_ADDRESS', '127.0.0.1')
+METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE', '')
+METRICS_INTERVAL = float(os.getenv('METRICS_INTERVAL', '15'))
+
 # Common ST7789 configurations (for reference):
 
 # 240x240 Square Display (default)
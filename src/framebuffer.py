@@ -0,0 +1,229 @@
+"""
+Frame transfer to the ST7789 panel.
+Frames are converted to RGB565 with NumPy into buffers that are reused
+between frames, diffed against the last frame sent and only the changed
+regions are written, using the controller's column/row address window.
+"""
+import numpy as np
+
+# Bytes spent on CASET/RASET/RAMWR commands for every address window
+WINDOW_OVERHEAD_BYTES = 11
+
+
+class FrameBuffers:
+    """Preallocated RGB565 buffers for one native panel size"""
+
+    def __init__(self, width, height):
+        self.size = (width, height)
+        self.current = np.empty((height, width), dtype=np.uint16)
+        self.previous = np.empty((height, width), dtype=np.uint16)
+        self.scratch = np.empty((height, width), dtype=np.uint16)
+        self.changed = np.empty((height, width), dtype=bool)
+        # Big-endian staging buffer handed to the SPI write
+        self.transfer = np.empty(width * height, dtype=">u2")
+        self.transfer_bytes = memoryview(self.transfer).cast("B")
+
+    def swap(self):
+        """Make the current frame the reference for the next diff"""
+        self.current, self.previous = self.previous, self.current
+
+
+class FrameSender:
+    """Sends PIL frames to the display, writing only the dirty rectangles"""
+
+    def __init__(self, disp, partial=True, band_height=8, merge_slack=512,
+                 max_rects=8, metrics=None):
+        self.disp = disp
+        self.metrics = metrics
+        self.partial = partial
+        self.band_height = band_height  # Rows per diff band
+        self.merge_slack = merge_slack  # Extra pixels allowed when merging bands
+        self.max_rects = max_rects  # Above this we send a single union box
+        self.buffers = {}  # Native (width, height) -> FrameBuffers
+        self.valid = False
+        self.frames = 0
+        self.bytes_sent = 0
+        self.full_frame_bytes = 0
+        self.last_frame_bytes = 0
+
+    def invalidate(self):
+        """Forget the last frame so the next send is a full refresh"""
+        self.valid = False
+
+    def convert(self, pil_image, regions=None):
+        """Convert a frame to native-orientation RGB565 in a reused buffer.
+
+        With regions, the (left, top, right, bottom) boxes of the image that
+        changed since the last frame sent, only those are converted.
+        """
+        if pil_image.mode != "RGB":
+            pil_image = pil_image.convert("RGB")
+        turns = self.disp.rotation // 90
+        image_width, image_height = pil_image.size
+        if turns % 2:
+            image_width, image_height = image_height, image_width
+
+        buffers = self.buffers.get((image_width, image_height))
+        if buffers is None:
+            buffers = self.buffers[(image_width, image_height)] = FrameBuffers(
+                image_width, image_height)
+            self.valid = False
+
+        if regions is None or not self.valid:
+            # Rotating the array view matches Image.rotate
+            # (counter-clockwise) without resampling the image
+            _rgb565(np.rot90(np.asarray(pil_image), turns), buffers.current,
+                    buffers.scratch)
+            return buffers
+
+        # The rest of the frame is what was sent last
+        np.copyto(buffers.current, buffers.previous)
+        for box in regions:
+            rgb = np.rot90(np.asarray(pil_image.crop(box)), turns)
+            rows, columns = _native_box(box, pil_image.size, turns)
+            height, width = rgb.shape[:2]
+            _rgb565(rgb, buffers.current[rows, columns],
+                    buffers.scratch[:height, :width])
+        return buffers
+
+    def dirty_boxes(self, buffers):
+        """Changed (left, top, right, bottom) boxes versus the last frame"""
+        width, height = buffers.size
+        if not self.partial or not self.valid:
+            return [(0, 0, width, height)]
+
+        changed = buffers.changed
+        np.not_equal(buffers.current, buffers.previous, out=changed)
+        rows = changed.any(axis=1)
+        if not rows.any():
+            return []
+
+        # Bounding box of the changes inside each horizontal band
+        bands = []
+        for top in range(0, height, self.band_height):
+            bottom = min(top + self.band_height, height)
+            band_rows = np.flatnonzero(rows[top:bottom])
+            if band_rows.size == 0:
+                continue
+            cols = np.flatnonzero(changed[top:bottom].any(axis=0))
+            bands.append((int(cols[0]), top + int(band_rows[0]),
+                          int(cols[-1]) + 1, top + int(band_rows[-1]) + 1))
+
+        # Merge vertically adjacent bands while the union stays cheap
+        boxes = []
+        for box in bands:
+            if boxes:
+                prev = boxes[-1]
+                union = (min(prev[0], box[0]), prev[1], max(prev[2], box[2]),
+                         box[3])
+                if (box[1] - prev[3] <= self.band_height and
+                        _area(union) <= _area(prev) + _area(box) +
+                        self.merge_slack):
+                    boxes[-1] = union
+                    continue
+            boxes.append(box)
+
+        if len(boxes) > self.max_rects:
+            return [(min(box[0] for box in boxes), boxes[0][1],
+                     max(box[2] for box in boxes), boxes[-1][3])]
+        return boxes
+
+    def write_box(self, buffers, box):
+        """Pack one box into the transfer buffer and write its window"""
+        left, top, right, bottom = box
+        count = (right - left) * (bottom - top)
+        window = buffers.transfer[:count].reshape(bottom - top, right - left)
+        # Single copy which also swaps to the panel's big-endian byte order
+        np.copyto(window, buffers.current[top:bottom, left:right])
+        # _block sets the column/row address window and streams the pixels
+        self.disp._block(left, top, right - 1, bottom - 1,
+                         buffers.transfer_bytes[:count * 2])
+        return count * 2 + WINDOW_OVERHEAD_BYTES
+
+    def send(self, pil_image, full=False):
+        """Send a frame, returns the number of bytes written"""
+        return self.transmit(*self.prepare(pil_image, full=full))
+
+    def prepare(self, pil_image, full=False, regions=None):
+        """Convert and diff a frame, returns (buffers, boxes) for transmit.
+
+        regions limits the conversion to the parts of the image which were
+        redrawn. The image isn't needed afterwards, so it can be reused for
+        the next panel while the boxes are written.
+        """
+        if full:
+            self.invalidate()
+        metrics = self.metrics
+        if metrics is None:
+            buffers = self.convert(pil_image, regions)
+            return buffers, self.dirty_boxes(buffers)
+        with metrics.time("frame", "stage", "convert"):
+            buffers = self.convert(pil_image, regions)
+        with metrics.time("frame", "stage", "diff"):
+            return buffers, self.dirty_boxes(buffers)
+
+    def transmit(self, buffers, boxes):
+        """Write the dirty boxes of a prepared frame, returns bytes written"""
+        metrics = self.metrics
+        if metrics is None:
+            sent = sum(self.write_box(buffers, box) for box in boxes)
+        else:
+            with metrics.time("frame", "stage", "spi_write"):
+                sent = sum(self.write_box(buffers, box) for box in boxes)
+            metrics.inc("spi_bytes", sent)
+
+        buffers.swap()
+        self.valid = True
+        # Lets the virtual display close its per-frame statistics
+        end_frame = getattr(self.disp, "end_frame", None)
+        if end_frame:
+            end_frame()
+        width, height = buffers.size
+        self.frames += 1
+        self.last_frame_bytes = sent
+        self.bytes_sent += sent
+        self.full_frame_bytes += width * height * 2 + WINDOW_OVERHEAD_BYTES
+        return sent
+
+    def refresh_stats(self):
+        """Refresh byte counters for measuring the partial update savings"""
+        return {
+            'frames': self.frames,
+            'bytes_sent': self.bytes_sent,
+            'full_frame_bytes': self.full_frame_bytes,
+            'last_frame_bytes': self.last_frame_bytes,
+            'ratio': (self.bytes_sent / self.full_frame_bytes
+                      if self.full_frame_bytes else 0.0),
+        }
+
+
+def _rgb565(rgb, color, scratch):
+    """Pack an (h, w, 3) RGB array into the uint16 array color"""
+    np.copyto(color, rgb[..., 0])
+    color &= 0xF8
+    color <<= 8
+    np.copyto(scratch, rgb[..., 1])
+    scratch &= 0xFC
+    scratch <<= 3
+    color |= scratch
+    np.copyto(scratch, rgb[..., 2])
+    scratch >>= 3
+    color |= scratch
+
+
+def _native_box(box, size, turns):
+    """Row and column slices of an image box in the rotated native frame"""
+    left, top, right, bottom = box
+    width, height = size
+    if turns == 1:
+        return slice(width - right, width - left), slice(top, bottom)
+    if turns == 2:
+        return (slice(height - bottom, height - top),
+                slice(width - right, width - left))
+    if turns == 3:
+        return slice(left, right), slice(height - bottom, height - top)
+    return slice(top, bottom), slice(left, right)
+
+
+def _area(box):
+    return (box[2] - box[0]) * (box[3] - box[1])
@@ -0,0 +1,92 @@
+"""
+CPU budget of the render worker.
+The worker measures the CPU time it uses, its collector and server threads
+included, over windows of a few ticks and keeps it under a share of one
+core. Over budget the bar animation is switched off first, then the ticks
+and collections are stretched; under budget they speed up again and the
+animation comes back last. A hot board gets a smaller budget.
+"""
+import time
+
+# Seconds of CPU time averaged before each decision, long enough to include
+# the slower stat collections
+WINDOW = 10.0
+# Usage below this share of the budget speeds the ticks up again ...
+RELAX_BELOW = 0.6
+# ... to use this share of it
+RELAX_TARGET = 0.8
+# Seconds the animation stays off, doubled every time it has to be switched
+# off again
+ANIMATION_HOLD = 60.0
+MAX_ANIMATION_HOLD = 3600.0
+
+
+class CpuGovernor:
+    """Keeps the render worker's CPU time within a budget"""
+
+    def __init__(self, budget=0.02, max_slowdown=8.0, thermal_factor=0.5,
+                 animator=None):
+        self.budget = budget  # Share of one core
+        self.max_slowdown = max_slowdown
+        self.thermal_factor = thermal_factor  # Budget multiplier while hot
+        self.animator = animator
+        self.usage = 0.0  # Share of a core used over the last window
+        self.slowdown = 1.0  # Multiplies the tick and collection intervals
+        self.hot = False
+        self.animation_hold = ANIMATION_HOLD
+        self._cpu = None
+        self._started = None
+
+    def effective_budget(self):
+        """Share of a core the worker may use now"""
+        return self.budget * self.thermal_factor if self.hot else self.budget
+
+    def update(self, hot=False):
+        """Account the CPU used up to this tick, adapting at the end of a
+        window or when the board heats up or cools down"""
+        cpu = time.process_time()
+        now = time.monotonic()
+        if self._cpu is None:
+            self._cpu, self._started = cpu, now
+            return
+        elapsed = now - self._started
+        if elapsed < WINDOW and hot == self.hot:
+            return
+        self.usage = (cpu - self._cpu) / elapsed if elapsed > 0 else 0.0
+        self._cpu, self._started = cpu, now
+        if hot != self.hot:
+            self.hot = hot
+            print(f"CPU budget {'lowered' if hot else 'restored'} to "
+                  f"{self.effective_budget() * 100:.2g}% of a core, the "
+                  f"temperature is {'above' if hot else 'below'} its warning")
+        self.adapt()
+
+    def adapt(self):
+        """Move one step towards the budget for the last window's usage"""
+        budget = self.effective_budget()
+        if self.usage > budget:
+            if self.animator is not None and self.animator.fps() > 0:
+                # Optional, and the most expensive thing the worker draws
+                self.animator.suspend(self.animation_hold)
+                print(f"CPU budget: {self.usage * 100:.2g}% of a core, "
+                      f"animation off for {self.animation_hold:.0f}s")
+                self.animation_hold = min(self.animation_hold * 2,
+                                          MAX_ANIMATION_HOLD)
+            elif self.slowdown < self.max_slowdown:
+                # The cost of a tick is mostly per tick, so the usage falls
+                # about in proportion to the interval
+                self._set_slowdown(self.slowdown * self.usage / budget)
+        elif self.usage < budget * RELAX_BELOW and self.slowdown > 1.0:
+            self._set_slowdown(self.slowdown * self.usage /
+                               (budget * RELAX_TARGET))
+        if self.animator is not None:
+            # The animation only comes back once the ticks are at full speed
+            self.animator.held = self.slowdown > 1.0
+
+    def _set_slowdown(self, slowdown):
+        previous = self.slowdown
+        self.slowdown = min(self.max_slowdown, max(1.0, slowdown))
+        if self.slowdown != previous:
+            print(f"CPU budget: {self.usage * 100:.2g}% of a core against "
+                  f"{self.effective_budget() * 100:.2g}%, intervals "
+                  f"x{self.slowdown:.1f}")
@@ -0,0 +1,137 @@
+"""
+Compact metric history for sparklines.
+Every metric keeps a fixed-size ring of (min, mean, max) points at several
+resolutions, e.g. 1 s, 10 s and 1 min. The rings live in one anonymous
+shared mapping allocated up front, so memory stays constant however long
+the monitor runs and the history survives render worker recycles.
+"""
+import mmap
+
+import numpy as np
+
+# Per-level state stored next to the points, so it is shared as well
+_HEAD, _COUNT, _SLOT, _MIN, _MAX, _SUM, _SAMPLES = range(7)
+_STATE_SIZE = 7
+
+
+def parse_levels(spec):
+    """'1:120,10:120' -> [(1.0, 120), (10.0, 120)] (seconds, points)"""
+    levels = []
+    for part in spec.split(","):
+        resolution, capacity = part.split(":")
+        levels.append((float(resolution), int(capacity)))
+    return sorted(levels)
+
+
+class HistoryLevel:
+    """Ring buffer of (min, mean, max) points at one resolution"""
+
+    def __init__(self, resolution, capacity, points, state):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.points = points  # (3, capacity) view, rows are min, mean, max
+        self.state = state
+        self.points.fill(np.nan)
+        self.state.fill(0)
+        self.state[_SLOT] = -1
+
+    def add(self, timestamp, value):
+        """Accumulate a sample into the point for its time slot"""
+        state = self.state
+        slot = timestamp // self.resolution
+        if slot != state[_SLOT]:
+            if state[_SAMPLES]:
+                self._close()
+                # Slots without samples are kept as gaps
+                missed = int(min(slot - state[_SLOT] - 1, self.capacity))
+                for _ in range(max(missed, 0)):
+                    self._push(np.nan, np.nan, np.nan)
+            state[_SLOT] = slot
+            state[_MIN] = state[_MAX] = value
+            state[_SUM] = 0.0
+            state[_SAMPLES] = 0
+        state[_MIN] = min(state[_MIN], value)
+        state[_MAX] = max(state[_MAX], value)
+        state[_SUM] += value
+        state[_SAMPLES] += 1
+
+    def _close(self):
+        state = self.state
+        self._push(state[_MIN], state[_SUM] / state[_SAMPLES], state[_MAX])
+
+    def _push(self, low, mean, high):
+        state = self.state
+        head = int(state[_HEAD])
+        self.points[:, head] = (low, mean, high)
+        state[_HEAD] = (head + 1) % self.capacity
+        state[_COUNT] = min(state[_COUNT] + 1, self.capacity)
+
+    def series(self):
+        """(3, n) array of points oldest first, including the open point"""
+        state = self.state
+        count, head = int(state[_COUNT]), int(state[_HEAD])
+        order = np.roll(self.points, -head, axis=1)[:, self.capacity - count:]
+        if state[_SAMPLES]:
+            current = np.array([[state[_MIN]], [state[_SUM] / state[_SAMPLES]],
+                                [state[_MAX]]])
+            order = np.concatenate((order, current), axis=1)
+        return order
+
+
+class History:
+    """Multi-resolution history for a fixed set of metrics"""
+
+    def __init__(self, names, levels):
+        self.levels = levels
+        level_size = sum(3 * capacity + _STATE_SIZE for _, capacity in levels)
+        # Anonymous shared memory, inherited by forked render workers
+        self._buffer = mmap.mmap(-1, max(1, len(names) * level_size * 8))
+        values = np.frombuffer(self._buffer, dtype=np.float64)
+
+        self.metrics = {}
+        offset = 0
+        for name in names:
+            metric_levels = []
+            for resolution, capacity in levels:
+                points = values[offset:offset + 3 * capacity].reshape(
+                    3, capacity)
+                offset += 3 * capacity
+                state = values[offset:offset + _STATE_SIZE]
+                offset += _STATE_SIZE
+                metric_levels.append(
+                    HistoryLevel(resolution, capacity, points, state))
+            self.metrics[name] = metric_levels
+
+    @property
+    def nbytes(self):
+        return len(self._buffer)
+
+    def record(self, name, value, timestamp):
+        """Add a sample to every resolution of a metric"""
+        if value is None:
+            return
+        for level in self.metrics[name]:
+            level.add(timestamp, value)
+
+    def series(self, name, resolution):
+        """(3, n) min/mean/max points of the closest resolution"""
+        metric_levels = self.metrics[name]
+        level = min(metric_levels,
+                    key=lambda level: abs(level.resolution - resolution))
+        return level.series()
+
+
+def downsample(series, points):
+    """Reduce a (3, n) series to at most points columns keeping min/mean/max"""
+    count = series.shape[1]
+    if count <= points:
+        return series
+    starts = np.linspace(0, count, points, endpoint=False).astype(np.intp)
+    low = np.fmin.reduceat(series[0], starts)
+    high = np.fmax.reduceat(series[2], starts)
+    valid = ~np.isnan(series[1])
+    sums = np.add.reduceat(np.where(valid, series[1], 0.0), starts)
+    counts = np.add.reduceat(valid, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(counts, sums / np.maximum(counts, 1), np.nan)
+    return np.stack((low, mean, high))
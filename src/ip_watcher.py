@@ -0,0 +1,145 @@
+"""
+Event-driven IP address tracking.
+Addresses are cached and only looked up again when rtnetlink reports an
+address or route change. Without netlink the lookup falls back to reading
+the routing tables under /proc/net on every call.
+"""
+import os
+import socket
+import threading
+
+import psutil
+
+# rtnetlink multicast groups
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+
+FAMILIES = {
+    'ipv4': (socket.AF_INET,),
+    'ipv6': (socket.AF_INET6,),
+    'all': (socket.AF_INET, socket.AF_INET6),
+}
+
+
+class AddressWatcher:
+    """Caches the primary address(es) and refreshes them on netlink events"""
+
+    def __init__(self, procfs_path="/proc", interface="", families="ipv4",
+                 max_addresses=1):
+        self.net_path = os.path.join(procfs_path, "net")
+        self.interface = interface  # Empty to follow the default route
+        self.families = FAMILIES.get(families, FAMILIES['ipv4'])
+        self.max_addresses = max_addresses
+        self.addresses = []
+        # Only processes which set this start the netlink thread, the others
+        # look the addresses up on every call
+        self.watch = False
+        self._pid = None
+        self._netlink = None
+
+    def start(self):
+        """Subscribe to netlink events, safe to call again after a fork"""
+        self._pid = os.getpid()
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                 socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE |
+                       RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE))
+        except OSError as e:
+            print(f"Netlink unavailable ({e}), polling /proc/net for addresses")
+            self._netlink = None
+        else:
+            if self._netlink is not None:
+                self._netlink.close()
+            self._netlink = sock
+            threading.Thread(target=self._watch,
+                             args=(sock,),
+                             name="ip-watcher",
+                             daemon=True).start()
+        self.refresh()
+
+    def current(self):
+        """Cached address string, 'N/A' when there is none"""
+        if self._pid != os.getpid():
+            if self.watch:
+                # First call, or our watcher thread didn't survive a fork
+                self.start()
+            else:
+                # E.g. the supervisor, which mustn't fork with the thread
+                # running and never reads the address again
+                self.refresh()
+        elif self._netlink is None:
+            self.refresh()
+        return " ".join(self.addresses) if self.addresses else "N/A"
+
+    def refresh(self):
+        """Look the addresses up again"""
+        try:
+            self.addresses = self._lookup()
+        except OSError as e:
+            print(f"Error looking up IP address: {e}")
+            self.addresses = []
+
+    def _watch(self, sock):
+        while True:
+            try:
+                sock.recv(65536)
+                # Changes come in bursts, drain them before one refresh
+                sock.settimeout(0.2)
+                try:
+                    while True:
+                        sock.recv(65536)
+                except socket.timeout:
+                    pass
+                sock.settimeout(None)
+            except OSError:
+                # Socket closed by a restart
+                return
+            self.refresh()
+
+    def _lookup(self):
+        if_addrs = psutil.net_if_addrs()
+        interfaces = ([self.interface] if self.interface else
+                      self._default_interfaces() or
+                      [name for name in if_addrs if name != "lo"])
+
+        addresses = []
+        for name in interfaces:
+            for family in self.families:
+                for addr in if_addrs.get(name, []):
+                    if addr.family != family:
+                        continue
+                    address = addr.address.split("%")[0]
+                    if address.startswith("fe80:"):
+                        continue  # Skip link-local IPv6
+                    if address not in addresses:
+                        addresses.append(address)
+            if addresses and not self.interface:
+                break
+        return addresses[:self.max_addresses]
+
+    def _default_interfaces(self):
+        """Interfaces carrying a default route, IPv4 first"""
+        interfaces = []
+        try:
+            with open(os.path.join(self.net_path, "route"), "r") as f:
+                next(f)  # Header
+                for line in f:
+                    fields = line.split()
+                    if fields[1] == "00000000" and fields[7] == "00000000":
+                        interfaces.append(fields[0])
+        except (OSError, StopIteration):
+            pass
+        try:
+            with open(os.path.join(self.net_path, "ipv6_route"), "r") as f:
+                for line in f:
+                    fields = line.split()
+                    if (fields[0] == "0" * 32 and fields[1] == "00" and
+                            fields[9] != "lo"):
+                        interfaces.append(fields[9])
+        except OSError:
+            pass
+        return list(dict.fromkeys(interfaces))
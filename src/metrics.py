@@ -0,0 +1,241 @@
+"""
+Hot-path instrumentation.
+Timing histograms per frame stage, per stat row and per collected metric,
+frame overrun counters and the monitor's own CPU and RSS, exported in the
+Prometheus text format over a local HTTP endpoint or to a textfile for
+node_exporter's textfile collector.
+"""
+import os
+import threading
+import time
+import traceback
+from bisect import bisect_left
+
+PREFIX = "spi_stats"
+
+# Upper bounds in seconds, from sub-millisecond stat reads to a slow frame
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Fixed bucket histogram, cumulated only when exported"""
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class _Timer:
+    """Context manager timing a block into one histogram"""
+
+    __slots__ = ("metrics", "key", "start")
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_exc):
+        self.metrics.observe(*self.key, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Registry of histograms, counters and gauges"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (family, label name, label value) -> Histogram
+        self._histograms = {}
+        self._counters = {}  # name -> value
+        self._gauges = {}  # name -> (help, callable, label)
+        self._help = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def observe(self, family, label, value, seconds):
+        """Record a duration in seconds for one labelled histogram"""
+        key = (family, label, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def time(self, family, label, value):
+        """Context manager timing a block into a histogram"""
+        # A timer per block, stages are timed from several threads
+        return _Timer(self, (family, label, value))
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def gauge(self, name, help_text, read, label=None):
+        """Register a callable sampled every time the metrics are exported,
+        with a label it returns a {label value: number} dict"""
+        self._gauges[name] = (help_text, read, label)
+
+    def reset(self):
+        """Drop every recorded value, gauges stay registered"""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.count, h.sum)
+                          for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        families = sorted({key[0] for key in histograms})
+        for family in families:
+            name = f"{PREFIX}_{family}_seconds"
+            lines.append(f"# HELP {name} {self._help.get(family, family)}")
+            lines.append(f"# TYPE {name} histogram")
+            for (key_family, label, value), (counts, count, total) in sorted(
+                    histograms.items()):
+                if key_family != family:
+                    continue
+                labels = f'{label}="{value}"'
+                cumulative = 0
+                for bound, bucket in zip(BUCKETS, counts):
+                    cumulative += bucket
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} '
+                                 f'{cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {count}")
+
+        for counter, value in sorted(counters.items()):
+            name = f"{PREFIX}_{counter}_total"
+            lines.append(f"# HELP {name} {self._help.get(counter, counter)}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+
+        for gauge, (help_text, read, label) in sorted(self._gauges.items()):
+            try:
+                value = read()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            name = f"{PREFIX}_{gauge}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            if label:
+                for label_value, number in sorted(value.items()):
+                    if number is not None:
+                        lines.append(f'{name}{{{label}="{label_value}"}} '
+                                     f'{number}')
+            else:
+                lines.append(f"{name} {value}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+class MetricsExporter:
+    """Serves the metrics over HTTP and/or writes them to a textfile"""
+
+    def __init__(self, metrics, address="127.0.0.1", port=0, textfile="",
+                 interval=15):
+        self.metrics = metrics
+        self.address = address
+        self.port = port
+        self.textfile = textfile
+        self.interval = interval
+        self._server = None
+        self._threads = []
+        self._stop = threading.Event()
+
+    def start(self):
+        self._stop.clear()
+        if self.port:
+            # Imported here, most setups never serve over HTTP
+            from http.server import ThreadingHTTPServer
+            try:
+                self._server = ThreadingHTTPServer((self.address, self.port),
+                                                   self._handler())
+            except OSError as e:
+                print(f"Error starting metrics endpoint on "
+                      f"{self.address}:{self.port}: {e}")
+            else:
+                self._spawn(self._server.serve_forever, "metrics-http")
+        if self.textfile:
+            self._spawn(self._write_loop, "metrics-textfile")
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.textfile:
+            # Leave the final values behind for the textfile collector
+            self.write_textfile()
+
+    def write_textfile(self):
+        """Write the metrics with an atomic rename, like node_exporter expects"""
+        directory, name = os.path.split(os.path.abspath(self.textfile))
+        tmp_path = os.path.join(directory, f".{name}.tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(self.metrics.render())
+            os.replace(tmp_path, self.textfile)
+        except OSError as e:
+            print(f"Error writing metrics to {self.textfile}: {e}")
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write_textfile()
+            except Exception:
+                traceback.print_exc()
+
+    def _handler(self):
+        from http.server import BaseHTTPRequestHandler
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args):
+                # Scrapes every few seconds would flood the container log
+                pass
+
+        return Handler
@@ -0,0 +1,79 @@
+"""
+Display panels.
+Several panels can be driven from one process. Each has its own mode,
+layout, fonts, frame sender and screenshot sink, and all of them render
+from the same stats snapshot.
+"""
+from PIL import Image
+
+from rendering import (load_fonts, render_stats_cluster, render_stats_direct,
+                       render_stats_grid, render_stats_history,
+                       render_stats_visual)
+
+
+class Panel:
+    """One display with the layout it renders"""
+
+    def __init__(self, name, disp, mode, layout, title_font_size,
+                 stats_font_size, sender, screenshots):
+        self.name = name
+        self.disp = disp
+        self.mode = mode
+        self.layout = layout
+        self.title_font_size = title_font_size
+        self.stats_font_size = stats_font_size
+        self.sender = sender
+        self.screenshots = screenshots
+        # SharedFrame every frame shown is published to, if exported
+        self.shared_frame = None
+        self.title_font, self.stats_font, self.icon_font = load_fonts(
+            title_font_size, stats_font_size)
+        # Frames are rendered in the rotated orientation
+        if disp.rotation % 180 == 90:
+            self.width, self.height = disp.height, disp.width
+        else:
+            self.width, self.height = disp.width, disp.height
+
+    @property
+    def data_kind(self):
+        """'visual' for the modes drawing percentages, 'cluster' for the
+        node grid and 'text' otherwise"""
+        if self.mode == 'cluster':
+            return 'cluster'
+        return 'visual' if self.mode in ('visual', 'history') else 'text'
+
+    @property
+    def animated(self):
+        """Whether the panel draws bars which can be animated"""
+        return self.mode == 'visual'
+
+    def render(self, title_text, stats_data):
+        """Render the stats with the panel's mode and layout"""
+        if self.mode == 'cluster':
+            render = render_stats_cluster
+        elif self.mode == 'history':
+            render = render_stats_history
+        elif self.mode == 'visual':
+            render = (render_stats_grid if self.layout == 'grid' else
+                      render_stats_visual)
+        else:
+            # Text mode has the rows layout only
+            render = render_stats_direct
+        return render(self.width, self.height, title_text, stats_data,
+                      self.title_font, self.stats_font, self.icon_font,
+                      self.stats_font_size, self.title_font_size)
+
+    def render_subframe(self, title_text, stats_data):
+        """Repaint the animating bars of the last frame, returns the frame
+        and the boxes which were redrawn"""
+        render = (render_stats_grid if self.layout == 'grid' else
+                  render_stats_visual)
+        regions = []
+        image = render(self.width, self.height, title_text, stats_data,
+                       self.title_font, self.stats_font, self.icon_font,
+                       self.stats_font_size, self.title_font_size, regions)
+        return image, regions
+
+    def blank_image(self):
+        """A black frame the size of the panel"""
+        return Image.new("RGB", (self.width, self.height), (0, 0, 0))
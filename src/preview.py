@@ -0,0 +1,245 @@
+"""
+Live preview of the panels over HTTP.
+Each panel's shared frame is served as an MJPEG stream, or as a PNG which
+can be long-polled for the next frame. Frames are only encoded while someone
+is watching, and once per frame and format however many viewers there are.
+
+Runs in a process of the monitor's own with PREVIEW_PORT, or on its own
+against the frames the monitor exports to FRAME_SHM_DIR:
+
+    python src/preview.py --port 8080 /dev/shm/spi-stats/*.frame
+"""
+import argparse
+import io
+import os
+import threading
+import traceback
+
+from PIL import Image
+
+from shared_frame import SharedFrame
+
+# Seconds a long-poll or MJPEG stream waits for a frame before checking
+# whether the server is stopping, or answering 304 Not Modified
+WAIT_TIMEOUT = 30.0
+BOUNDARY = "frame"
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>spi-stats preview</title>
+<style>body{{background:#111;color:#ccc;font-family:sans-serif}}
+img{{image-rendering:pixelated;margin:8px;border:1px solid #444}}</style>
+</head><body>
+{panels}
+<p>Streams are MJPEG, <a href="?png">PNG on change</a> is lossless.</p>
+<script>
+if (location.search === "?png") {{
+  document.querySelectorAll("img").forEach(async img => {{
+    let sequence = 0;
+    for (;;) {{
+      try {{
+        const response = await fetch(
+          `/${{img.dataset.panel}}.png?after=${{sequence}}`);
+        if (response.status === 200) {{
+          sequence = response.headers.get("X-Frame-Sequence");
+          const old = img.src;
+          img.src = URL.createObjectURL(await response.blob());
+          if (old.startsWith("blob:")) URL.revokeObjectURL(old);
+        }}
+      }} catch (e) {{
+        await new Promise(resolve => setTimeout(resolve, 1000));
+      }}
+    }}
+  }});
+}}
+</script></body></html>
+"""
+
+
+class FrameEncoder:
+    """Encodes a panel's frames on demand, keeping the latest encoding of
+    each format for the other viewers"""
+
+    def __init__(self, frame, quality=80):
+        self.frame = frame
+        self.quality = quality  # JPEG quality of the MJPEG stream
+        self._lock = threading.Lock()
+        self._encoded = {}  # format -> (sequence, bytes)
+
+    def encode(self, image_format):
+        """(sequence, bytes) of the latest frame"""
+        with self._lock:
+            sequence = self.frame.sequence
+            cached = self._encoded.get(image_format)
+            if cached is not None and cached[0] == sequence:
+                return cached
+            sequence, _, pixels = self.frame.read()
+            data = self._encode(pixels, image_format)
+            cached = self._encoded[image_format] = (sequence, data)
+            return cached
+
+    def _encode(self, pixels, image_format):
+        buffer = io.BytesIO()
+        image = Image.fromarray(pixels, "RGB")
+        if image_format == "jpeg":
+            image.save(buffer, "JPEG", quality=self.quality)
+        else:
+            image.save(buffer, "PNG", compress_level=1)
+        return buffer.getvalue()
+
+
+class PreviewServer:
+    """Serves the shared frames of the panels to any number of viewers"""
+
+    def __init__(self, frames, address="127.0.0.1", port=0, quality=80):
+        # Panel name -> encoder of its shared frame
+        self.encoders = {name: FrameEncoder(frame, quality)
+                         for name, frame in frames.items()}
+        self.address = address
+        self.port = port
+        self._server = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if not self.port:
+            return
+        self._stop.clear()
+        # Imported here, most setups never serve a preview
+        from http.server import ThreadingHTTPServer
+        try:
+            self._server = ThreadingHTTPServer((self.address, self.port),
+                                               self._handler())
+        except OSError as e:
+            print(f"Error starting preview on {self.address}:{self.port}: {e}")
+            return
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="preview-http", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Ends the MJPEG streams at their next frame or timeout
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _handler(self):
+        from http.server import BaseHTTPRequestHandler
+        from urllib.parse import parse_qs, urlsplit
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                name, _, kind = url.path.lstrip("/").rpartition(".")
+                if url.path == "/":
+                    self.send_page()
+                elif name in server.encoders and kind == "png":
+                    after = parse_qs(url.query).get("after", ["-1"])[0]
+                    try:
+                        after = int(after)
+                    except ValueError:
+                        self.send_error(400, "after must be a frame sequence")
+                        return
+                    self.send_png(server.encoders[name], after)
+                elif name in server.encoders and kind == "mjpg":
+                    self.send_mjpeg(server.encoders[name])
+                else:
+                    self.send_error(404)
+
+            def send_page(self):
+                panels = "\n".join(
+                    f'<img src="/{name}.mjpg" data-panel="{name}" '
+                    f'alt="{name}">' for name in server.encoders)
+                self.send_body(PAGE.format(panels=panels).encode("utf-8"),
+                               "text/html; charset=utf-8")
+
+            def send_png(self, encoder, after):
+                """The latest frame, or the next one after a sequence"""
+                if after >= 0 and not encoder.frame.wait(after, WAIT_TIMEOUT):
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                try:
+                    sequence, data = encoder.encode("png")
+                except TimeoutError as e:
+                    self.send_error(503, str(e))
+                    return
+                self.send_body(data, "image/png", sequence)
+
+            def send_mjpeg(self, encoder):
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; "
+                                 f"boundary={BOUNDARY}")
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                sequence = -1
+                try:
+                    while not server._stop.is_set():
+                        if not encoder.frame.wait(sequence, WAIT_TIMEOUT):
+                            continue
+                        try:
+                            sequence, data = encoder.encode("jpeg")
+                        except TimeoutError:
+                            # The next frame repairs it
+                            continue
+                        self.wfile.write(
+                            f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                            f"Content-Length: {len(data)}\r\n\r\n".encode())
+                        self.wfile.write(data)
+                        self.wfile.write(b"\r\n")
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def send_body(self, body, content_type, sequence=None):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                if sequence is not None:
+                    self.send_header("X-Frame-Sequence", str(sequence))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args):
+                # Long-polls would flood the container log
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Preview the frames exported to FRAME_SHM_DIR")
+    parser.add_argument("frames", nargs="+", help="exported .frame files")
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--quality", type=int, default=80,
+                        help="JPEG quality of the MJPEG streams")
+    args = parser.parse_args()
+
+    frames = {os.path.splitext(os.path.basename(path))[0]:
+              SharedFrame.open(path) for path in args.frames}
+    server = PreviewServer(frames, args.address, args.port, args.quality)
+    server.start()
+    print(f"Preview on http://{args.address}:{args.port}/")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
+        raise SystemExit(1)
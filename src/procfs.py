@@ -0,0 +1,407 @@
+"""
+Lightweight readers for procfs counters.
+Counters are read directly from the files under PROCFS_PATH and turned
+into rates from the delta since the previous read, so nothing here sleeps.
+The fast readers keep their files open and re-read them with pread into a
+reusable buffer, parsing only the fields that are shown.
+"""
+import glob
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# psutil.virtual_memory() fields the monitor uses
+MemoryStats = namedtuple("MemoryStats",
+                         "total available percent used free buffers cached")
+
+# Aggregate and busiest core percentages, and every core's rounded to an int
+CpuCores = namedtuple("CpuCores", "percent busiest cores")
+
+# Summed byte rates per second of the selected interfaces or disks, and
+# the recent peak of their total to scale a bar by
+NetRates = namedtuple("NetRates", "rx tx total peak")
+DiskRates = namedtuple("DiskRates", "read write total peak")
+
+# hwmon sensors tried in order, like SystemStats.get_temperature_stats
+TEMPERATURE_SENSORS = ("cpu_thermal", "coretemp")
+# Seconds before a sensor that can't be read is looked up again
+SENSOR_RETRY = 60.0
+# Fraction of the rate peak kept per sample, and the lowest peak in bytes/s
+# so an idle link doesn't show a full bar
+PEAK_DECAY = 0.99
+PEAK_FLOOR = 64 * 1024
+# Sectors in /proc/diskstats are 512 bytes whatever the device's own size
+SECTOR_SIZE = 512
+
+
+class ProcFile:
+    """A procfs or sysfs file kept open and re-read from the start.
+
+    pread doesn't move a shared file offset, so the descriptor keeps working
+    in a forked render worker and from any collector thread.
+    """
+
+    def __init__(self, path, size=4096):
+        self.path = path
+        self.buffer = bytearray(size)
+        self._fd = None
+
+    def read(self):
+        """Read the whole file into buffer, returns the length read"""
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+        while True:
+            length = os.preadv(self._fd, [self.buffer], 0)
+            if length < len(self.buffer):
+                return length
+            # May have been cut short, read again into a larger buffer
+            self.buffer = bytearray(len(self.buffer) * 2)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class CpuSampler:
+    """CPU utilisation from /proc/stat deltas between successive samples"""
+
+    def __init__(self, procfs_path="/proc", smoothing=0.0, keep_open=False):
+        self.path = os.path.join(procfs_path, "stat")
+        self.smoothing = smoothing  # EWMA weight kept from the previous value
+        self.last_busy = None
+        self.last_total = None
+        self.value = None
+        self._file = ProcFile(self.path) if keep_open else None
+
+    def read_times(self):
+        """Busy and total jiffies from the aggregate cpu line"""
+        if self._file is not None:
+            length = self._file.read()
+            buffer = self._file.buffer
+            # Only the first line, the per-core lines follow it
+            fields = buffer[:buffer.find(b"\n", 0, length)].split()
+        else:
+            with open(self.path, "r") as f:
+                fields = f.readline().split()
+        # user nice system idle iowait irq softirq steal (guest is in user)
+        times = [int(field) for field in fields[1:9]]
+        idle = times[3] + times[4]
+        total = sum(times)
+        return total - idle, total
+
+    def sample(self):
+        """CPU percentage since the previous sample (since boot on the first)"""
+        busy, total = self.read_times()
+        if self.last_total is None:
+            delta_busy, delta_total = busy, total
+        else:
+            delta_busy = busy - self.last_busy
+            delta_total = total - self.last_total
+        self.last_busy, self.last_total = busy, total
+
+        if delta_total <= 0:
+            # Called again within the same jiffy, keep the last reading
+            return self.value if self.value is not None else 0.0
+        percent = 100.0 * delta_busy / delta_total
+
+        if self.value is not None and self.smoothing:
+            percent = (self.smoothing * self.value +
+                       (1 - self.smoothing) * percent)
+        self.value = percent
+        return percent
+
+
+class CoreSampler:
+    """Per-core CPU utilisation from /proc/stat deltas, every core in one
+    vectorized pass"""
+
+    def __init__(self, procfs_path="/proc", keep_open=False):
+        self.path = os.path.join(procfs_path, "stat")
+        self.last_busy = None
+        self.last_total = None
+        self.value = None
+        # Room for the per-core lines of a 64 core box
+        self._file = ProcFile(self.path, size=16384) if keep_open else None
+
+    def read_times(self):
+        """Busy and total jiffies of every core as two arrays"""
+        if self._file is not None:
+            length = self._file.read()
+            data = bytes(self._file.buffer[:length])
+        else:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        # The per-core lines follow the aggregate cpu line
+        counters = [line.split(b" ", 1)[1] for line in data.split(b"\n")[1:]
+                    if line.startswith(b"cpu")]
+        # Parsed in one call, one row per core of
+        # user nice system idle iowait irq softirq steal (guest is in user)
+        times = np.fromstring(b" ".join(counters), dtype=np.int64,
+                              sep=" ").reshape(len(counters), -1)[:, :8]
+        total = times.sum(axis=1)
+        return total - times[:, 3] - times[:, 4], total
+
+    def sample(self):
+        """Core percentages since the previous sample (since boot on the
+        first, or after a core went on or offline)"""
+        busy, total = self.read_times()
+        if self.last_total is None or len(total) != len(self.last_total):
+            delta_busy, delta_total = busy, total
+            previous = np.zeros(len(total))
+        else:
+            delta_busy = busy - self.last_busy
+            delta_total = total - self.last_total
+            previous = self.value
+        self.last_busy, self.last_total = busy, total
+
+        # Cores without a tick since the last sample keep their reading
+        cores = np.where(delta_total > 0,
+                         100.0 * delta_busy / np.maximum(delta_total, 1),
+                         previous)
+        self.value = cores
+        elapsed = delta_total.sum()
+        percent = (100.0 * delta_busy.sum() / elapsed if elapsed > 0 else
+                   float(cores.mean()))
+        return CpuCores(float(percent), float(cores.max()),
+                        tuple(np.rint(cores).astype(int).tolist()))
+
+
+class CounterRates:
+    """Per-second rates of the kernel's cumulative counters, e.g. bytes
+    received per interface, from the deltas between successive snapshots"""
+
+    def __init__(self, smoothing=0.0):
+        self.smoothing = smoothing  # EWMA weight kept from the previous rate
+        self.last = {}  # key -> counters of the previous snapshot
+        self.last_time = None
+        self.rates = {}  # key -> rates
+
+    def update(self, counters, now=None):
+        """Rates of every key since the previous snapshot, zero for keys
+        seen for the first time. Keys which are gone are dropped"""
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.last_time if self.last_time is not None else 0.0
+        rates = {}  # Only measured rates, smoothed from the next snapshot
+        result = {}
+        for key, values in counters.items():
+            previous = self.last.get(key)
+            if previous is None or elapsed <= 0:
+                if key in self.rates:
+                    rates[key] = self.rates[key]
+                result[key] = rates.get(key, (0.0,) * len(values))
+                continue
+            current = []
+            for value, last in zip(values, previous):
+                delta = value - last
+                if delta < 0:
+                    # 32-bit counters (32-bit kernels) wrap near the top of
+                    # their range, any other drop is a reset, e.g. the device
+                    # was re-created
+                    delta = (delta + (1 << 32) if 1 << 31 <= last < 1 << 32
+                             else 0)
+                current.append(max(delta, 0) / elapsed)
+            old = self.rates.get(key)
+            if old is not None and self.smoothing:
+                current = [self.smoothing * o + (1 - self.smoothing) * c
+                           for o, c in zip(old, current)]
+            rates[key] = result[key] = tuple(current)
+        self.last, self.last_time, self.rates = counters, now, rates
+        return result
+
+
+def parse_net_dev(data, selected):
+    """Received and transmitted bytes of the selected interfaces"""
+    counters = {}
+    # Two header lines, then 'name: rx_bytes (7 more) tx_bytes ...'
+    for line in data.split(b"\n")[2:]:
+        name, _, fields = line.partition(b":")
+        name = name.strip().decode()
+        if name and selected(name):
+            fields = fields.split()
+            counters[name] = (int(fields[0]), int(fields[8]))
+    return counters
+
+
+def parse_diskstats(data, selected):
+    """Read and written sectors of the selected disks, raw like the kernel's
+    counters so that a wrap is detected before they are scaled to bytes"""
+    counters = {}
+    # 'major minor name reads merged sectors_read ms writes merged
+    # sectors_written ...'
+    for line in data.split(b"\n"):
+        fields = line.split()
+        if len(fields) > 9:
+            name = fields[2].decode()
+            if selected(name):
+                counters[name] = (int(fields[5]), int(fields[9]))
+    return counters
+
+
+class DeviceRates:
+    """Summed rates of the selected devices of a procfs counters file.
+
+    The file is snapshot once per sample, only the lines of selected devices
+    are parsed and whether a device is selected is worked out once per name,
+    so dozens of container veths cost little.
+    """
+
+    def __init__(self, path, parse, is_physical, record, devices="",
+                 smoothing=0.0, keep_open=False, unit=1):
+        self.path = path
+        self.parse = parse
+        self.is_physical = is_physical
+        self.record = record
+        self.unit = unit  # Bytes per counter step
+        # Comma separated names, empty selects the physical devices
+        self.devices = {name.strip() for name in devices.split(",")
+                        if name.strip()}
+        self.engine = CounterRates(smoothing)
+        self.peak = 0.0
+        self._selected = {}  # name -> selected, of the names in the last sample
+        self._previous = {}
+        self._file = ProcFile(path, size=16384) if keep_open else None
+
+    def read(self):
+        if self._file is not None:
+            length = self._file.read()
+            return bytes(self._file.buffer[:length])
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def selected(self, name):
+        """Whether the device is counted, cached per name"""
+        selected = self._selected.get(name)
+        if selected is None:
+            selected = self._previous.get(name)
+            if selected is None:
+                selected = (name in self.devices if self.devices else
+                            self.is_physical(name))
+            self._selected[name] = selected
+        return selected
+
+    def sample(self):
+        """Rates summed over the selected devices since the previous sample"""
+        # Only the names of this sample are kept, churning veths mustn't
+        # pile up
+        self._previous, self._selected = self._selected, {}
+        rates = self.engine.update(self.parse(self.read(), self.selected))
+        first = sum(rate[0] for rate in rates.values()) * self.unit
+        second = sum(rate[1] for rate in rates.values()) * self.unit
+        total = first + second
+        self.peak = max(total, self.peak * PEAK_DECAY, PEAK_FLOOR)
+        return self.record(first, second, total, self.peak)
+
+
+def network_rates(procfs_path="/proc", sysfs_path="/sys", interfaces="",
+                  smoothing=0.0, keep_open=False):
+    """Bytes per second received and sent, by default over the interfaces
+    backed by a device, unlike lo, bridges, veths and tunnels"""
+    def is_physical(name):
+        return os.path.exists(os.path.join(sysfs_path, "class", "net", name,
+                                           "device"))
+
+    return DeviceRates(os.path.join(procfs_path, "net", "dev"), parse_net_dev,
+                       is_physical, NetRates, interfaces, smoothing,
+                       keep_open)
+
+
+def disk_io_rates(procfs_path="/proc", sysfs_path="/sys", disks="",
+                  smoothing=0.0, keep_open=False):
+    """Bytes per second read and written, by default over the whole disks
+    backed by a device: partitions would count twice and loop, ram and zram
+    devices aren't storage"""
+    def is_physical(name):
+        return os.path.exists(os.path.join(sysfs_path, "block", name,
+                                           "device"))
+
+    return DeviceRates(os.path.join(procfs_path, "diskstats"),
+                       parse_diskstats, is_physical, DiskRates, disks,
+                       smoothing, keep_open, SECTOR_SIZE)
+
+
+def _meminfo_field(buffer, length, key, default=None):
+    """Bytes of one /proc/meminfo field, keys start with a newline"""
+    start = buffer.find(key, 0, length)
+    if start < 0:
+        if default is None:
+            raise ValueError(f"{key.strip().decode()} missing from meminfo")
+        return default
+    start += len(key)
+    return int(buffer[start:buffer.find(b"kB", start, length)]) * 1024
+
+
+def find_temperature_sensor(sysfs_path="/sys"):
+    """Path of the CPU temperature input, resolved the way psutil names its
+    sensors, falling back to the first thermal zone"""
+    hwmon = os.path.join(sysfs_path, "class", "hwmon")
+    inputs = glob.glob(os.path.join(hwmon, "hwmon*", "temp*_input"))
+    inputs += glob.glob(os.path.join(hwmon, "hwmon*", "device",
+                                     "temp*_input"))
+    inputs += glob.glob(os.path.join(sysfs_path, "devices", "platform",
+                                     "coretemp.*", "hwmon", "hwmon*",
+                                     "temp*_input"))
+    sensors = {}
+    # psutil orders the inputs by name and shows the first of each sensor
+    for path in sorted(inputs, key=lambda path: path.rsplit("_", 1)[0]):
+        try:
+            with open(os.path.join(os.path.dirname(path), "name")) as f:
+                name = f.read().strip()
+        except OSError:
+            continue
+        sensors.setdefault(name, path)
+    for name in TEMPERATURE_SENSORS:
+        if name in sensors:
+            return sensors[name]
+    return os.path.join(sysfs_path, "class", "thermal", "thermal_zone0",
+                        "temp")
+
+
+class FastStats:
+    """Memory and CPU temperature read through files kept open"""
+
+    def __init__(self, procfs_path="/proc", sysfs_path="/sys"):
+        self.sysfs_path = sysfs_path
+        self._meminfo = ProcFile(os.path.join(procfs_path, "meminfo"))
+        self._temperature = None
+        self._resolved_at = 0.0
+
+    def memory(self):
+        """Memory usage computed like psutil.virtual_memory()"""
+        meminfo = self._meminfo
+        length = meminfo.read()
+        buffer = meminfo.buffer
+        total = _meminfo_field(buffer, length, b"MemTotal:")
+        free = _meminfo_field(buffer, length, b"\nMemFree:")
+        buffers = _meminfo_field(buffer, length, b"\nBuffers:", 0)
+        cached = (_meminfo_field(buffer, length, b"\nCached:", 0) +
+                  _meminfo_field(buffer, length, b"\nSReclaimable:", 0))
+        available = _meminfo_field(buffer, length, b"\nMemAvailable:", 0)
+        if not available:
+            # Kernels before 3.14, a rough estimate where psutil has its own
+            available = free + buffers + cached
+        if available > total:
+            # Distorted values inside some containers, as psutil does
+            available = free
+        used = total - available
+        percent = round(used / total * 100, 1) if total else 0.0
+        return MemoryStats(total, available, percent, used, free, buffers,
+                           cached)
+
+    def temperature(self):
+        """CPU temperature in °C, 0 when there's no sensor"""
+        if self._temperature is None:
+            self._temperature = ProcFile(
+                find_temperature_sensor(self.sysfs_path), size=64)
+            self._resolved_at = time.monotonic()
+        try:
+            length = self._temperature.read()
+            return int(self._temperature.buffer[:length]) / 1000
+        except (OSError, ValueError):
+            self._temperature.close()
+            # Looked up again once in a while, the sensor may come back
+            if time.monotonic() - self._resolved_at >= SENSOR_RETRY:
+                self._temperature = None
+            return 0
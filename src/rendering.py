@@ -2,10 +2,22 @@
 Shared rendering functions for stats display.
 This module contains all rendering logic used by both the main stats.py 
 and test scripts.
+The static parts of each mode (title, icons, bar backgrounds) are drawn once
+into a cached base layer, and rows whose content didn't change are pasted
+from a tile cache. Render functions return a frame buffer that is reused
+for the next frame of the same mode, copy it if you need to keep it.
 """
+import os
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
-MAIN_FONT = "./fonts/FiraCodeNerdFont-Light.ttf"
+from history import downsample
+
+# Can point at a subset of the font with only the glyphs the dashboard uses
+MAIN_FONT = os.getenv("FONT_PATH", "./fonts/FiraCodeNerdFont-Light.ttf")
 
 # Color mapping for PIL
 COLOR_MAP = {
@@ -17,55 +29,306 @@ COLOR_MAP = {
     'cyan': (0, 255, 255),
     'red': (255, 0, 0),
     'orange': (255, 165, 0),
+    'plum': (221, 160, 221),
+    'wheat': (245, 222, 179),
     'black': (0, 0, 0)
 }
 
+BAR_BACKGROUND = (40, 40, 40)
+BAR_OUTLINE = (80, 80, 80)
+
+# Share of the bar color used for the min/max band behind a sparkline
+SPARKLINE_BAND = 0.4
+
+# Per-core heatmaps shade each core from the bar background through the row's
+# color to orange and red at these loads (percent), and wrap onto another row
+# of tiles rather than drawing tiles narrower than MIN_CORE_TILE pixels
+HEAT_STOPS = (0, 60, 85, 100)
+MIN_CORE_TILE = 4
+_heat_palettes = {}
+
+# Static base layers, keyed by mode, geometry, layout and fonts.
+# Each entry holds the base image and a frame buffer reused across frames.
+MAX_BASE_LAYERS = 8
+_base_layers = {}
+
+# Rendered row/cell tiles, keyed by base layer, region and row content
+MAX_TILES = 64
+
+
+class TileCache:
+    """Bounded LRU cache of rendered tiles with hit/miss counters"""
+
+    def __init__(self, max_tiles):
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        tile = self.tiles.get(key)
+        if tile is None:
+            self.misses += 1
+            return None
+        self.tiles.move_to_end(key)
+        self.hits += 1
+        return tile
+
+    def put(self, key, tile):
+        self.tiles[key] = tile
+        if len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.tiles.clear()
+
+    def stats(self):
+        return {
+            'tiles': len(self.tiles),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+tile_cache = TileCache(MAX_TILES)
+
+# Outlined label characters, a few fonts and bar colors worth of digits
+MAX_SPRITES = 256
+
+
+class GlyphSprites:
+    """Label characters outlined in a bar color, rendered once and pasted
+    side by side.
+
+    Animated labels change on every sub-frame and laying out outlined text
+    costs far more than pasting a few sprites. The dashboard font is
+    monospaced, so the characters land where drawing the label in one go
+    puts them.
+    """
+
+    def __init__(self, max_sprites):
+        self.cache = TileCache(max_sprites)
+
+    def sprite(self, char, font, color):
+        """(image, left, top, advance, bbox) of one outlined character"""
+        key = (char, font, color)
+        sprite = self.cache.get(key)
+        if sprite is None:
+            left, top, right, bottom = font.getbbox(char, stroke_width=1)
+            image = Image.new("RGBA", (max(1, right - left),
+                                       max(1, bottom - top)), (0, 0, 0, 0))
+            ImageDraw.Draw(image).text((-left, -top), char, font=font,
+                                       fill=(0, 0, 0, 255), stroke_width=1,
+                                       stroke_fill=color + (255,))
+            sprite = (image, left, top, font.getlength(char),
+                      font.getbbox(char))
+            self.cache.put(key, sprite)
+        return sprite
+
+    def bbox(self, text, font, color):
+        """Like textbbox((0, 0), text) without the outline"""
+        x = 0.0
+        box = None
+        for char in text:
+            _, _, _, advance, (left, top, right, bottom) = self.sprite(
+                char, font, color)
+            if right > left:
+                char_box = (int(x) + left, top, int(x) + right, bottom)
+                box = char_box if box is None else _union(box, char_box)
+            x += advance
+        return box or (0, 0, 0, 0)
+
+    def draw(self, image, xy, text, font, color):
+        """Paste the outlined text at xy, returns its bbox"""
+        x, y = xy
+        box = (x, y, x, y)
+        for char in text:
+            sprite, left, top, advance, _ = self.sprite(char, font, color)
+            position = (int(x) + left, y + top)
+            image.paste(sprite, position, sprite)
+            box = _union(box, position + (position[0] + sprite.width,
+                                          position[1] + sprite.height))
+            x += advance
+        return box
+
+
+glyph_sprites = GlyphSprites(MAX_SPRITES)
+
+
+class FontRegistry:
+    """Process-wide font faces, loaded lazily and shared by (path, size)"""
+
+    def __init__(self, default_path):
+        self.default_path = default_path
+        self.faces = {}
+
+    def get(self, size, path=None):
+        """Font face for size, falling back to PIL's default font"""
+        key = (path or self.default_path, size)
+        face = self.faces.get(key)
+        if face is None:
+            try:
+                face = ImageFont.truetype(key[0], size)
+            except OSError:
+                face = ImageFont.load_default()
+            self.faces[key] = face
+        return face
+
+
+fonts = FontRegistry(MAIN_FONT)
+
 
 def load_fonts(title_font_size, stats_font_size):
     """Load fonts for rendering"""
-    try:
-        title_font = ImageFont.truetype(MAIN_FONT, title_font_size)
-        stats_font = ImageFont.truetype(MAIN_FONT, stats_font_size)
-        icon_font = ImageFont.truetype(MAIN_FONT, stats_font_size)
-    except OSError:
-        title_font = ImageFont.load_default()
-        stats_font = ImageFont.load_default()
-        icon_font = ImageFont.load_default()
+    title_font = fonts.get(title_font_size)
+    stats_font = fonts.get(stats_font_size)
+    icon_font = fonts.get(stats_font_size)
     return title_font, stats_font, icon_font
 
 
+def _layout_key(stats_data):
+    """The parts of the stats data that end up in the base layer"""
+    return tuple((stat_data['icon'], stat_data['icon_color'],
+                  stat_data.get('has_bar', False)) for stat_data in stats_data)
+
+
+def _frame_from_base(key, build_base, reset=True):
+    """Reused frame buffer reset to the cached base layer for key, or as
+    last drawn unless reset"""
+    entry = _base_layers.get(key)
+    if entry is None:
+        if len(_base_layers) >= MAX_BASE_LAYERS:
+            _base_layers.pop(next(iter(_base_layers)))
+        base = build_base()
+        frame = base.copy()
+        entry = _base_layers[key] = (base, frame, ImageDraw.Draw(frame))
+    elif reset:
+        entry[1].paste(entry[0])
+    return entry[1], entry[2]
+
+
+def _redraw_region(key, region, draw_row):
+    """Reset a region of the frame for key to its base layer and draw a row
+    into it, returns the box that changed"""
+    base, frame, draw = _base_layers[key]
+    frame.paste(base.crop(region), region[:2])
+    left, top, right, bottom = _union(draw_row(draw), region)
+    return (max(0, left), max(0, top), min(frame.width, right),
+            min(frame.height, bottom))
+
+
+def _union(box_a, box_b):
+    return (min(box_a[0], box_b[0]), min(box_a[1], box_b[1]),
+            max(box_a[2], box_b[2]), max(box_a[3], box_b[3]))
+
+
+def _start_subframe(key, regions, width, height):
+    """Whether an animation sub-frame can repaint the last frame for key.
+    Without one the whole frame is drawn and counted as changed"""
+    if regions is None:
+        return False
+    if key in _base_layers:
+        return True
+    regions.append((0, 0, width, height))
+    return False
+
+
+def _draw_cached(image, draw, key, region, draw_row):
+    """Paste the cached tile for a row, or draw it and cache the result.
+
+    draw_row draws the row and returns the bounding box of what it drew.
+    Returns False when the drawing spilled outside region, rows drawn after
+    that must not be cached as their tiles would capture the spill.
+    """
+    if key is None:
+        drawn = draw_row(draw)
+        return _union(drawn, region) == tuple(region)
+    tile = tile_cache.get(key)
+    if tile is not None:
+        image.paste(tile, region[:2])
+        return True
+    drawn = draw_row(draw)
+    if _union(drawn, region) != tuple(region):
+        return False
+    tile_cache.put(key, image.crop(region))
+    return True
+
+
+def _label_bbox(draw, text, font, color, animating):
+    """textbbox((0, 0), text) of a bar label"""
+    if animating:
+        return glyph_sprites.bbox(text, font, COLOR_MAP[color])
+    return draw.textbbox((0, 0), text, font=font)
+
+
+def _draw_bar_label(draw, image, xy, text, font, color, animating):
+    """Draw a label in black outlined in the bar color, from sprites while
+    it is animating, returns its bbox"""
+    if animating:
+        return glyph_sprites.draw(image, xy, text, font, COLOR_MAP[color])
+    draw.text(xy, text, fill=(0, 0, 0), font=font, stroke_width=1,
+              stroke_fill=COLOR_MAP[color])
+    return draw.textbbox(xy, text, font=font, stroke_width=1)
+
+
+def _draw_text(draw, xy, text, color, font):
+    """Draw text and return its bounding box"""
+    draw.text(xy, text, fill=COLOR_MAP[color], font=font)
+    return draw.textbbox(xy, text, font=font)
+
+
+def _draw_title(draw, width, title_text, title_font, y_offset):
+    """Draw the title centered horizontally"""
+    title_bbox = draw.textbbox((0, 0), title_text, font=title_font)
+    title_width = title_bbox[2] - title_bbox[0]
+    title_x = (width - title_width) // 2
+    draw.text((title_x, y_offset),
+              title_text,
+              fill=COLOR_MAP['white'],
+              font=title_font)
+
+
 def render_stats_direct(width, height, title_text, stats_data, title_font,
                         stats_font, icon_font, stats_font_size,
                         title_font_size):
     """Direct PIL rendering for text mode"""
-    image = Image.new("RGB", (width, height), COLOR_MAP['black'])
-    draw = ImageDraw.Draw(image)
-
     y_offset = 10
     row_height = int(stats_font_size * 1.8)
     icon_x = 10
     value_x = 40
     title_spacing = int(title_font_size * 1.5)
 
-    title_bbox = draw.textbbox((0, 0), title_text, font=title_font)
-    title_width = title_bbox[2] - title_bbox[0]
-    title_x = (width - title_width) // 2
-    draw.text((title_x, y_offset),
-              title_text,
-              fill=COLOR_MAP['white'],
-              font=title_font)
+    def build_base():
+        image = Image.new("RGB", (width, height), COLOR_MAP['black'])
+        draw = ImageDraw.Draw(image)
+        _draw_title(draw, width, title_text, title_font, y_offset)
 
-    current_y = y_offset + title_spacing
+        current_y = y_offset + title_spacing
+        for stat_data in stats_data:
+            draw.text((icon_x, current_y),
+                      stat_data['icon'],
+                      fill=COLOR_MAP[stat_data['icon_color']],
+                      font=icon_font)
+            current_y += row_height
+        return image
+
+    key = ('direct', width, height, title_text, _layout_key(stats_data),
+           title_font, stats_font, icon_font, stats_font_size, title_font_size)
+    image, draw = _frame_from_base(key, build_base)
 
+    current_y = y_offset + title_spacing
+    cacheable = True
     for stat_data in stats_data:
-        draw.text((icon_x, current_y),
-                  stat_data['icon'],
-                  fill=COLOR_MAP[stat_data['icon_color']],
-                  font=icon_font)
-        draw.text((value_x, current_y),
-                  stat_data['value'],
-                  fill=COLOR_MAP[stat_data['value_color']],
-                  font=stats_font)
+        value, value_color = stat_data['value'], stat_data['value_color']
+        region = (value_x, current_y, width, current_y + row_height)
+        cacheable = _draw_cached(
+            image, draw,
+            (key, region, value, value_color) if cacheable else None, region,
+            lambda d: _draw_text(d, (value_x, current_y), value, value_color,
+                                 stats_font)) and cacheable
         current_y += row_height
 
     return image
@@ -73,124 +336,291 @@ def render_stats_direct(width, height, title_text, stats_data, title_font,
 
 def render_stats_visual(width, height, title_text, stats_data, title_font,
                         stats_font, icon_font, stats_font_size,
-                        title_font_size):
-    """Visual rendering with progress bars"""
-    image = Image.new("RGB", (width, height), COLOR_MAP['black'])
-    draw = ImageDraw.Draw(image)
+                        title_font_size, regions=None):
+    """Visual rendering with progress bars.
 
+    With a regions list it draws a sub-frame of an animation: only the rows
+    flagged 'animating' are repainted on the last frame, and the boxes they
+    cover are appended to regions.
+    """
     y_offset = 10
     row_height = int(stats_font_size * 1.8)
     icon_x = 10
     bar_start_x = 40
     bar_width = width - bar_start_x - 10
     bar_height = int(stats_font_size * 1.2)
+    bar_offset = int((stats_font_size - bar_height) / 2)
     title_spacing = int(title_font_size * 1.5)
 
-    bar_font_size = int(stats_font_size * 0.7)
-    try:
-        bar_font = ImageFont.truetype(MAIN_FONT, bar_font_size)
-    except OSError:
-        bar_font = ImageFont.load_default()
+    bar_font = fonts.get(int(stats_font_size * 0.7))
+
+    def build_base():
+        image = Image.new("RGB", (width, height), COLOR_MAP['black'])
+        draw = ImageDraw.Draw(image)
+        _draw_title(draw, width, title_text, title_font, y_offset)
+
+        current_y = y_offset + title_spacing
+        for stat_data in stats_data:
+            draw.text((icon_x, current_y),
+                      stat_data['icon'],
+                      fill=COLOR_MAP[stat_data['icon_color']],
+                      font=icon_font)
+            if stat_data['has_bar']:
+                bar_y = current_y + bar_offset
+                draw.rectangle([
+                    bar_start_x, bar_y, bar_start_x + bar_width,
+                    bar_y + bar_height
+                ],
+                               fill=BAR_BACKGROUND,
+                               outline=BAR_OUTLINE)
+            current_y += row_height
+        return image
 
-    title_bbox = draw.textbbox((0, 0), title_text, font=title_font)
-    title_width = title_bbox[2] - title_bbox[0]
-    title_x = (width - title_width) // 2
-    draw.text((title_x, y_offset),
-              title_text,
-              fill=COLOR_MAP['white'],
-              font=title_font)
+    key = ('visual', width, height, title_text, _layout_key(stats_data),
+           title_font, stats_font, icon_font, stats_font_size, title_font_size)
+    subframe = _start_subframe(key, regions, width, height)
+    image, draw = _frame_from_base(key, build_base, reset=not subframe)
 
     current_y = y_offset + title_spacing
-
+    cacheable = True
     for stat_data in stats_data:
-        draw.text((icon_x, current_y),
-                  stat_data['icon'],
-                  fill=COLOR_MAP[stat_data['icon_color']],
-                  font=icon_font)
+        animating = stat_data.get('animating', False)
+        if subframe and not animating:
+            current_y += row_height
+            continue
+        label_text, bar_color = stat_data['label'], stat_data['bar_color']
+        region_y = current_y + min(0, bar_offset)
+        region = (bar_start_x, region_y, width, region_y + row_height)
 
         if stat_data['has_bar']:
             fill_width = int((bar_width * stat_data['percentage']) / 100)
-            bar_y = current_y + int((stats_font_size - bar_height) / 2)
-
-            draw.rectangle([
-                bar_start_x, bar_y, bar_start_x + bar_width, bar_y + bar_height
-            ],
-                           fill=(40, 40, 40),
-                           outline=(80, 80, 80))
-
-            if fill_width > 0:
-                draw.rectangle([
-                    bar_start_x, bar_y, bar_start_x + fill_width,
-                    bar_y + bar_height
-                ],
-                               fill=COLOR_MAP[stat_data['bar_color']])
-
-            label_text = stat_data['label']
-            label_bbox = draw.textbbox((0, 0), label_text, font=bar_font)
-            label_width = label_bbox[2] - label_bbox[0]
-            label_height = label_bbox[3] - label_bbox[1]
-
-            if label_width < (bar_width - 10):
-                text_x = bar_start_x + (bar_width - label_width) // 2
-                text_y = bar_y + (bar_height -
-                                  label_height) // 2 - label_bbox[1]
-                text_color = (0, 0, 0)
-                stroke_color = COLOR_MAP[stat_data['bar_color']]
-                draw.text((text_x, text_y),
-                          label_text,
-                          fill=text_color,
-                          font=bar_font,
-                          stroke_width=1,
-                          stroke_fill=stroke_color)
-            else:
-                text_x = bar_start_x + bar_width + 5
-                text_y = current_y
-                draw.text((text_x, text_y),
-                          label_text,
-                          fill=COLOR_MAP['white'],
-                          font=bar_font)
+            bar_y = current_y + bar_offset
+            cores = stat_data.get('cores')
+            tile_key = (key, region, label_text, bar_color, fill_width, cores)
+            draw_row = (lambda d: _draw_bar_row(
+                d, label_text, bar_color, fill_width, bar_start_x, bar_y,
+                bar_width, bar_height, current_y, bar_font, image, cores,
+                stat_data['icon_color'], animating))
         else:
-            draw.text((bar_start_x, current_y),
-                      stat_data['label'],
-                      fill=COLOR_MAP[stat_data['bar_color']],
-                      font=stats_font)
+            tile_key = (key, region, label_text, bar_color)
+            draw_row = (lambda d: _draw_text(d, (bar_start_x, current_y),
+                                             label_text, bar_color,
+                                             stats_font))
 
+        if subframe:
+            regions.append(_redraw_region(key, region, draw_row))
+        else:
+            # The in-between values of an animation aren't worth caching
+            cacheable = _draw_cached(
+                image, draw, tile_key if cacheable and not animating else None,
+                region, draw_row) and cacheable
         current_y += row_height
 
     return image
 
 
-def render_stats_grid(width, height, title_text, stats_data, title_font,
-                      stats_font, icon_font, stats_font_size, title_font_size):
-    """Grid layout rendering with 2xn arrangement"""
-    image = Image.new("RGB", (width, height), COLOR_MAP['black'])
-    draw = ImageDraw.Draw(image)
+def _draw_bar_row(draw, label_text, bar_color, fill_width, bar_start_x, bar_y,
+                  bar_width, bar_height, row_y, bar_font, image=None,
+                  cores=None, cores_color=None, animating=False):
+    """Draw a progress bar fill, or the per-core heatmap in its place, and
+    its label, returns the drawn bbox"""
+    if cores:
+        _draw_heatmap(image, cores, (bar_start_x + 1, bar_y + 1,
+                                     bar_start_x + bar_width,
+                                     bar_y + bar_height), cores_color)
+    elif fill_width > 0:
+        draw.rectangle([
+            bar_start_x, bar_y, bar_start_x + fill_width, bar_y + bar_height
+        ],
+                       fill=COLOR_MAP[bar_color])
+    drawn = (bar_start_x, bar_y, bar_start_x + bar_width + 1,
+             bar_y + bar_height + 1)
+
+    label_bbox = _label_bbox(draw, label_text, bar_font, bar_color, animating)
+    label_width = label_bbox[2] - label_bbox[0]
+    label_height = label_bbox[3] - label_bbox[1]
 
+    if label_width < (bar_width - 10):
+        text_x = bar_start_x + (bar_width - label_width) // 2
+        text_y = bar_y + (bar_height - label_height) // 2 - label_bbox[1]
+        text_bbox = _draw_bar_label(draw, image, (text_x, text_y), label_text,
+                                    bar_font, bar_color, animating)
+    else:
+        text_x = bar_start_x + bar_width + 5
+        text_y = row_y
+        text_bbox = _draw_text(draw, (text_x, text_y), label_text, 'white',
+                               bar_font)
+
+    return _union(drawn, text_bbox)
+
+
+def _heat_palette(color):
+    """(101, 3) colors of the loads 0-100% for a row color"""
+    palette = _heat_palettes.get(color)
+    if palette is None:
+        stops = np.array((BAR_BACKGROUND, COLOR_MAP[color],
+                          COLOR_MAP['orange'], COLOR_MAP['red']),
+                         dtype=np.float64)
+        levels = np.arange(101)
+        palette = np.stack([np.interp(levels, HEAT_STOPS, stops[:, channel])
+                            for channel in range(3)], axis=1)
+        palette = _heat_palettes[color] = palette.round().astype(np.uint8)
+    return palette
+
+
+@lru_cache(maxsize=16)
+def _heatmap_tiles(count, width, height):
+    """Core index of every pixel of a heatmap, -1 for the gaps"""
+    columns = max(1, min(count, width // MIN_CORE_TILE))
+    rows = -(-count // columns)
+    # Spread the cores evenly over the rows
+    columns = -(-count // rows)
+    x = np.arange(width) * columns // width
+    y = np.arange(height) * rows // height
+    tiles = y[:, None] * columns + x[None, :]
+    tiles[tiles >= count] = -1
+    # A one pixel gap where each tile starts
+    tiles[:, np.flatnonzero(np.diff(x)) + 1] = -1
+    tiles[np.flatnonzero(np.diff(y)) + 1, :] = -1
+    tiles.flags.writeable = False
+    return tiles
+
+
+def _draw_heatmap(image, cores, box, color):
+    """Paste a tile per core shaded by its load into box in one operation"""
+    x0, y0, x1, y1 = box
+    if x1 <= x0 or y1 <= y0:
+        return
+    tiles = _heatmap_tiles(len(cores), x1 - x0, y1 - y0)
+    levels = np.clip(np.asarray(cores, dtype=np.intp), 0, 100)
+    # The gaps index the background appended last
+    colors = np.vstack((_heat_palette(color)[levels],
+                        np.array([BAR_BACKGROUND], dtype=np.uint8)))
+    image.paste(Image.fromarray(colors[tiles], "RGB"), (x0, y0))
+
+
+def render_stats_history(width, height, title_text, stats_data, title_font,
+                         stats_font, icon_font, stats_font_size,
+                         title_font_size):
+    """Rows with a sparkline of each stat's history next to its icon"""
     y_offset = 10
-    x_margin = 10
-    grid_spacing = 8
-    title_spacing = int(title_font_size * 1.2)
-
-    grid_font_size = int(stats_font_size * 0.65)
-    try:
-        grid_font = ImageFont.truetype(MAIN_FONT, grid_font_size)
-    except OSError:
-        grid_font = ImageFont.load_default()
+    row_height = int(stats_font_size * 1.8)
+    icon_x = 10
+    spark_x = 40
+    label_width = (width - spark_x - 10) * 2 // 5
+    spark_width = width - spark_x - 10 - label_width - 4
+    label_x = spark_x + spark_width + 4
+    spark_height = int(stats_font_size * 1.2)
+    spark_offset = int((stats_font_size - spark_height) / 2)
+    title_spacing = int(title_font_size * 1.5)
 
-    cell_width = (width - 2 * x_margin - grid_spacing) // 2
-    cell_height = int(stats_font_size * 1.5)
-    bar_height = int(stats_font_size * 0.9)
+    label_font_size = int(stats_font_size * 0.7)
+    label_font = fonts.get(label_font_size)
+
+    def build_base():
+        image = Image.new("RGB", (width, height), COLOR_MAP['black'])
+        draw = ImageDraw.Draw(image)
+        _draw_title(draw, width, title_text, title_font, y_offset)
+
+        current_y = y_offset + title_spacing
+        for stat_data in stats_data:
+            draw.text((icon_x, current_y),
+                      stat_data['icon'],
+                      fill=COLOR_MAP[stat_data['icon_color']],
+                      font=icon_font)
+            if stat_data['has_bar']:
+                spark_y = current_y + spark_offset
+                draw.rectangle([
+                    spark_x, spark_y, spark_x + spark_width,
+                    spark_y + spark_height
+                ],
+                               fill=BAR_BACKGROUND,
+                               outline=BAR_OUTLINE)
+            current_y += row_height
+        return image
 
-    title_bbox = draw.textbbox((0, 0), title_text, font=title_font)
-    title_width = title_bbox[2] - title_bbox[0]
-    title_x = (width - title_width) // 2
-    draw.text((title_x, y_offset),
-              title_text,
-              fill=COLOR_MAP['white'],
-              font=title_font)
+    key = ('history', width, height, title_text, _layout_key(stats_data),
+           title_font, stats_font, icon_font, stats_font_size, title_font_size)
+    image, draw = _frame_from_base(key, build_base)
 
     current_y = y_offset + title_spacing
+    cacheable = True
+    for stat_data in stats_data:
+        label_text, bar_color = stat_data['label'], stat_data['bar_color']
+        region_y = current_y + min(0, spark_offset)
 
+        if stat_data['has_bar']:
+            spark_y = current_y + spark_offset
+            series = stat_data.get('history')
+            if series is not None and series.shape[1]:
+                # Inside the outline, redrawn every frame as the series moves
+                _draw_sparkline(image, draw, series,
+                                (spark_x + 1, spark_y + 1,
+                                 spark_x + spark_width, spark_y + spark_height),
+                                bar_color)
+            region = (label_x, region_y, width, region_y + row_height)
+            text_xy = (label_x, current_y + spark_offset +
+                       (spark_height - label_font_size) // 2)
+            font = label_font
+        else:
+            region = (spark_x, region_y, width, region_y + row_height)
+            text_xy = (spark_x, current_y)
+            font = stats_font
+
+        cacheable = _draw_cached(
+            image, draw,
+            (key, region, label_text, bar_color) if cacheable else None,
+            region,
+            lambda d: _draw_text(d, text_xy, label_text, bar_color, font)
+        ) and cacheable
+        current_y += row_height
+
+    return image
+
+
+def _draw_sparkline(image, draw, series, box, color):
+    """Draw a (3, n) min/mean/max series into box, newest point on the right.
+
+    The min/max band is built as a pixel array in one go and the mean is
+    drawn as a polyline, values are percentages on a fixed 0-100 scale.
+    """
+    left, top, right, bottom = box
+    box_width, box_height = right - left, bottom - top
+    if box_width <= 0 or box_height <= 0:
+        return
+    series = downsample(series, box_width)
+    count = series.shape[1]
+
+    # Rows measured from the top, NaN gaps stay NaN and draw nothing
+    y = (100 - np.clip(series, 0, 100)) * ((box_height - 1) / 100)
+    np.rint(y, out=y)
+    rows = np.arange(box_height)[:, None]
+    with np.errstate(invalid="ignore"):
+        band = (rows >= y[2]) & (rows <= y[0])
+
+    rgb = COLOR_MAP[color]
+    pixels = np.empty((box_height, count, 3), dtype=np.uint8)
+    pixels[...] = BAR_BACKGROUND
+    pixels[band] = [int(c * SPARKLINE_BAND) for c in rgb]
+    x0 = right - count
+    image.paste(Image.fromarray(pixels, "RGB"), (x0, top))
+
+    # One polyline per run of points without gaps
+    xs = np.arange(x0, right, dtype=np.float64)
+    mean = y[1] + top
+    gaps = np.flatnonzero(np.isnan(mean))
+    for run_x, run_y in zip(np.split(xs, gaps), np.split(mean, gaps)):
+        valid = ~np.isnan(run_y)
+        points = np.column_stack((run_x[valid], run_y[valid]))
+        if len(points) > 1:
+            draw.line(points.ravel().tolist(), fill=rgb)
+        elif len(points) == 1:
+            draw.point(points.ravel().tolist(), fill=rgb)
+
+
+def _grid_layout(stats_data, x_margin, start_y, cell_width, cell_height,
+                 grid_spacing, ip_row_height):
+    """Position of the full-width IP row and each (stat, x, y) grid cell"""
     ip_data = None
     grid_stats = []
     for stat_data in stats_data:
@@ -199,85 +629,262 @@ def render_stats_grid(width, height, title_text, stats_data, title_font,
         else:
             grid_stats.append(stat_data)
 
+    current_y = start_y
+    ip_y = current_y
     if ip_data:
-        draw.text((x_margin, current_y),
-                  ip_data['icon'],
-                  fill=COLOR_MAP[ip_data['icon_color']],
-                  font=icon_font)
-        draw.text((x_margin + 30, current_y),
-                  ip_data['label'],
-                  fill=COLOR_MAP[ip_data['bar_color']],
-                  font=stats_font)
-        current_y += int(stats_font_size * 1.6)
-
-    for i in range(0, len(grid_stats), 2):
-        row_y = current_y
-
-        if i < len(grid_stats):
-            stat_data = grid_stats[i]
-            cell_x = x_margin
-            _draw_grid_cell(draw, stat_data, cell_x, row_y, cell_width,
-                            cell_height, bar_height, grid_font, icon_font,
-                            stats_font_size)
-
-        if i + 1 < len(grid_stats):
-            stat_data = grid_stats[i + 1]
-            cell_x = x_margin + cell_width + grid_spacing
-            _draw_grid_cell(draw, stat_data, cell_x, row_y, cell_width,
-                            cell_height, bar_height, grid_font, icon_font,
-                            stats_font_size)
-
-        current_y += cell_height + grid_spacing
+        current_y += ip_row_height
+
+    cells = []
+    for i, stat_data in enumerate(grid_stats):
+        cell_x = x_margin + (i % 2) * (cell_width + grid_spacing)
+        cell_y = current_y + (i // 2) * (cell_height + grid_spacing)
+        cells.append((stat_data, cell_x, cell_y))
+    return ip_data, ip_y, cells
+
+
+def render_stats_grid(width, height, title_text, stats_data, title_font,
+                      stats_font, icon_font, stats_font_size, title_font_size,
+                      regions=None):
+    """Grid layout rendering with 2xn arrangement, draws an animation
+    sub-frame with a regions list like render_stats_visual"""
+    y_offset = 10
+    x_margin = 10
+    grid_spacing = 8
+    title_spacing = int(title_font_size * 1.2)
+
+    grid_font = fonts.get(int(stats_font_size * 0.65))
+
+    cell_width = (width - 2 * x_margin - grid_spacing) // 2
+    cell_height = int(stats_font_size * 1.5)
+    bar_height = int(stats_font_size * 0.9)
+
+    ip_row_height = int(stats_font_size * 1.6)
+
+    ip_data, ip_y, cells = _grid_layout(stats_data, x_margin,
+                                        y_offset + title_spacing, cell_width,
+                                        cell_height, grid_spacing,
+                                        ip_row_height)
+
+    def build_base():
+        image = Image.new("RGB", (width, height), COLOR_MAP['black'])
+        draw = ImageDraw.Draw(image)
+        _draw_title(draw, width, title_text, title_font, y_offset)
+
+        if ip_data:
+            draw.text((x_margin, ip_y),
+                      ip_data['icon'],
+                      fill=COLOR_MAP[ip_data['icon_color']],
+                      font=icon_font)
+        for stat_data, cell_x, cell_y in cells:
+            _draw_grid_cell_base(draw, stat_data, cell_x, cell_y, cell_width,
+                                 bar_height, icon_font, stats_font_size)
+        return image
+
+    key = ('grid', width, height, title_text, _layout_key(stats_data),
+           title_font, stats_font, icon_font, stats_font_size, title_font_size)
+    subframe = _start_subframe(key, regions, width, height)
+    image, draw = _frame_from_base(key, build_base, reset=not subframe)
+
+    cacheable = True
+    if ip_data and not subframe:
+        label_text, label_color = ip_data['label'], ip_data['bar_color']
+        region = (x_margin + 30, ip_y, width, ip_y + ip_row_height)
+        cacheable = _draw_cached(
+            image, draw, (key, region, label_text, label_color), region,
+            lambda d: _draw_text(d, (x_margin + 30, ip_y), label_text,
+                                 label_color, stats_font))
+
+    for stat_data, cell_x, cell_y in cells:
+        animating = stat_data.get('animating', False)
+        if subframe and not animating:
+            continue
+        bar_x, bar_width = _grid_bar_geometry(cell_x, cell_width,
+                                              stats_font_size)
+        fill_width = int((bar_width * stat_data['percentage']) / 100)
+        region = (bar_x + 2, cell_y, cell_x + cell_width + 1,
+                  cell_y + cell_height)
+        tile_key = (key, region, stat_data['label'], stat_data['bar_color'],
+                    fill_width, stat_data.get('cores'))
+        draw_cell = (lambda d: _draw_grid_cell(d, stat_data, cell_x, cell_y,
+                                               cell_width, bar_height,
+                                               grid_font, stats_font_size,
+                                               image))
+        if subframe:
+            regions.append(_redraw_region(key, region, draw_cell))
+        else:
+            cacheable = _draw_cached(
+                image, draw, tile_key if cacheable and not animating else None,
+                region, draw_cell) and cacheable
 
     return image
 
 
-def _draw_grid_cell(draw, stat_data, x, y, cell_width, cell_height, bar_height,
-                    grid_font, icon_font, stats_font_size):
-    """Draw a single grid cell with icon, bar, and label"""
+def _grid_bar_geometry(x, cell_width, stats_font_size):
+    """Bar x position and width inside a grid cell"""
     icon_size = int(stats_font_size * 1.2)
-    bar_y = y
-    bar_x = x + icon_size + 2
-    bar_width = cell_width - 4 - icon_size
+    return x + icon_size + 2, cell_width - 4 - icon_size
+
 
-    icon_bbox = draw.textbbox((0, 0), stat_data['icon'], font=icon_font)
-    icon_x = x 
-    draw.text((icon_x, y),
+def _draw_grid_cell_base(draw, stat_data, x, y, cell_width, bar_height,
+                         icon_font, stats_font_size):
+    """Draw the static parts of a grid cell: icon and bar background"""
+    bar_x, bar_width = _grid_bar_geometry(x, cell_width, stats_font_size)
+
+    draw.text((x, y),
               stat_data['icon'],
               fill=COLOR_MAP[stat_data['icon_color']],
               font=icon_font)
 
-    fill_width = int((bar_width * stat_data['percentage']) / 100)
+    draw.rectangle([bar_x + 2, y, bar_x + 2 + bar_width, y + bar_height],
+                   fill=BAR_BACKGROUND,
+                   outline=BAR_OUTLINE)
+
 
-    draw.rectangle([bar_x + 2, bar_y, bar_x + 2 + bar_width, bar_y + bar_height],
-                   fill=(40, 40, 40),
-                   outline=(80, 80, 80))
+def _draw_grid_cell(draw, stat_data, x, y, cell_width, bar_height, grid_font,
+                    stats_font_size, image=None):
+    """Draw the dynamic parts of a grid cell, returns the drawn bbox"""
+    bar_y = y
+    bar_x, bar_width = _grid_bar_geometry(x, cell_width, stats_font_size)
+
+    fill_width = int((bar_width * stat_data['percentage']) / 100)
 
-    if fill_width > 0:
+    cores = stat_data.get('cores')
+    if cores:
+        _draw_heatmap(image, cores, (bar_x + 3, bar_y + 1,
+                                     bar_x + 2 + bar_width,
+                                     bar_y + bar_height),
+                      stat_data['icon_color'])
+    elif fill_width > 0:
         draw.rectangle([bar_x + 2, bar_y, bar_x + 2 + fill_width, bar_y + bar_height],
                        fill=COLOR_MAP[stat_data['bar_color']])
+    drawn = (bar_x + 2, bar_y, bar_x + 3 + bar_width, bar_y + bar_height + 1)
 
-    label_text = stat_data['label']
-    label_bbox = draw.textbbox((0, 0), label_text, font=grid_font)
+    label_text, bar_color = stat_data['label'], stat_data['bar_color']
+    animating = stat_data.get('animating', False)
+    label_bbox = _label_bbox(draw, label_text, grid_font, bar_color,
+                             animating)
     label_width = label_bbox[2] - label_bbox[0]
     label_height = label_bbox[3] - label_bbox[1]
 
     if label_width < (bar_width - 6):
         text_x = bar_x + 2 + (bar_width - label_width) // 2
         text_y = bar_y + (bar_height - label_height) // 2 - label_bbox[1]
-        text_color = (0, 0, 0)
-        stroke_color = COLOR_MAP[stat_data['bar_color']]
-        draw.text((text_x, text_y),
-                  label_text,
-                  fill=text_color,
-                  font=grid_font,
-                  stroke_width=1,
-                  stroke_fill=stroke_color)
+        text_bbox = _draw_bar_label(draw, image, (text_x, text_y), label_text,
+                                    grid_font, bar_color, animating)
 
     else:
         text_x = bar_x + (cell_width - label_width) // 2
         text_y = bar_y + bar_height + 2
-        draw.text((text_x, text_y),
-                  label_text,
-                  fill=COLOR_MAP['white'],
-                  font=grid_font)
+        text_bbox = _draw_text(draw, (text_x, text_y), label_text, 'white',
+                               grid_font)
+
+    return _union(drawn, text_bbox)
+
+
+def _cluster_layout(count, x, y, width, height, gap):
+    """Columns, rows and cell size of the grid that fits count nodes best"""
+    best = None
+    for columns in range(1, max(count, 1) + 1):
+        rows = -(-count // columns)
+        cell_width = (width - (columns - 1) * gap) // columns
+        cell_height = (height - (rows - 1) * gap) // max(rows, 1)
+        # Cells around twice as wide as they are high read best
+        score = min(cell_width, cell_height * 2)
+        if best is None or score > best[0]:
+            best = (score, columns, rows, cell_width, cell_height)
+    return best[1:]
+
+
+def render_stats_cluster(width, height, title_text, nodes, title_font,
+                         stats_font, icon_font, stats_font_size,
+                         title_font_size):
+    """Grid of nodes, each with its name, a label and cpu/memory/disk bars"""
+    y_offset = 10
+    margin = 4
+    gap = 3
+    title_spacing = int(title_font_size * 1.2)
+    grid_y = y_offset + title_spacing
+    columns, rows, cell_width, cell_height = _cluster_layout(
+        len(nodes), margin, grid_y, width - 2 * margin,
+        height - grid_y - margin, gap)
+
+    # Name line on top, the bars share the rest of the cell
+    font_size = max(6, min(int(stats_font_size * 0.65),
+                           int(cell_height * 0.4)))
+    cell_font = fonts.get(font_size)
+    bars_y = font_size + 3
+    bar_height = max(1, (cell_height - bars_y - 1) // 3 - 1)
+    bar_width = cell_width - 4
+
+    cells = []
+    for index in range(len(nodes)):
+        cell_x = margin + (index % columns) * (cell_width + gap)
+        cell_y = grid_y + (index // columns) * (cell_height + gap)
+        cells.append((cell_x, cell_y))
+
+    def build_base():
+        image = Image.new("RGB", (width, height), COLOR_MAP['black'])
+        draw = ImageDraw.Draw(image)
+        _draw_title(draw, width, title_text, title_font, y_offset)
+        if not nodes:
+            draw.text((margin, grid_y), "Waiting for nodes...",
+                      fill=COLOR_MAP['white'], font=stats_font)
+        for cell_x, cell_y in cells:
+            for bar in range(3):
+                bar_y = cell_y + bars_y + bar * (bar_height + 1)
+                draw.rectangle([cell_x + 2, bar_y, cell_x + 2 + bar_width,
+                                bar_y + bar_height - 1],
+                               fill=BAR_BACKGROUND)
+        return image
+
+    key = ('cluster', width, height, title_text, len(nodes), title_font,
+           stats_font, stats_font_size, title_font_size)
+    image, draw = _frame_from_base(key, build_base)
+
+    cacheable = True
+    for node, (cell_x, cell_y) in zip(nodes, cells):
+        region = (cell_x, cell_y, cell_x + cell_width, cell_y + cell_height)
+        fills = tuple((int(bar_width * percentage / 100), color)
+                      for percentage, color in node['bars'])
+        tile_key = (key, region, node['name'], node['label'],
+                    node['label_color'], node['stale'], fills)
+        cacheable = _draw_cached(
+            image, draw, tile_key if cacheable else None, region,
+            lambda d: _draw_cluster_cell(d, node, fills, region, bars_y,
+                                         bar_height, cell_font)) and cacheable
+
+    return image
+
+
+def _draw_cluster_cell(draw, node, fills, region, bars_y, bar_height,
+                       cell_font):
+    """Draw one node's cell, returns the drawn bbox"""
+    left, top, right, bottom = region
+    stale = node['stale']
+    # Stale nodes are outlined and their bars greyed out
+    draw.rectangle([left, top, right - 1, bottom - 1],
+                   outline=COLOR_MAP['red'] if stale else BAR_OUTLINE)
+
+    label = node['label']
+    label_width = 0
+    if label:
+        label_width = draw.textlength(label, font=cell_font)
+        draw.text((right - 2 - label_width, top + 1), label,
+                  fill=COLOR_MAP[node['label_color']], font=cell_font)
+
+    # Cut the name to what fits next to the label
+    name = node['name']
+    room = right - left - 6 - label_width
+    while name and draw.textlength(name, font=cell_font) > room:
+        name = name[:-1]
+    draw.text((left + 2, top + 1), name,
+              fill=BAR_OUTLINE if stale else COLOR_MAP['white'],
+              font=cell_font)
+
+    for bar, (fill_width, color) in enumerate(fills):
+        bar_y = top + bars_y + bar * (bar_height + 1)
+        if fill_width > 0:
+            draw.rectangle([left + 2, bar_y, left + 2 + fill_width,
+                            bar_y + bar_height - 1],
+                           fill=BAR_OUTLINE if stale else COLOR_MAP[color])
+    return region
@@ -0,0 +1,80 @@
+"""
+Adaptive frame scheduling.
+Frames tick on wall-clock boundaries instead of sleeping a fixed time after
+each frame, so the interval doesn't drift by the frame cost. A tick whose
+formatted stats are identical to the last frame skips rendering and the
+transfer, ticks back off while nothing changes and speed up while a stat
+is in its warning or critical state.
+"""
+import time
+
+
+def snapshot_signature(value):
+    """Hashable form of the formatted stats, floats rounded to what is drawn"""
+    if isinstance(value, dict):
+        return tuple((key, snapshot_signature(item))
+                     for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(snapshot_signature(item) for item in value)
+    if isinstance(value, float):
+        return round(value, 1)
+    return value
+
+
+class FrameScheduler:
+    """Decides when to tick and whether a tick needs a new frame"""
+
+    def __init__(self, interval=1.0, idle_interval=5.0, idle_after=10,
+                 alert_interval=0.5, force_interval=60.0):
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.idle_after = idle_after  # Unchanged ticks before backing off
+        self.alert_interval = alert_interval
+        self.force_interval = force_interval  # Redraw an unchanged frame
+        self.current_interval = interval
+        self.slowdown = 1.0  # Stretches every interval, set by the CPU budget
+        self.unchanged = 0
+        self.skipped = 0
+        self._signature = None
+        self._rendered_at = None
+
+    def invalidate(self):
+        """Render on the next tick whatever the snapshot"""
+        self._signature = None
+        self._rendered_at = None
+        self.unchanged = 0
+
+    def should_render(self, signature):
+        """True when the snapshot changed or the last frame is too old"""
+        now = time.monotonic()
+        if signature != self._signature or self._rendered_at is None:
+            self._signature = signature
+            self._rendered_at = now
+            self.unchanged = 0
+            return True
+        self.unchanged += 1
+        if now - self._rendered_at >= self.force_interval:
+            self._rendered_at = now
+            return True
+        self.skipped += 1
+        return False
+
+    def next_interval(self, alert):
+        """Interval to the next tick for the current state"""
+        if alert:
+            interval = self.alert_interval
+        elif self.unchanged >= self.idle_after:
+            interval = self.idle_interval
+        else:
+            interval = self.interval
+        self.current_interval = interval * self.slowdown
+        return self.current_interval
+
+    def delay(self, alert):
+        """Seconds to the next wall-clock aligned tick"""
+        interval = self.next_interval(alert)
+        return interval - time.time() % interval
+
+    def wait(self, alert):
+        """Sleep until the next wall-clock aligned tick"""
+        time.sleep(self.delay(alert))
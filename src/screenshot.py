@@ -0,0 +1,88 @@
+"""
+Rate-limited screenshot sink.
+Frames are encoded on a background thread and written with an atomic
+rename, so readers never see a partially written file.
+"""
+import os
+import threading
+import time
+import traceback
+
+MODES = ('off', 'change', 'interval', 'always')
+
+
+class ScreenshotSink:
+    """Saves copies of rendered frames according to the configured mode"""
+
+    def __init__(self, mode="off", path="screenshot.png", interval=10,
+                 image_format="png", compression=1, metrics=None):
+        self.metrics = metrics
+        self.mode = mode if mode in MODES else 'off'
+        self.path = path
+        self.interval = interval
+        self.format = image_format.upper().replace("JPG", "JPEG")
+        self.compression = compression  # PNG compress_level, JPEG/WebP quality
+        self.last_saved = None
+        self.saved = 0
+        self._pending = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._pid = None
+
+    def submit(self, pil_image, changed=True):
+        """Queue a frame if a screenshot is due, never blocks on encoding"""
+        if self.mode == 'off':
+            return False
+        now = time.monotonic()
+        if self.mode == 'change' and not changed and self.last_saved:
+            return False
+        if (self.mode == 'interval' and self.last_saved and
+                now - self.last_saved < self.interval):
+            return False
+
+        if self._pid != os.getpid():
+            # First frame, or our writer thread didn't survive a fork
+            self._pid = os.getpid()
+            threading.Thread(target=self._run,
+                             name="screenshot-writer",
+                             daemon=True).start()
+
+        self.last_saved = now
+        # Frame buffers are reused by the renderer, keep our own copy.
+        # Only the latest frame is kept if the writer falls behind.
+        with self._lock:
+            self._pending = pil_image.copy()
+        self._ready.set()
+        return True
+
+    def _save_options(self):
+        if self.format == "PNG":
+            return {'compress_level': self.compression}
+        if self.format in ("JPEG", "WEBP"):
+            return {'quality': self.compression}
+        return {}
+
+    def _write(self, pil_image):
+        directory, name = os.path.split(os.path.abspath(self.path))
+        tmp_path = os.path.join(directory, f".{name}.tmp")
+        pil_image.save(tmp_path, self.format, **self._save_options())
+        os.replace(tmp_path, self.path)
+        self.saved += 1
+
+    def _run(self):
+        while True:
+            self._ready.wait()
+            with self._lock:
+                pil_image, self._pending = self._pending, None
+                self._ready.clear()
+            if pil_image is None:
+                continue
+            try:
+                if self.metrics is not None:
+                    with self.metrics.time("frame", "stage", "screenshot"):
+                        self._write(pil_image)
+                else:
+                    self._write(pil_image)
+            except Exception as e:
+                print(f"Error saving screenshot to {self.path}: {e}")
+                traceback.print_exc()
@@ -0,0 +1,138 @@
+"""
+Shared-memory frame export.
+Every frame a panel shows is published into a memory-mapped file, e.g. under
+/dev/shm, which other processes can map and read without a copy through the
+kernel. The file is a 64 byte header followed by the RGB888 pixels:
+
+    offset  0  8s  magic b"SPIFRAME"
+            8  I   version (1)
+           12  I   width
+           16  I   height
+           20  I   bytes per pixel (3, RGB)
+           24  Q   sequence, odd while a frame is being written
+           32  d   time.time() the frame was published
+           64      height * width * 3 pixels, row by row
+
+Readers take the sequence, copy or use the pixels, and retry if the sequence
+was odd or has changed since.
+"""
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b"SPIFRAME"
+VERSION = 1
+HEADER_SIZE = 64
+_HEADER = struct.Struct("<8sIIII")
+_SEQUENCE = struct.Struct("<Q")
+_TIMESTAMP = struct.Struct("<d")
+SEQUENCE_OFFSET = 24
+TIMESTAMP_OFFSET = 32
+# Seconds between checks of the sequence by waiting readers
+POLL_INTERVAL = 0.02
+# Longest back-off of a reader retrying a frame being written
+RETRY_INTERVAL = 0.005
+
+
+class SharedFrame:
+    """A panel's latest frame in a memory-mapped file, or in anonymous shared
+    memory without a path"""
+
+    def __init__(self, path, width, height):
+        self.path = path
+        self.width = width
+        self.height = height
+        size = HEADER_SIZE + width * height * 3
+        if path:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+            try:
+                os.ftruncate(fd, size)
+                self._map = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+        else:
+            self._map = mmap.mmap(-1, size)
+        _HEADER.pack_into(self._map, 0, MAGIC, VERSION, width, height, 3)
+        _SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, 0)
+        self.pixels = np.frombuffer(self._map, np.uint8, width * height * 3,
+                                    HEADER_SIZE).reshape(height, width, 3)
+
+    @classmethod
+    def open(cls, path):
+        """Map a frame published by another process, read-only"""
+        frame = cls.__new__(cls)
+        with open(path, "rb") as f:
+            frame._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, width, height, depth = _HEADER.unpack_from(frame._map)
+        if magic != MAGIC or version != VERSION or depth != 3:
+            raise ValueError(f"{path} isn't a version {VERSION} frame export")
+        frame.path = path
+        frame.width = width
+        frame.height = height
+        frame.pixels = np.frombuffer(frame._map, np.uint8,
+                                     width * height * 3,
+                                     HEADER_SIZE).reshape(height, width, 3)
+        return frame
+
+    @property
+    def sequence(self):
+        return _SEQUENCE.unpack_from(self._map, SEQUENCE_OFFSET)[0]
+
+    def publish(self, pil_image):
+        """Copy a frame in, the renderer reuses its frame buffers"""
+        if pil_image.mode != "RGB":
+            pil_image = pil_image.convert("RGB")
+        # Kept in the mapping, so it carries on from a recycled worker's
+        sequence = self.sequence | 1
+        _SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, sequence)
+        np.copyto(self.pixels, np.asarray(pil_image))
+        _TIMESTAMP.pack_into(self._map, TIMESTAMP_OFFSET, time.time())
+        _SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, sequence + 1)
+
+    def recover(self):
+        """Make a frame readable again which a worker killed while publishing
+        left half-written"""
+        sequence = self.sequence
+        if sequence & 1:
+            _SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, sequence + 1)
+
+    def read(self, timeout=1.0):
+        """(sequence, timestamp, pixels) of a consistent copy of the frame,
+        sequence 0 before the first frame. TimeoutError if no frame could be
+        read within timeout, e.g. as its writer died mid-frame."""
+        deadline = time.monotonic() + timeout
+        delay = 0.0001
+        while True:
+            before = self.sequence
+            if not before & 1:
+                pixels = self.pixels.copy()
+                timestamp = _TIMESTAMP.unpack_from(self._map,
+                                                   TIMESTAMP_OFFSET)[0]
+                if self.sequence == before:
+                    return before, timestamp, pixels
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"{self.path or 'frame'} is still being "
+                                   f"written after {timeout}s")
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_INTERVAL)
+
+    def wait(self, after, timeout):
+        """Wait until a frame newer than the sequence after is published,
+        returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        while self.sequence <= after or self.sequence & 1:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(POLL_INTERVAL, remaining))
+        return True
+
+    def close(self):
+        # The pixel view must go before the mapping can be closed
+        self.pixels = None
+        self._map.close()
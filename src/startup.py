@@ -0,0 +1,49 @@
+"""
+Startup timing.
+Records how long each phase of the cold start takes, from the process being
+started to the first frame reaching the display, and logs it as one line.
+"""
+import os
+import time
+
+
+def process_age():
+    """Seconds since this process was started, None if procfs can't tell"""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            # The command name may contain spaces, fields follow its ')'
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    return max(0.0, uptime - started)
+
+
+class StartupTimer:
+    """Durations of the startup phases, timed back to back"""
+
+    def __init__(self):
+        now = time.perf_counter()
+        # Interpreter start up to the first phase, from the process start time
+        age = process_age()
+        self.started = now - age if age is not None else now
+        self.phases = [("interpreter", now - self.started)]
+        self._last = now
+
+    def mark(self, phase):
+        """End the current phase under a name"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def elapsed(self):
+        """Seconds since the process was started"""
+        return time.perf_counter() - self.started
+
+    def report(self, event):
+        """One log line with the time to an event and the phases before it"""
+        phases = ", ".join(f"{phase} {seconds * 1000:.0f} ms"
+                           for phase, seconds in self.phases)
+        return f"Startup: {event} after {self.elapsed() * 1000:.0f} ms ({phases})"
@@ -0,0 +1,92 @@
+"""
+Stat definitions.
+The rows on the display are defined in a TOML file, stats.toml next to this
+module unless STATS_CONFIG points at another one. Each row names the source
+its value is collected from: a built-in one, a collector plugin registered
+under the 'spi_stats.sources' entry point group or a 'module:function'
+path, so site specific metrics don't need changes to the code.
+"""
+import importlib
+import os
+import tomllib
+
+from stat_row import StatRow
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "stats.toml")
+PLUGIN_GROUP = "spi_stats.sources"
+# Interval of plugin sources without a refresh attribute
+DEFAULT_REFRESH = 5.0
+
+
+def builtin_sources():
+    """Built-in sources by name, with their configured refresh intervals"""
+    from display_config import (CPU_REFRESH, DISK_REFRESH, IO_REFRESH,
+                                IP_REFRESH, MEM_REFRESH, NET_REFRESH,
+                                TEMP_REFRESH)
+    from system_stats import SystemStats
+
+    return {
+        "ip": (SystemStats.get_ip_address, IP_REFRESH),
+        "cpu": (SystemStats.get_cpu_stats, CPU_REFRESH),
+        "cpu_cores": (SystemStats.get_cpu_core_stats, CPU_REFRESH),
+        "memory": (SystemStats.get_memory_stats, MEM_REFRESH),
+        "disk": (SystemStats.get_disk_stats, DISK_REFRESH),
+        "network": (SystemStats.get_network_stats, NET_REFRESH),
+        "disk_io": (SystemStats.get_disk_io_stats, IO_REFRESH),
+        "temperature": (SystemStats.get_temperature_stats, TEMP_REFRESH),
+    }
+
+
+def load_source(name):
+    """A plugin source and its default refresh interval.
+
+    Sources are called without arguments from the collector threads and
+    return a number, a mapping or a named tuple.
+    """
+    if ":" in name:
+        module, attribute = name.split(":", 1)
+        source = getattr(importlib.import_module(module), attribute)
+    else:
+        # Only scanned for sources which aren't built in
+        from importlib.metadata import entry_points
+
+        plugins = entry_points(group=PLUGIN_GROUP, name=name)
+        if not plugins:
+            raise ValueError(f"Unknown stat source '{name}', not built in or "
+                             f"registered under '{PLUGIN_GROUP}'")
+        source = next(iter(plugins)).load()
+    return source, float(getattr(source, "refresh", DEFAULT_REFRESH))
+
+
+def load_definitions(path):
+    """The [[stats]] tables of a definitions file"""
+    with open(path, "rb") as f:
+        return tomllib.load(f).get("stats", [])
+
+
+def load_stat_rows(path, collector):
+    """Compile the definitions into stat rows and register their sources"""
+    path = path or DEFAULT_CONFIG
+    sources = builtin_sources()
+    getters = {}  # Rows sharing a source share its collection
+    rows = []
+    for definition in load_definitions(path):
+        definition = dict(definition)
+        name = definition.get("name", "")
+        source_name = definition.pop("source", name)
+        refresh = definition.pop("refresh", None)
+        try:
+            if source_name not in getters:
+                source, interval = (sources[source_name]
+                                    if source_name in sources else
+                                    load_source(source_name))
+                if refresh is not None:
+                    interval = float(refresh)
+                getters[source_name] = collector.register(source_name, source,
+                                                          interval)
+            rows.append(StatRow(get_stat=getters[source_name],
+                                source=source_name, **definition))
+        except (TypeError, ValueError, ImportError, AttributeError) as e:
+            raise ValueError(f"{path}: stat '{name}': {e}") from e
+    return rows
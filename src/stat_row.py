@@ -1,70 +1,171 @@
+"""
+Stat rows.
+A row is compiled once from its definition: the text and label templates
+are parsed up front, and the percentage, label and severity are evaluated
+in a single pass per collected value, shared by the text, visual and alert
+paths.
+"""
+from collections import namedtuple
+from operator import itemgetter
+from string import Formatter
+
+from humanize import naturalsize
+
+NORMAL, WARNING, CRITICAL = range(3)
+SEVERITY_COLORS = {WARNING: "orange", CRITICAL: "red"}
+
+StatValue = namedtuple("StatValue", "text label percentage severity cores")
+# Shown until the source has been collected
+_EMPTY = StatValue("", "", 0, NORMAL, None)
+
+# Format specs with a meaning of their own, e.g. {used:size}
+FORMATTERS = {
+    "size": lambda value: naturalsize(value, False, True),
+}
+
+
+def compile_template(template):
+    """Parse a format string once into a format_map string and the fields
+    to convert with FORMATTERS, stored under 'field~spec' keys"""
+    pieces = []
+    conversions = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        pieces.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        if conversion or not field.isidentifier():
+            raise ValueError(f"Unsupported field '{{{field}}}' in '{template}'")
+        if spec in FORMATTERS:
+            key = f"{field}~{spec}"
+            conversions.append((key, field, FORMATTERS[spec]))
+            pieces.append(f"{{{key}}}")
+        else:
+            pieces.append(f"{{{field}:{spec}}}" if spec else f"{{{field}}}")
+    return "".join(pieces), tuple(conversions)
+
+
+def render_template(template, fields):
+    """Format a compiled template, converted fields are shared between
+    templates through the fields dict"""
+    format_string, conversions = template
+    for key, field, formatter in conversions:
+        if key not in fields:
+            fields[key] = formatter(fields[field])
+    return format_string.format_map(fields)
+
+
+def compile_percent(spec):
+    """'field' or 'part / whole' -> function of the fields giving a percentage"""
+    if "/" not in spec:
+        return itemgetter(spec.strip())
+    part, whole = (name.strip() for name in spec.split("/", 1))
+
+    def percent(fields):
+        total = fields[whole]
+        return fields[part] / total * 100 if total else 0.0
+
+    return percent
+
+
+def stat_fields(stat):
+    """Template fields of a collected value: 'value' and, for records, their
+    fields"""
+    if hasattr(stat, "_asdict"):
+        fields = stat._asdict()
+    elif isinstance(stat, dict):
+        fields = dict(stat)
+    else:
+        fields = {}
+    fields["value"] = stat
+    return fields
+
+
 class StatRow:
-    """A class representing a single statistic row with icon, label, and dynamic value"""
-
-    def __init__(self,
-                 icon,
-                 label,
-                 color,
-                 get_stat,
-                 state_string,
-                 is_warning,
-                 is_critical,
-                 get_percentage=None,
-                 visual_label=None):
+    """A single statistic row with icon, color and dynamic value"""
+
+    __slots__ = ("name", "source", "icon", "color", "get_stat", "has_bar", "_text",
+                 "_label", "_percent", "_threshold", "_warning", "_critical",
+                 "_cores", "_stat", "_value")
+
+    def __init__(self, name, icon, color, get_stat, text="{value}",
+                 label=None, percent=None, threshold=None, warning=None,
+                 critical=None, cores=None, source=None):
+        self.name = name  # Used to label the row's timings
+        self.source = source or name  # Source the value is collected from
         self.icon = icon
-        self.label = label
         self.color = color
         self.get_stat = get_stat
-        self.state_string = state_string
-        self.is_warning = is_warning
-        self.is_critical = is_critical
-        self.get_percentage = get_percentage  # Function to extract percentage value
-        self.visual_label = visual_label  # Custom label function for visual mode
+        self.has_bar = percent is not None  # Whether to show a progress bar
+        self._text = compile_template(text)
+        # Label in visual mode, the text unless set
+        self._label = compile_template(label) if label is not None else None
+        self._percent = compile_percent(percent) if percent else None
+        # Field compared with the thresholds
+        self._threshold = threshold or ("percent" if percent else "value")
+        self._warning = warning
+        self._critical = critical
+        # Field with per-core percentages, drawn as a heatmap in the bar
+        self._cores = cores
+        self._stat = None
+        self._value = _EMPTY
 
-    def get_render_data(self):
-        """Get current stat data for direct PIL rendering"""
+    def evaluate(self):
+        """Text, label, percentage and severity of the current value,
+        computed once per collected value"""
         stat = self.get_stat()
-        stat_text = self.state_string(stat)
-        stat_color = ("red" if self.is_critical(stat) else
-                      "orange" if self.is_warning(stat) else self.color)
+        if stat is None:
+            return _EMPTY
+        if stat is self._stat:
+            return self._value
+
+        fields = stat_fields(stat)
+        percentage = 0
+        if self._percent is not None:
+            percentage = fields["percent"] = self._percent(fields)
+        severity = NORMAL
+        if self._warning is not None or self._critical is not None:
+            level = fields[self._threshold]
+            if self._critical is not None and level >= self._critical:
+                severity = CRITICAL
+            elif self._warning is not None and level >= self._warning:
+                severity = WARNING
+        text = render_template(self._text, fields)
+        label = (render_template(self._label, fields)
+                 if self._label is not None else text)
 
+        cores = tuple(fields[self._cores]) if self._cores else None
+
+        self._stat = stat
+        self._value = StatValue(text, label, percentage, severity, cores)
+        return self._value
+
+    def get_render_data(self):
+        """Get current stat data for direct PIL rendering"""
+        value = self.evaluate()
         return {
             'icon': self.icon,
             'icon_color': self.color,
-            'value': stat_text,
-            'value_color': stat_color
+            'value': value.text,
+            'value_color': SEVERITY_COLORS.get(value.severity, self.color)
         }
 
     def get_visual_data(self):
         """Get data for visual mode rendering with progress bars"""
-        stat = self.get_stat()
-
-        # Determine percentage value
-        if self.get_percentage:
-            percentage = self.get_percentage(stat)
-        else:
-            percentage = 0  # Default for non-percentage stats like IP
-
-        # Determine label text
-        if self.visual_label:
-            label_text = self.visual_label(stat)
-        else:
-            label_text = self.state_string(stat)
-
-        # Determine color based on thresholds
-        stat_color = ("red" if self.is_critical(stat) else
-                      "orange" if self.is_warning(stat) else self.color)
-
+        value = self.evaluate()
         return {
             'icon': self.icon,
             'icon_color': self.color,
-            'label': label_text,
-            'percentage': percentage,
-            'bar_color': stat_color,
-            'has_bar': self.get_percentage is
-                       not None  # Whether to show a progress bar
+            'label': value.label,
+            'percentage': value.percentage,
+            'bar_color': SEVERITY_COLORS.get(value.severity, self.color),
+            'has_bar': self.has_bar,
+            'cores': value.cores
         }
 
+    def is_alert(self):
+        """True while the stat is in its warning or critical state"""
+        return self.evaluate().severity != NORMAL
+
     def update_compose(self):
         """Legacy method for compatibility - returns render data"""
         return self.get_render_data()
@@ -1,211 +1,582 @@
+"""
+System stats monitor for ST7789 SPI displays.
+Importing this module doesn't touch the hardware: main() creates the
+displays, fonts and collector, overlapping the display initialisation with
+the first stats collection and the font loading, and logs how long the
+cold start took up to the first frame.
+"""
+from startup import StartupTimer
+
+# Started before the other imports so they are part of the startup log
+_startup = StartupTimer()
+
+import os
 import time
 import signal
 import sys
-import multiprocessing as mp
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from display_config import (BAUDRATE, PANELS, WORKER_MAX_FRAMES,
+                            WORKER_MAX_RSS_MB, PARTIAL_UPDATES, STATS_CONFIG,
+                            COLLECTOR_THREADS, SCREENSHOT_MODE,
+                            SCREENSHOT_PATH, SCREENSHOT_INTERVAL,
+                            SCREENSHOT_FORMAT, SCREENSHOT_COMPRESSION,
+                            DISPLAY_BACKEND, VIRTUAL_DUMP_DIR, METRICS_PORT,
+                            METRICS_ADDRESS, METRICS_TEXTFILE,
+                            METRICS_INTERVAL, HISTORY_LEVELS,
+                            HISTORY_RESOLUTION, FRAME_INTERVAL,
+                            FRAME_IDLE_INTERVAL, FRAME_IDLE_AFTER,
+                            FRAME_ALERT_INTERVAL, FRAME_FORCE_INTERVAL,
+                            ANIMATION, ANIMATION_FPS, ANIMATION_DURATION,
+                            ANIMATION_BUDGET, ANIMATION_MIN_FPS,
+                            FRAME_SHM_DIR, PREVIEW_PORT, PREVIEW_ADDRESS,
+                            PREVIEW_QUALITY, CPU_BUDGET, CPU_MAX_SLOWDOWN,
+                            CPU_THERMAL_FACTOR)
+from cluster import (CLUSTER_INTERVAL, CLUSTER_LISTEN, CLUSTER_PROTOCOL,
+                     CLUSTER_PUBLISH, Agent, Aggregator, node_values)
+from collector import Collector
+from metrics import Metrics, MetricsExporter
+from scheduler import FrameScheduler, snapshot_signature
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+TITLE_TEXT = "═ SYSTEM MONITOR ═"
+
+
+def create_metrics():
+    """Timings of every frame stage, stat row and collected metric"""
+    metrics = Metrics()
+    metrics.describe("frame", "Time spent in each stage of a frame")
+    metrics.describe("stat", "Time spent formatting each stat row")
+    metrics.describe("collect", "Time spent collecting each metric")
+    metrics.describe("cluster", "Time spent publishing snapshots to the cluster aggregator")
+    metrics.describe("frames", "Frames rendered")
+    metrics.describe("frame_overruns", "Ticks that took longer than the frame interval")
+    metrics.describe("frames_skipped", "Ticks whose stats were unchanged and not rendered")
+    metrics.describe("frame_errors", "Ticks whose frame failed to render or send")
+    metrics.describe("spi_bytes", "Bytes written to the display")
+    metrics.describe("animation_frames", "Animation sub-frames drawn")
+    metrics.describe("animation_frames_dropped", "Animation sub-frames dropped to stay within the CPU budget")
+    metrics.describe("animation_fallbacks",
+                     "Times the animation exceeded its CPU budget and fell back to a frame per tick")
+    return metrics
+
+
+def create_displays():
+    """Create the ST7789 displays (or their virtual stand-ins), they share
+    the SPI bus, and switch the backlight on"""
+    # Imported here so the driver loads while the main thread collects
+    from display_backend import create_backlight, create_display, create_spi
+
+    # One bus object, so the panels can't fight over its settings
+    spi = create_spi(DISPLAY_BACKEND)
+    displays = []
+    for config in PANELS:
+        dump_dir = VIRTUAL_DUMP_DIR
+        if dump_dir and len(PANELS) > 1:
+            dump_dir = os.path.join(dump_dir, config['name'])
+        displays.append(
+            create_display(DISPLAY_BACKEND, spi, config['cs'], config['dc'],
+                           config['rst'], BAUDRATE, config['display'],
+                           dump_dir))
+    return displays, create_backlight(DISPLAY_BACKEND)
+
+
+def create_panel(index, config, disp, metrics):
+    """Wrap a display with its sender and screenshot sink"""
+    from framebuffer import FrameSender
+    from panel import Panel
+    from screenshot import ScreenshotSink
+
+    screenshot_path = SCREENSHOT_PATH
+    if index:
+        # Every panel after the first gets its own files
+        root, ext = os.path.splitext(SCREENSHOT_PATH)
+        screenshot_path = f"{root}-{config['name']}{ext}"
+    sender = FrameSender(disp, partial=PARTIAL_UPDATES, metrics=metrics)
+    screenshots = ScreenshotSink(SCREENSHOT_MODE, screenshot_path,
+                                 SCREENSHOT_INTERVAL, SCREENSHOT_FORMAT,
+                                 SCREENSHOT_COMPRESSION, metrics=metrics)
+    panel = Panel(config['name'], disp, config['mode'], config['layout'],
+                  config['title_font_size'], config['stats_font_size'], sender,
+                  screenshots)
+    if FRAME_SHM_DIR or PREVIEW_PORT:
+        from shared_frame import SharedFrame
+
+        # Mapped before the worker forks, so the frames outlive a recycle
+        path = (os.path.join(FRAME_SHM_DIR, f"{config['name']}.frame")
+                if FRAME_SHM_DIR else None)
+        panel.shared_frame = SharedFrame(path, panel.width, panel.height)
+    return panel
+
+
+def load_panel_fonts():
+    """Load the fonts of every panel into the shared registry"""
+    from rendering import load_fonts
+
+    for config in PANELS:
+        load_fonts(config['title_font_size'], config['stats_font_size'])
+
+
+def create_stats(collector):
+    """The stat rows, each reading its metric from the collector"""
+    from stat_defs import load_stat_rows
+
+    return load_stat_rows(STATS_CONFIG, collector)
+
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+    # Read our own statm rather than going through psutil, which may be
+    # pointed at the host's /proc via PROCFS_PATH
+    with open("/proc/self/statm", "r") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+class Monitor:
+    """Panels, stats and the render loop, set up by main() and inherited by
+    the forked render workers"""
+
+    def __init__(self, panels, backlight, collector, stats, metrics,
+                 startup=None):
+        self.panels = panels
+        self.backlight = backlight
+        self.collector = collector
+        self.stats = stats
+        self.metrics = metrics
+        # Reported by the first render worker only
+        self.startup = startup
+        # Stats data is collected once per frame for each kind the panels draw
+        self.data_kinds = sorted({panel.data_kind for panel in panels})
+        # Transfers of one panel overlap rendering the next, set in the worker
+        self.transfer_pool = None
+        self.worker = None
+
+        self.history = None
+        if any(panel.mode == 'history' for panel in panels):
+            from history import History, parse_levels
+
+            # Allocated before the render worker is forked so it outlives
+            # recycles
+            self.history = History(
+                [stat.name for stat in stats if stat.has_bar],
+                parse_levels(HISTORY_LEVELS))
+
+        # History points are recorded on ticks, idle ticks mustn't leave gaps
+        idle_interval = (min(FRAME_IDLE_INTERVAL, self.history.levels[0][0])
+                         if self.history is not None else FRAME_IDLE_INTERVAL)
+        self.scheduler = FrameScheduler(FRAME_INTERVAL, idle_interval,
+                                        FRAME_IDLE_AFTER, FRAME_ALERT_INTERVAL,
+                                        FRAME_FORCE_INTERVAL)
+
+        # Moves the bars of the visual panels between ticks
+        self.animator = None
+        if ANIMATION and any(panel.animated for panel in panels):
+            from animation import Animator
+
+            self.animator = Animator(ANIMATION_FPS, ANIMATION_DURATION,
+                                     ANIMATION_BUDGET, ANIMATION_MIN_FPS,
+                                     metrics)
+
+        # Keeps the worker's CPU time within CPU_BUDGET
+        self.governor = None
+        if CPU_BUDGET > 0:
+            from governor import CpuGovernor
+
+            self.governor = CpuGovernor(CPU_BUDGET, CPU_MAX_SLOWDOWN,
+                                        CPU_THERMAL_FACTOR, self.animator)
+        # The governor backs off while these are at their warning threshold
+        self.thermal_stats = [stat for stat in self.stats
+                              if stat.source == 'temperature']
+
+        # Receives the snapshots of other nodes for the cluster display mode
+        self.aggregator = (Aggregator(CLUSTER_LISTEN, CLUSTER_PROTOCOL)
+                           if 'cluster' in self.data_kinds else None)
+        # Publishes this node's stats to an aggregator
+        self.agent = (Agent(CLUSTER_PUBLISH, CLUSTER_PROTOCOL)
+                      if CLUSTER_PUBLISH else None)
 
-import board
-import digitalio
-from PIL import Image
-from humanize import naturalsize
-
-from adafruit_rgb_display import st7789
-from system_stats import SystemStats
-from stat_row import StatRow
-from display_config import (CS_PIN, DC_PIN, RESET_PIN, BAUDRATE, DISPLAY_CONFIG,
-                            TITLE_FONT_SIZE, STATS_FONT_SIZE, DISPLAY_MODE,
-                            DISPLAY_LAYOUT)
-from rendering import (load_fonts, render_stats_direct, render_stats_visual,
-                       render_stats_grid)
-
-# Load fonts once at startup
-title_font, stats_font, icon_font = load_fonts(TITLE_FONT_SIZE, STATS_FONT_SIZE)
-
-# Setup SPI bus using hardware SPI:
-spi = board.SPI()
-
-# Create the ST7789 display with configuration
-disp = st7789.ST7789(spi,
-                     cs=CS_PIN,
-                     dc=DC_PIN,
-                     rst=RESET_PIN,
-                     baudrate=BAUDRATE,
-                     **DISPLAY_CONFIG)
-
-# in one instance the display backlight just turned off and won't turn on even with reboot
-backlight = digitalio.DigitalInOut(board.D22)
-backlight.switch_to_output()
-backlight.value = True
-
-
-def send_image_to_display(pil_image):
-    """Send PIL Image directly to SPI display"""
-    try:
-        disp.image(pil_image)
+        # Live view of the exported frames, served from a process of its own
+        # so its viewers stay connected when the render worker is recycled
+        self.preview = None
+        self.preview_process = None
+        if PREVIEW_PORT:
+            from preview import PreviewServer
+
+            self.preview = PreviewServer(
+                {panel.name: panel.shared_frame for panel in panels},
+                PREVIEW_ADDRESS, PREVIEW_PORT, PREVIEW_QUALITY)
+
+        self.register_process_gauges()
+        self.exporter = MetricsExporter(metrics, METRICS_ADDRESS, METRICS_PORT,
+                                        METRICS_TEXTFILE, METRICS_INTERVAL)
+
+    def send_image_to_display(self, panel, pil_image, full=False):
+        """Send PIL Image directly to SPI display"""
+        try:
+            panel.sender.send(pil_image, full=full)
+            return True
+        except Exception as e:
+            print(f"Error sending image to display: {e}")
+            image_size = pil_image.size
+            # Print the width and height from the tuple
+            print(f"3.Image size (width, height): {image_size}")
+            traceback.print_exc()
+            return False
+
+    def shutdown_handler(self, _signum, _frame):
+        print("shutdown_handler...")
+        # Stop the render worker first so it can't overwrite the blank frame
+        if self.worker is not None and self.worker.is_alive():
+            self.worker.terminate()
+            self.worker.join()
+        # A worker stopped in the middle of a publish leaves the sequence odd,
+        # which a standalone preview would wait out forever
+        for panel in self.panels:
+            if panel.shared_frame is not None:
+                panel.shared_frame.recover()
+        if (self.preview_process is not None and
+                self.preview_process.is_alive()):
+            self.preview_process.terminate()
+            self.preview_process.join()
+        for panel in self.panels:
+            self.send_image_to_display(panel, panel.blank_image(), full=True)
+        print("blank image sent...")
+        sys.exit(0)
+
+    def collect_stats_data(self, visual):
+        """Data for every stat row, timing each row"""
+        stats_data = []
+        for stat in self.stats:
+            with self.metrics.time("stat", "stat", stat.name):
+                stats_data.append(stat.get_visual_data() if visual else
+                                  stat.update_compose())
+        return stats_data
+
+    def collect_data(self, kind):
+        """Data for the panels drawing one kind of data"""
+        if kind == 'cluster':
+            return self.aggregator.render_data()
+        return self.collect_stats_data(visual=kind == 'visual')
+
+    def add_history(self, stats_data):
+        """Record the stat percentages and attach the series to draw"""
+        now = time.time()
+        for stat, stat_data in zip(self.stats, stats_data):
+            if stat_data['has_bar']:
+                self.history.record(stat.name, stat_data['percentage'], now)
+                stat_data['history'] = self.history.series(
+                    stat.name, HISTORY_RESOLUTION)
+
+    def update_stats(self):
+        """Collect a snapshot, render and send it to every panel if it changed.
+
+        Returns True when a frame was rendered, False when the snapshot was
+        unchanged and None when rendering or sending it failed.
+        """
+        metrics = self.metrics
+        try:
+            # Visual and history mode data have percentages, the cluster mode
+            # draws the other nodes and text is the default
+            with metrics.time("frame", "stage", "stats"):
+                stats_data = {kind: self.collect_data(kind)
+                              for kind in self.data_kinds}
+
+            signature = snapshot_signature(stats_data)
+            if self.history is not None:
+                with metrics.time("frame", "stage", "history"):
+                    self.add_history(stats_data['visual'])
+                # The sparklines move on with every new point
+                signature = (signature,
+                             int(time.time() // HISTORY_RESOLUTION))
+            if not self.scheduler.should_render(signature):
+                return False
+
+            # The animated panels keep their moving bars where they are, the
+            # transition is drawn until the next tick
+            animated = (self.animator.begin(stats_data['visual'])
+                        if self.animator is not None else None)
+            self.render_panels([
+                (panel, animated if panel.animated and animated is not None
+                 else stats_data[panel.data_kind]) for panel in self.panels])
+
+        except Exception as e:
+            print(f"Error rendering or sending image to display: {e}")
+            traceback.print_exc()
+            metrics.inc("frame_errors")
+            # Retried on the next tick even if the stats stay the same
+            self.scheduler.invalidate()
+            return None
         return True
-    except Exception as e:
-        print(f"Error sending image to display: {e}")
-        image_size = pil_image.size
-        # Print the width and height from the tuple
-        print(f"3.Image size (width, height): {image_size}")
-        traceback.print_exc()
-        return False
-
-
-def create_blank_image(width, height):
-    """Create a blank black image"""
-    return Image.new("RGB", (width, height), (0, 0, 0))
-
-
-def shutdown_handler(_signum, _frame):
-    print("shutdown_handler...")
-    # Use display dimensions directly since width/height may not be in scope
-    if disp.rotation % 180 == 90:
-        h = disp.width
-        w = disp.height
-    else:
-        w = disp.width
-        h = disp.height
-    blank_image_final = create_blank_image(w, h)
-    send_image_to_display(blank_image_final)
-    print("blank image sent...")
-    sys.exit(0)
-
-
-signal.signal(signal.SIGTERM, shutdown_handler)
-
-ip_stat = StatRow(
-    icon="\uf109",  # Network icon
-    label="",
-    color="lightblue",
-    get_stat=SystemStats.get_ip_address,
-    state_string=lambda stat: stat,
-    is_warning=lambda stat: False,
-    is_critical=lambda stat: False,
-    get_percentage=None,  # IP address has no percentage
-    visual_label=lambda stat: stat  # Same as text mode
-)
-
-cpu_stat = StatRow(
-    icon="\uf4bc",  # CPU icon
-    label="",
-    color="yellow",
-    get_stat=SystemStats.get_cpu_stats,
-    state_string=lambda stat: f"{stat:.2f}%",
-    is_warning=lambda stat: stat >= 70,
-    is_critical=lambda stat: stat >= 90,
-    get_percentage=lambda stat: stat,  # CPU returns percentage directly
-    visual_label=lambda stat: f"{stat:.1f}%")
-
-mem_stat = StatRow(
-    icon="\uefc5",  # Memory icon
-    label="",
-    color="lightgreen",
-    get_stat=SystemStats.get_memory_stats,
-    state_string=lambda memory:
-    f"{naturalsize(memory.used, False, True)}/{naturalsize(memory.total, False, True)} ({memory.percent:.0f}%)",
-    is_warning=lambda memory: memory.percent >= 70,
-    is_critical=lambda memory: memory.percent >= 85,
-    get_percentage=lambda memory: memory.percent,
-    visual_label=lambda memory:
-    f"{naturalsize(memory.total, False, True)} ({memory.percent:.0f}%)")
-
-disk_stat = StatRow(
-    icon="\uf472",  # Disk icon
-    label="",
-    color="lightcyan",
-    get_stat=SystemStats.get_disk_stats,
-    state_string=lambda disk:
-    f"{naturalsize(disk.used, False, True)}/{naturalsize(disk.total, False, True)} ({(disk.used / disk.total) * 100:.0f}%)",
-    is_warning=lambda disk: ((disk.used / disk.total) * 100) >= 80,
-    is_critical=lambda disk: ((disk.used / disk.total) * 100) >= 90,
-    get_percentage=lambda disk: (disk.used / disk.total) * 100,
-    visual_label=lambda disk:
-    f"{naturalsize(disk.total, False, True)} ({(disk.used / disk.total) * 100:.0f}%)"
-)
-
-temp_stat = StatRow(
-    icon="\uf2c9",  # Temperature icon
-    label="",
-    color="cyan",
-    get_stat=SystemStats.get_temperature_stats,
-    state_string=lambda cpu_temp: f"{cpu_temp:.1f}°C",
-    is_warning=lambda cpu_temp: cpu_temp >= 60,
-    is_critical=lambda cpu_temp: cpu_temp >= 70,
-    get_percentage=lambda cpu_temp:
-    cpu_temp,  # Use temperature as percentage (0-100°C range)
-    visual_label=lambda cpu_temp: f"{cpu_temp:.1f}°C")
-
-# Create blank image for drawing.
-# Make sure to create image with mode 'RGB' for full color.
-if disp.rotation % 180 == 90:
-    height = disp.width  # we swap height/width to rotate it to landscape!
-    width = disp.height
-else:
-    width = disp.width  # we swap height/width to rotate it to landscape!
-    height = disp.height
-
-title_text = "═ SYSTEM MONITOR ═"
-stats = [ip_stat, cpu_stat, mem_stat, disk_stat, temp_stat]
-
-print(
-    f"Display initialized: {disp.width}x{disp.height}, rotation: {disp.rotation}"
-)
-print(f"Display mode: {DISPLAY_MODE}, Layout: {DISPLAY_LAYOUT}")
-# Initialize display with blank screen
-blank_image = create_blank_image(width, height)
-send_image_to_display(blank_image)
-
-try:
-    while True:
-
-        def update_stats():
-            # Send image to display
-            try:
-                # Choose rendering mode based on configuration
-                if DISPLAY_MODE == 'visual':
-                    # Collect stats data for visual mode (with progress bars)
-                    stats_data = [stat.get_visual_data() for stat in stats]
-
-                    # Choose layout: grid or rows
-                    if DISPLAY_LAYOUT == 'grid':
-                        pil_image = render_stats_grid(width, height, title_text,
-                                                      stats_data, title_font,
-                                                      stats_font, icon_font,
-                                                      STATS_FONT_SIZE,
-                                                      TITLE_FONT_SIZE)
-                    else:
-                        pil_image = render_stats_visual(width, height,
-                                                        title_text, stats_data,
-                                                        title_font, stats_font,
-                                                        icon_font,
-                                                        STATS_FONT_SIZE,
-                                                        TITLE_FONT_SIZE)
-                else:
-                    # Collect stats data for text mode (default)
-                    stats_data = [stat.update_compose() for stat in stats]
-                    # Render with text mode (rows layout only)
-                    pil_image = render_stats_direct(width, height, title_text,
-                                                    stats_data, title_font,
-                                                    stats_font, icon_font,
-                                                    STATS_FONT_SIZE,
-                                                    TITLE_FONT_SIZE)
-
-                pil_image.save("screenshot.png")
-                # Send directly to SPI display
-                send_image_to_display(pil_image)
-
-            except Exception as e:
-                print(f"Error rendering or sending image to display: {e}")
-                traceback.print_exc()
-
-        # print("************Timestamp 1:", time.time())
-        # Process forking used as safety measure for memory management
-        # Can be removed if direct PIL rendering proves stable
-        proc = mp.Process(target=update_stats)
-        proc.start()
-        proc.join()
-
-        time.sleep(1)
-except KeyboardInterrupt:
-    shutdown_handler(0, 0)
+
+    def render_panels(self, panel_data):
+        """Render and send a frame to each of the (panel, data) pairs"""
+        metrics = self.metrics
+        transfers = []
+        for panel, data in panel_data:
+            with metrics.time("frame", "stage", "render"):
+                pil_image = panel.render(TITLE_TEXT, data)
+            buffers, boxes = panel.sender.prepare(pil_image)
+            # Saved in the background, only when a screenshot is due
+            panel.screenshots.submit(pil_image, changed=bool(boxes))
+            if panel.shared_frame is not None:
+                panel.shared_frame.publish(pil_image)
+            if self.transfer_pool is None:
+                panel.sender.transmit(buffers, boxes)
+            else:
+                # The SPI write runs while the next panel is rendered
+                transfers.append(
+                    self.transfer_pool.submit(panel.sender.transmit,
+                                              buffers, boxes))
+        wait(transfers)
+        for transfer in transfers:
+            transfer.result()
+
+    def render_subframe(self, stats_data):
+        """Repaint and send only the moving bars of the animated panels"""
+        for panel in self.panels:
+            if panel.animated:
+                pil_image, regions = panel.render_subframe(TITLE_TEXT,
+                                                           stats_data)
+                panel.sender.transmit(
+                    *panel.sender.prepare(pil_image, regions=regions))
+                if panel.shared_frame is not None:
+                    panel.shared_frame.publish(pil_image)
+
+    def animate(self, deadline):
+        """Draw the pending bar transition before the next tick"""
+        animator = self.animator
+        target = animator.end
+        try:
+            animator.run(
+                deadline, self.render_subframe,
+                lambda: self.render_panels([(panel, target)
+                                            for panel in self.panels
+                                            if panel.animated]))
+        except Exception as e:
+            print(f"Error animating the display: {e}")
+            traceback.print_exc()
+
+    def print_refresh_stats(self):
+        """Log how many bytes the partial updates sent versus full frames"""
+        for panel in self.panels:
+            refresh = panel.sender.refresh_stats()
+            print(f"SPI refresh {panel.name}: {refresh['bytes_sent']} bytes in "
+                  f"{refresh['frames']} frames "
+                  f"({refresh['ratio'] * 100:.1f}% of full-frame updates)")
+            if DISPLAY_BACKEND == 'virtual':
+                virtual = panel.disp.stats()
+                print(f"Virtual display {panel.name}: "
+                      f"{virtual['total_bytes']} bytes, "
+                      f"{virtual['total_transfer_time'] * 1000:.1f} ms "
+                      f"simulated transfer at {BAUDRATE} Hz")
+
+    def register_process_gauges(self):
+        """Expose the render worker's own resource usage"""
+        metrics = self.metrics
+        metrics.gauge("process_cpu_seconds",
+                      "CPU time used by the render worker", time.process_time)
+        metrics.gauge("process_resident_memory_bytes",
+                      "Resident set size of the render worker", current_rss)
+        metrics.gauge("process_threads", "Threads in the render worker",
+                      threading.active_count)
+        metrics.gauge("stat_age_seconds",
+                      "Seconds since each metric was collected",
+                      self.collector.ages, label="metric")
+        metrics.gauge("frame_interval_seconds",
+                      "Current interval between ticks",
+                      lambda: self.scheduler.current_interval)
+        if self.governor is not None:
+            metrics.gauge("cpu_budget",
+                          "Share of a core the render worker may use, "
+                          "lowered while the board is hot",
+                          self.governor.effective_budget)
+            metrics.gauge("cpu_usage",
+                          "Share of a core the render worker used over the "
+                          "last budget window", lambda: self.governor.usage)
+            metrics.gauge("cpu_slowdown",
+                          "Factor the CPU budget stretches the tick and "
+                          "collection intervals by",
+                          lambda: self.governor.slowdown)
+        if self.animator is not None:
+            metrics.gauge("animation_fps",
+                          "Animation sub-frame rate the CPU budget allows",
+                          self.animator.fps)
+
+    def render_worker(self, max_frames, max_rss):
+        """Long-lived render loop, returns once a recycle limit is reached"""
+        metrics = self.metrics
+        scheduler = self.scheduler
+        # The supervisor blanks the display on shutdown, the worker only stops
+        signal.signal(signal.SIGTERM, lambda _signum, _frame: sys.exit(0))
+        # The panels may still show the previous worker's last frame
+        for panel in self.panels:
+            panel.sender.invalidate()
+            if panel.shared_frame is not None:
+                panel.shared_frame.recover()
+        if len(self.panels) > 1:
+            # One thread as the panels share the bus, it overlaps rendering
+            self.transfer_pool = ThreadPoolExecutor(max_workers=1,
+                                                    thread_name_prefix="spi")
+        # The netlink thread starts with the first IP lookup in this process
+        from system_stats import SystemStats
+
+        SystemStats.watch_ip_address()
+        self.collector.start()
+        if self.aggregator is not None:
+            self.aggregator.start()
+        if self.agent is not None:
+            # On its own timer, idle or slowed down ticks would let the
+            # aggregator mark this node stale
+            self.agent.start(lambda: node_values(self.collector.store.get),
+                             CLUSTER_INTERVAL, metrics)
+        # Served from the worker, which is where the timings are recorded
+        self.exporter.start()
+        # Export the counters before the first overrun or skip happens
+        metrics.inc("frame_overruns", 0)
+        metrics.inc("frames_skipped", 0)
+        metrics.inc("frame_errors", 0)
+        if self.animator is not None:
+            for counter in ("animation_frames", "animation_frames_dropped",
+                            "animation_fallbacks"):
+                metrics.inc(counter, 0)
+        scheduler.invalidate()
+        frames = 0
+        try:
+            while True:
+                started = time.perf_counter()
+                rendered = self.update_stats()
+                elapsed = time.perf_counter() - started
+                if rendered:
+                    metrics.observe("frame", "stage", "total", elapsed)
+                    metrics.inc("frames")
+                    frames += 1
+                elif rendered is not None:
+                    metrics.inc("frames_skipped")
+                if frames == 1 and self.startup is not None:
+                    self.startup.mark("first frame")
+                    print(self.startup.report("first frame"))
+                    self.startup = None
+                if elapsed > scheduler.current_interval:
+                    metrics.inc("frame_overruns")
+                if max_frames and frames >= max_frames:
+                    print(f"Render worker recycling after {frames} frames")
+                    self.print_refresh_stats()
+                    return
+                rss = current_rss()
+                if max_rss and rss >= max_rss:
+                    print(f"Render worker recycling after {frames} frames, "
+                          f"RSS {rss // (1024 * 1024)}MB")
+                    self.print_refresh_stats()
+                    return
+                alert = any(stat.is_alert() for stat in self.stats)
+                slowdown = 1.0
+                if self.governor is not None:
+                    self.governor.update(hot=any(
+                        stat.is_alert() for stat in self.thermal_stats))
+                    slowdown = scheduler.slowdown = self.governor.slowdown
+                # Collect faster too, or the faster ticks would show stale
+                # values
+                self.collector.set_interval_scale(
+                    (min(1.0, FRAME_ALERT_INTERVAL / FRAME_INTERVAL) if alert
+                     else 1.0) * slowdown)
+                if self.animator is not None and self.animator.pending:
+                    self.animate(time.monotonic() + scheduler.delay(alert))
+                scheduler.wait(alert)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.exporter.stop()
+            self.collector.stop()
+            if self.aggregator is not None:
+                self.aggregator.stop()
+            if self.agent is not None:
+                self.agent.stop()
+            if self.transfer_pool is not None:
+                self.transfer_pool.shutdown(wait=True)
+
+    def preview_worker(self):
+        """Serve the preview until terminated"""
+        signal.signal(signal.SIGTERM, lambda _signum, _frame: sys.exit(0))
+        self.preview.start()
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.preview.stop()
+
+    def run(self):
+        """Supervise the render worker until shutdown"""
+        # Rendering runs in a long-lived forked worker which inherits the
+        # display. Recycling it after a frame count or RSS ceiling is kept as
+        # a safety measure for memory management, without paying a fork per
+        # frame.
+        import multiprocessing as mp
+
+        mp_context = mp.get_context("fork")
+        signal.signal(signal.SIGTERM, self.shutdown_handler)
+        try:
+            while True:
+                if self.preview is not None and (
+                        self.preview_process is None or
+                        not self.preview_process.is_alive()):
+                    # Forked while the supervisor has no other threads
+                    self.preview_process = mp_context.Process(
+                        target=self.preview_worker, daemon=True)
+                    self.preview_process.start()
+                self.worker = mp_context.Process(
+                    target=self.render_worker,
+                    args=(WORKER_MAX_FRAMES, WORKER_MAX_RSS_MB * 1024 * 1024))
+                self.worker.start()
+                # Only the first worker's frame ends the cold start
+                self.startup = None
+                self.worker.join()
+                if self.worker.exitcode != 0:
+                    print(f"Render worker exited with code "
+                          f"{self.worker.exitcode}, restarting")
+                    time.sleep(1)
+        except KeyboardInterrupt:
+            self.shutdown_handler(0, 0)
+
+
+def main():
+    startup = _startup
+    startup.mark("imports")
+    metrics = create_metrics()
+
+    # The display init mostly waits on the panel's reset and wake-up delays,
+    # the first stats collection and the fonts are done in the meantime. The
+    # thread is joined before the render worker is forked.
+    with ThreadPoolExecutor(max_workers=1,
+                            thread_name_prefix="display-init") as executor:
+        displays = executor.submit(create_displays)
+
+        collector = Collector(COLLECTOR_THREADS, metrics=metrics)
+        stats = create_stats(collector)
+        collector.collect_all()
+        startup.mark("collect")
+
+        load_panel_fonts()
+        startup.mark("fonts")
+
+        displays, backlight = displays.result()
+        startup.mark("display")
+
+    panels = [create_panel(index, config, disp, metrics)
+              for index, (config, disp) in enumerate(zip(PANELS, displays))]
+    for panel in panels:
+        print(f"Display {panel.name} initialized: "
+              f"{panel.disp.width}x{panel.disp.height}, "
+              f"rotation: {panel.disp.rotation}")
+        print(f"Display mode: {panel.mode}, Layout: {panel.layout}")
+
+    monitor = Monitor(panels, backlight, collector, stats, metrics, startup)
+    startup.mark("setup")
+    monitor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,74 @@
 import os
-import socket
 import psutil
 
+from ip_watcher import AddressWatcher
+from procfs import (CoreSampler, CpuSampler, FastStats, disk_io_rates,
+                    network_rates)
+
 # Environment configuration
 psutil.PROCFS_PATH = os.getenv("PROCFS_PATH", psutil.PROCFS_PATH)
 DISK_ROOT = os.getenv("DISK_ROOT", "/")
+# EWMA weight given to the previous CPU reading (0 disables smoothing)
+CPU_SMOOTHING = float(os.getenv("CPU_SMOOTHING", "0"))
+
+# IP address display: interface (empty follows the default route),
+# families ('ipv4', 'ipv6' or 'all') and how many addresses to show
+IP_INTERFACE = os.getenv("IP_INTERFACE", "")
+IP_FAMILIES = os.getenv("IP_FAMILIES", "ipv4").lower()
+IP_MAX_ADDRESSES = int(os.getenv("IP_MAX_ADDRESSES", "1"))
+
+# Throughput rows: interfaces and disks counted (comma separated, empty for
+# the physical ones) and the EWMA weight given to the previous rate
+NET_INTERFACES = os.getenv("NET_INTERFACES", "")
+IO_DEVICES = os.getenv("IO_DEVICES", "")
+RATE_SMOOTHING = float(os.getenv("RATE_SMOOTHING", "0.5"))
+
+# Read /proc/stat, /proc/meminfo and the temperature sensor through files
+# kept open instead of psutil
+FAST_COLLECTOR = os.getenv("FAST_COLLECTOR", "false").lower() in ("1", "true",
+                                                                  "yes")
+
+cpu_sampler = CpuSampler(psutil.PROCFS_PATH, CPU_SMOOTHING,
+                         keep_open=FAST_COLLECTOR)
+core_sampler = CoreSampler(psutil.PROCFS_PATH, keep_open=FAST_COLLECTOR)
+fast_stats = FastStats(psutil.PROCFS_PATH) if FAST_COLLECTOR else None
+network = network_rates(psutil.PROCFS_PATH, interfaces=NET_INTERFACES,
+                        smoothing=RATE_SMOOTHING, keep_open=FAST_COLLECTOR)
+disk_io = disk_io_rates(psutil.PROCFS_PATH, disks=IO_DEVICES,
+                        smoothing=RATE_SMOOTHING, keep_open=FAST_COLLECTOR)
+ip_watcher = AddressWatcher(psutil.PROCFS_PATH, IP_INTERFACE, IP_FAMILIES,
+                            IP_MAX_ADDRESSES)
 
 
 class SystemStats:
     """Static class for collecting system statistics"""
 
+    @staticmethod
+    def watch_ip_address():
+        """Follow address changes through netlink from the next lookup on, in
+        the process which keeps reading them"""
+        ip_watcher.watch = True
+
     @staticmethod
     def get_ip_address():
         """Get the current IP address"""
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip_addr = s.getsockname()[0]
-            s.close()
-            return ip_addr
-        except psutil.Error:
-            return "N/A"
+        return ip_watcher.current()
 
     @staticmethod
     def get_cpu_stats():
-        """Get CPU load average"""
-        return psutil.cpu_percent(0.1)
+        """Get CPU usage since the previous call"""
+        return cpu_sampler.sample()
+
+    @staticmethod
+    def get_cpu_core_stats():
+        """Get the usage of every CPU core since the previous call"""
+        return core_sampler.sample()
 
     @staticmethod
     def get_memory_stats():
         """Get memory usage statistics"""
+        if fast_stats is not None:
+            return fast_stats.memory()
         return psutil.virtual_memory()
 
     @staticmethod
@@ -37,9 +76,21 @@ class SystemStats:
         """Get disk usage statistics"""
         return psutil.disk_usage(DISK_ROOT)
 
+    @staticmethod
+    def get_network_stats():
+        """Get network throughput since the previous call"""
+        return network.sample()
+
+    @staticmethod
+    def get_disk_io_stats():
+        """Get disk throughput since the previous call"""
+        return disk_io.sample()
+
     @staticmethod
     def get_temperature_stats():
         """Get CPU temperature"""
+        if fast_stats is not None:
+            return fast_stats.temperature()
         cpu_temp = 0
         try:
             temps = psutil.sensors_temperatures()
@@ -52,5 +103,5 @@ class SystemStats:
                 with open("/sys/class/thermal/thermal_zone0/temp", "r") as f:
                     cpu_temp = int(f.read().strip()) / 1000
             return cpu_temp
-        except psutil.Error:
+        except (psutil.Error, OSError):
             return 0
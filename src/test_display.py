@@ -11,6 +11,7 @@ import board
 import digitalio
 from PIL import Image, ImageDraw, ImageFont
 from adafruit_rgb_display import st7789
+from display_backend import board_pin
 from display_config import (CS_PIN, DC_PIN, RESET_PIN, BAUDRATE, DISPLAY_CONFIG)
 
 
@@ -26,9 +27,9 @@ def main():
 
         # Create display
         disp = st7789.ST7789(spi,
-                             cs=CS_PIN,
-                             dc=DC_PIN,
-                             rst=RESET_PIN,
+                             cs=board_pin(CS_PIN),
+                             dc=board_pin(DC_PIN),
+                             rst=board_pin(RESET_PIN),
                              baudrate=BAUDRATE,
                              **DISPLAY_CONFIG)
 
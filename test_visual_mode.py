@@ -4,15 +4,18 @@ Test script to generate text, visual, and grid mode screenshots
 for comparison without requiring actual hardware.
 Uses shared rendering module from src/rendering.py.
 """
-from src.rendering import (load_fonts, render_stats_direct, render_stats_visual,
-                       render_stats_grid)
-from humanize import naturalsize
 import sys
 from collections import namedtuple
 
-# Add src to path for imports
+# Add src to path for imports, rendering imports its sibling modules
 sys.path.insert(0, './src')
 
+import numpy as np  # noqa: E402
+from humanize import naturalsize  # noqa: E402
+from rendering import (load_fonts, render_stats_direct,  # noqa: E402
+                       render_stats_visual, render_stats_grid,
+                       render_stats_history)
+
 # Constants
 TITLE_FONT_SIZE = 20
 STATS_FONT_SIZE = 18
@@ -148,7 +151,24 @@ grid_image = render_stats_grid(width, height, title, visual_mode_data,
 grid_image.save("screenshot_grid_mode.png")
 print("Saved: screenshot_grid_mode.png")
 
+print("Generating history mode screenshot...")
+# Two minutes of made up history, (min, mean, max) per point
+history_mode_data = []
+for stat_data in visual_mode_data:
+    stat_data = dict(stat_data)
+    if stat_data['has_bar']:
+        wave = np.sin(np.linspace(0, 6, 120) + stat_data['percentage'])
+        mean = np.clip(stat_data['percentage'] + wave * 15, 0, 100)
+        stat_data['history'] = np.stack((mean - 5, mean, mean + 5))
+    history_mode_data.append(stat_data)
+history_image = render_stats_history(width, height, title, history_mode_data,
+                                     title_font, stats_font, icon_font,
+                                     STATS_FONT_SIZE, TITLE_FONT_SIZE)
+history_image.save("screenshot_history_mode.png")
+print("Saved: screenshot_history_mode.png")
+
 print("\nTest complete! Check the generated images:")
 print("  - screenshot_text_mode.png (text mode)")
 print("  - screenshot_visual_mode.png (visual mode - rows layout)")
 print("  - screenshot_grid_mode.png (visual mode - grid layout)")
+print("  - screenshot_history_mode.png (history mode - sparklines)")
@@ -0,0 +1,52 @@
+"""
+Shared fixtures. The timing code under test reads the clock through its
+module's `time` name, which the clock fixture swaps for a fake one that only
+moves when a test advances it.
+"""
+import pytest
+
+import animation
+import governor
+import procfs
+import scheduler
+import shared_frame
+
+
+class FakeClock:
+    """Stands in for the time module: monotonic, wall and CPU time"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.wall = 1_700_000_000.0
+        self.cpu = 0.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.wall
+
+    def process_time(self):
+        return self.cpu
+
+    def thread_time(self):
+        return self.cpu
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.advance(seconds)
+
+    def advance(self, seconds, cpu=0.0):
+        """Let seconds pass, cpu of them spent on the CPU"""
+        self.now += seconds
+        self.wall += seconds
+        self.cpu += cpu
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    for module in (animation, governor, procfs, scheduler, shared_frame):
+        monkeypatch.setattr(module, "time", fake)
+    return fake
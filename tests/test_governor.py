@@ -0,0 +1,89 @@
+import pytest
+
+from animation import Animator
+from governor import ANIMATION_HOLD, WINDOW, CpuGovernor
+
+
+def spend(clock, gov, usage, seconds=WINDOW, hot=False):
+    """Run a window at usage share of a core and let the governor adapt"""
+    clock.advance(seconds, cpu=usage * seconds)
+    gov.update(hot=hot)
+
+
+@pytest.fixture
+def animator(clock):
+    return Animator(fps=30, duration=0.5, budget=0.25, min_fps=5)
+
+
+def test_waits_for_a_full_window(clock):
+    gov = CpuGovernor(budget=0.02)
+    gov.update()
+    spend(clock, gov, 0.5, seconds=WINDOW / 2)
+    assert gov.usage == 0.0
+    assert gov.slowdown == 1.0
+    spend(clock, gov, 0.5, seconds=WINDOW / 2)
+    assert gov.usage == pytest.approx(0.5)
+    assert gov.slowdown == 8.0
+
+
+def test_suspends_the_animation_then_slows_down_then_recovers(clock,
+                                                              animator):
+    gov = CpuGovernor(budget=0.02, max_slowdown=8.0, animator=animator)
+    gov.update()
+
+    # Over budget, the animation goes first
+    spend(clock, gov, 0.05)
+    assert animator.fps() == 0.0
+    assert gov.slowdown == 1.0
+    assert gov.animation_hold == ANIMATION_HOLD * 2
+
+    # Still over budget, the intervals stretch in proportion
+    spend(clock, gov, 0.03)
+    assert gov.slowdown == pytest.approx(1.5)
+    spend(clock, gov, 0.1)
+    assert gov.slowdown == pytest.approx(7.5)
+    spend(clock, gov, 0.1)
+    assert gov.slowdown == 8.0
+
+    # Well under budget they shrink back, aiming at 80% of it
+    spend(clock, gov, 0.005)
+    assert gov.slowdown == pytest.approx(2.5)
+    # The animation stays off while the intervals are stretched, even
+    # after its hold ran out
+    spend(clock, gov, 0.015, seconds=ANIMATION_HOLD)
+    assert gov.slowdown == pytest.approx(2.5)
+    assert animator.fps() == 0.0
+    assert animator.begin([]) == []
+    assert not animator.pending
+
+    # Back at full speed, so is the animation
+    spend(clock, gov, 0.001)
+    assert gov.slowdown == 1.0
+    assert animator.fps() > 0
+    # and goes for longer if it has to go again
+    spend(clock, gov, 0.05)
+    assert animator.fps() == 0.0
+    assert gov.animation_hold == ANIMATION_HOLD * 4
+
+
+def test_in_budget_changes_nothing(clock, animator):
+    gov = CpuGovernor(budget=0.02, animator=animator)
+    gov.update()
+    spend(clock, gov, 0.015)
+    assert gov.slowdown == 1.0
+    assert animator.fps() > 0
+
+
+def test_heat_lowers_the_budget_at_once(clock):
+    gov = CpuGovernor(budget=0.02, thermal_factor=0.5)
+    gov.update()
+    # Within budget until the board heats up, which doesn't wait for the
+    # end of the window
+    spend(clock, gov, 0.015, seconds=2, hot=True)
+    assert gov.hot
+    assert gov.effective_budget() == 0.01
+    assert gov.slowdown == pytest.approx(1.5)
+
+    spend(clock, gov, 0.001, seconds=1, hot=False)
+    assert gov.effective_budget() == 0.02
+    assert gov.slowdown == 1.0
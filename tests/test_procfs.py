@@ -0,0 +1,48 @@
+import pytest
+
+from procfs import (SECTOR_SIZE, CounterRates, DeviceRates, DiskRates,
+                    parse_diskstats)
+
+
+def test_rates_of_counter_deltas():
+    rates = CounterRates()
+    assert rates.update({"eth0": (1000, 0)}, now=10.0) == {"eth0": (0.0, 0.0)}
+    assert rates.update({"eth0": (3000, 500)}, now=12.0) == {
+        "eth0": (1000.0, 250.0)}
+
+
+def test_32_bit_counter_wraps():
+    rates = CounterRates()
+    rates.update({"eth0": ((1 << 32) - 1000,)}, now=10.0)
+    assert rates.update({"eth0": (1000,)}, now=11.0) == {"eth0": (2000.0,)}
+
+
+@pytest.mark.parametrize("last", [1000, 5_000_000_000])
+def test_reset_counter_reads_zero(last):
+    # A re-created device starts over, from below or above 4 GiB
+    rates = CounterRates()
+    rates.update({"tun0": (last,)}, now=10.0)
+    assert rates.update({"tun0": (500,)}, now=11.0) == {"tun0": (0.0,)}
+    assert rates.update({"tun0": (1500,)}, now=12.0) == {"tun0": (1000.0,)}
+
+
+def diskstats(read, written):
+    """A disk and its partition, with their sectors read and written"""
+    return "".join(f"8 {minor} {name} 10 0 {read} 0 20 0 {written} 0 0\n"
+                   for minor, name in enumerate(("sda", "sda1"))).encode()
+
+
+def test_sectors_wrap_before_they_are_scaled(tmp_path, clock):
+    stats = tmp_path / "diskstats"
+    disks = DeviceRates(str(stats), parse_diskstats,
+                        lambda name: name == "sda", DiskRates,
+                        unit=SECTOR_SIZE)
+    stats.write_bytes(diskstats((1 << 32) - 100, 0))
+    disks.sample()
+    # The raw sector counter of a 32-bit kernel wraps
+    stats.write_bytes(diskstats(100, 8))
+    clock.advance(2)
+    rates = disks.sample()
+    assert rates.read == 100 * SECTOR_SIZE
+    assert rates.write == 4 * SECTOR_SIZE
+    assert rates.total == rates.read + rates.write
@@ -0,0 +1,80 @@
+from scheduler import FrameScheduler, snapshot_signature
+
+
+def make_scheduler():
+    return FrameScheduler(interval=1.0, idle_interval=5.0, idle_after=3,
+                          alert_interval=0.5, force_interval=60.0)
+
+
+def test_signature_rounds_floats_to_what_is_drawn():
+    assert (snapshot_signature({'cpu': 12.34, 'rows': [{'a': 1.06}]}) ==
+            snapshot_signature({'cpu': 12.31, 'rows': [{'a': 1.11}]}))
+    assert snapshot_signature({'cpu': 12.3}) != snapshot_signature(
+        {'cpu': 12.4})
+
+
+def test_renders_only_changed_snapshots(clock):
+    frames = make_scheduler()
+    assert frames.should_render("a")
+    assert not frames.should_render("a")
+    assert frames.skipped == 1
+    assert frames.should_render("b")
+    assert frames.unchanged == 0
+
+
+def test_backs_off_when_idle_and_resumes_on_change(clock):
+    frames = make_scheduler()
+    frames.should_render("a")
+    for _ in range(2):
+        frames.should_render("a")
+        assert frames.next_interval(alert=False) == 1.0
+    frames.should_render("a")
+    assert frames.next_interval(alert=False) == 5.0
+    frames.should_render("b")
+    assert frames.next_interval(alert=False) == 1.0
+
+
+def test_alert_overrides_idle(clock):
+    frames = make_scheduler()
+    frames.should_render("a")
+    for _ in range(5):
+        frames.should_render("a")
+    assert frames.next_interval(alert=True) == 0.5
+    assert frames.current_interval == 0.5
+
+
+def test_forces_a_redraw_of_an_old_frame(clock):
+    frames = make_scheduler()
+    assert frames.should_render("a")
+    clock.advance(59.9)
+    assert not frames.should_render("a")
+    clock.advance(0.1)
+    assert frames.should_render("a")
+    # The forced frame restarts the count
+    clock.advance(30)
+    assert not frames.should_render("a")
+
+
+def test_invalidate_renders_the_next_tick(clock):
+    frames = make_scheduler()
+    frames.should_render("a")
+    frames.invalidate()
+    assert frames.should_render("a")
+
+
+def test_slowdown_stretches_every_interval(clock):
+    frames = make_scheduler()
+    frames.slowdown = 4.0
+    frames.should_render("a")
+    assert frames.next_interval(alert=False) == 4.0
+    assert frames.next_interval(alert=True) == 2.0
+
+
+def test_waits_until_the_next_wall_clock_boundary(clock):
+    frames = make_scheduler()
+    clock.wall = 100.25
+    frames.wait(alert=False)
+    assert clock.slept == [0.75]
+    assert clock.wall == 101.0
+    frames.wait(alert=True)
+    assert clock.wall == 101.5
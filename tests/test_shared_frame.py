@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from shared_frame import (HEADER_SIZE, SEQUENCE_OFFSET, SharedFrame,
+                          _SEQUENCE)
+
+
+@pytest.fixture
+def frame(tmp_path):
+    shared = SharedFrame(str(tmp_path / "panel.frame"), 4, 3)
+    yield shared
+    shared.close()
+
+
+def solid(color):
+    return Image.new("RGB", (4, 3), color)
+
+
+def test_publish_and_read_from_another_mapping(frame):
+    reader = SharedFrame.open(frame.path)
+    assert reader.read()[0] == 0
+    frame.publish(solid((1, 2, 3)))
+    sequence, timestamp, pixels = reader.read()
+    assert sequence == 2
+    assert timestamp > 0
+    assert pixels.shape == (3, 4, 3)
+    assert (pixels == (1, 2, 3)).all()
+    frame.publish(solid((4, 5, 6)).convert("RGBA"))
+    assert reader.read()[0] == 4
+    assert (reader.read()[2] == (4, 5, 6)).all()
+    reader.close()
+
+
+def test_read_returns_a_copy(frame):
+    frame.publish(solid((1, 1, 1)))
+    _, _, pixels = frame.read()
+    frame.publish(solid((2, 2, 2)))
+    assert (pixels == 1).all()
+
+
+def test_open_rejects_other_files(tmp_path):
+    path = tmp_path / "other.frame"
+    path.write_bytes(b"\0" * (HEADER_SIZE + 36))
+    with pytest.raises(ValueError):
+        SharedFrame.open(str(path))
+
+
+class TornPixels:
+    """Pixels whose first copy races with a new frame being published"""
+
+    def __init__(self, frame, writer):
+        self.frame = frame
+        self.writer = writer
+        self.copies = 0
+
+    def copy(self):
+        self.copies += 1
+        if self.copies == 1:
+            self.writer.publish(solid((9, 9, 9)))
+        return np.asarray(self.frame.copy())
+
+
+def test_read_retries_a_frame_written_meanwhile(frame):
+    frame.publish(solid((1, 1, 1)))
+    reader = SharedFrame.open(frame.path)
+    torn = reader.pixels = TornPixels(reader.pixels, frame)
+    sequence, _, copied = reader.read()
+    assert torn.copies == 2
+    assert sequence == 4
+    assert (copied == 9).all()
+
+
+def test_half_written_frame_times_out_until_recovered(frame, clock):
+    frame.publish(solid((1, 1, 1)))
+    # A writer killed between the two sequence updates
+    _SEQUENCE.pack_into(frame._map, SEQUENCE_OFFSET, 3)
+    with pytest.raises(TimeoutError):
+        frame.read(timeout=0.5)
+    # Backed off with real sleeps rather than spinning
+    assert len(clock.slept) < 200
+    assert max(clock.slept) > 0.001
+
+    frame.recover()
+    assert frame.read()[0] == 4
+    frame.recover()
+    assert frame.sequence == 4
+    frame.publish(solid((2, 2, 2)))
+    assert frame.sequence == 6
+
+
+def test_wait_for_a_newer_frame(frame, clock):
+    assert not frame.wait(0, timeout=1.0)
+    assert clock.now == pytest.approx(1001.0)
+    frame.publish(solid((1, 1, 1)))
+    assert frame.wait(0, timeout=1.0)
+    assert not frame.wait(frame.sequence, timeout=0.1)
+
+
+def test_anonymous_frame(clock):
+    frame = SharedFrame(None, 4, 3)
+    frame.publish(solid((7, 7, 7)))
+    assert (frame.read()[2] == 7).all()
+    frame.close()